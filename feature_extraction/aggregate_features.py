@@ -1,53 +1,169 @@
 import pandas as pd
 import numpy as np
 from utils import load_raw_data
-from constants import FID
+from constants import FID, APPROXIMATED
 from single_column_features import all_single_features_list
 from pairwise_column_features import all_pairwise_features_list
 import argparse
-
-def mad_median(s):
-    median = s.median()
-    if median == np.nan:
-        return None
-    return (s-median).mean()
-
-def coeff_var(s):
-    mean = s.mean()
-    var = s.var()
-    if mean == np.nan or var == np.nan or not var:
-        return None
-    return mean / var
+from functools import cached_property
+from checkpoint import Checkpoint, prepare_output
+from async_writer import AsyncWriter
+from sharding import open_shard, parse_shard
+
+
+class GroupedFeatures:
+    # Reductions of the feature columns over groups of consecutive rows (i.e. the columns of a
+    # table), each reduction is computed once for all the features and only when an aggregation
+    # function needs it. Missing values are skipped like in the pandas reductions.
+
+    def __init__(self, features, starts):
+        self.columns = features.columns
+        self.values = features.to_numpy(dtype=float)
+        self.starts = starts
+        self.sizes = np.diff(np.append(starts, len(self.values)))
+
+    def _reduce(self, ufunc, values):
+        return pd.DataFrame(ufunc.reduceat(values, self.starts, axis=0), columns=self.columns)
+
+    def _expand(self, df):
+        # Repeats the value of each group for every row of the group
+        return np.repeat(df.to_numpy(), self.sizes, axis=0)
+
+    def _mean(self, values):
+        missing = np.isnan(values)
+        with np.errstate(all='ignore'):
+            return self._reduce(np.add, np.where(missing, 0, values)) / self._reduce(np.add, ~missing)
+
+    @cached_property
+    def size(self):
+        return pd.Series(self.sizes)
+
+    @cached_property
+    def count(self):
+        return self._reduce(np.add, ~np.isnan(self.values))
+
+    @cached_property
+    def sum(self):
+        return self._reduce(np.add, np.where(np.isnan(self.values), 0, self.values))
+
+    @cached_property
+    def mean(self):
+        return self._mean(self.values)
+
+    @cached_property
+    def var(self):
+        # Two pass variance with one degree of freedom like pd.Series.var
+        with np.errstate(all='ignore'):
+            deviation = np.where(np.isnan(self.values), 0, self.values - self._expand(self.mean))
+            squares = self._reduce(np.add, deviation * deviation)
+            return (squares / (self.count - 1)).where(self.count > 1)
+
+    @cached_property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @cached_property
+    def min(self):
+        return self._reduce(np.fmin, self.values)
+
+    @cached_property
+    def max(self):
+        return self._reduce(np.fmax, self.values)
+
+    @cached_property
+    def median(self):
+        groups = np.repeat(np.arange(len(self.starts)), self.sizes)
+        return pd.DataFrame(self.values, columns=self.columns).groupby(groups).median()
+
+    @cached_property
+    def mad_mean(self):
+        with np.errstate(all='ignore'):
+            return self._mean(np.absolute(self.values - self._expand(self.mean)))
+
+    @cached_property
+    def mad_median(self):
+        with np.errstate(all='ignore'):
+            return self._mean(self.values - self._expand(self.median))
 
 
 # aggregation functions for categorical features
 c_aggregation_functions = {
-        'num' : lambda s: s.sum(),
-        'has' : lambda s : s.sum() > 0,
-        'only_one' : lambda s : s.sum() == 1,
-        'all' : lambda s : s.sum() == len(s),
-        'percentage': lambda s : s.sum() / len(s)
+        'num' : lambda g: g.sum,
+        'has' : lambda g : g.sum > 0,
+        'only_one' : lambda g : g.sum == 1,
+        'all' : lambda g : g.sum.eq(g.size, axis=0),
+        'percentage': lambda g : g.sum.div(g.size, axis=0)
+}
+
+
+# Aggregations that keep the integer dtype of integer and boolean features, the sums and
+# ranges are integers and the min and max have the dtype of the feature
+integer_aggregations = {
+        'num' : np.int64,
+        'range' : np.int64,
+        'min' : None,
+        'max' : None
 }
 
 
 # aggregation functions for quantitative features
 q_aggregation_functions = {
-        'mean' : lambda s: s.mean(),
-        'var' : lambda s : s.var(),
-        'std' : lambda s : s.std(),
-        'mad_mean' : lambda s : s.mad(),
-        'mad_median' : mad_median ,
-        'coeff_var' : coeff_var,
-        'min' : lambda s: s.min(),
-        'max': lambda s : s.max(),
-        'range' : lambda s : s.max() - s.min()
+        'mean' : lambda g: g.mean,
+        'var' : lambda g : g.var,
+        'std' : lambda g : g.std,
+        'mad_mean' : lambda g : g.mad_mean,
+        'mad_median' : lambda g : g.mad_median,
+        'coeff_var' : lambda g : (g.mean / g.var).where(g.var != 0),
+        'min' : lambda g: g.min,
+        'max': lambda g : g.max,
+        'range' : lambda g : g.max - g.min
 }
 
 
-def aggregate_features(input_file_name, output_file_name, feature_list):
-    with open(output_file_name, 'w') as f:
-        pass
+def aggregate_features(input_file_name, output_file_name, feature_list, resume=False, shard=None):
+    checkpoint = Checkpoint(output_file_name, resume)
+    if checkpoint.finished:
+        print(f'The features were already aggregated to {output_file_name}')
+        return
+    prepare_output(output_file_name, checkpoint)
+
+    header = get_aggregated_features_header(feature_list)
+
+    with open_shard(input_file_name, shard) as f, AsyncWriter(output_file_name, append=True) as writer:
+        features = load_raw_data(f, chunk_size=2000, sep=',')
+
+        # The columns of the last table of a chunk could continue in the next chunk,
+        # so they are carried over and aggregated with the next chunk
+        carry = None
+        tables_processed = checkpoint.output_rows
+        input_rows = checkpoint.input_rows
+
+        for i, chunk in checkpoint.skip(features):
+            input_rows += len(chunk)
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+
+            starts = get_tables_starts(chunk)
+            carry = chunk.iloc[starts[-1]:]
+            chunk = chunk.iloc[:starts[-1]]
+
+            df = aggregate_chunk_features(chunk, starts[:-1], feature_list, header)
+            writer.write(df)
+            tables_processed += len(df)
+            print('Finished processing chunk ', i)
+
+            # A resumed run reads the carried columns again
+            writer.sync(checkpoint.save, i, input_rows - len(carry), tables_processed, [output_file_name])
+        if carry is not None and len(carry):
+            df = aggregate_chunk_features(carry, get_tables_starts(carry), feature_list, header)
+            writer.write(df)
+            tables_processed += len(df)
+        writer.flush()
+        checkpoint.finish()
+        print(f'Finished, aggregated a total of {tables_processed} tables')
+
 
+def get_aggregated_features_header(feature_list):
     header = [FID]
     for f in feature_list:
         f_name = f['name']
@@ -57,62 +173,52 @@ def aggregate_features(input_file_name, output_file_name, feature_list):
 
         for agg_func_name in aggregation_functions:
             header.append(f'{f_name}-{agg_func_name}')
+    # A table is approximated when the features of any of its columns or pairs are
+    header.append(APPROXIMATED)
+    return header
 
-    with open(input_file_name, 'r') as f:
-        features = load_raw_data(f, chunk_size=2000, sep=',')
 
-        current_fid = None
-        table_columns = []
-
-        tables_processed = 0
-
-        for i, chunk in enumerate(features):
-            
-            chunk_aggregated = []
-            
-            for row in chunk.iterrows():
-                column_features = row[1]
-                
-                if current_fid != column_features['fid']:
-                    if current_fid:
-                        #table_columns_df = pd.DataFrame(table_columns, columns=chunk.columns)
-                        aggregated = _aggregate_features(current_fid, table_columns, feature_list)
-                        chunk_aggregated.append(aggregated)
-                        table_columns = []
-                        tables_processed += 1
-
-                    current_fid = column_features[FID]
-                    
-                table_columns.append(column_features)
-            df = pd.DataFrame(chunk_aggregated, columns=header)
-            df.to_csv(output_file_name, mode='a', index=False, header=(i == 0))
-            print('Finished processing chunk ', i)
-        if table_columns:
-            aggregated = _aggregate_features(current_fid, table_columns, feature_list, output_file_name)
-            df = pd.DataFrame([aggregated])
-            df.to_csv(output_file_name, mode='a', index=False, header=False)
+def get_tables_starts(chunk):
+    # Positions of the first column of each table, consecutive columns with the same fid
+    # belong to the same table
+    fids = chunk[FID].to_numpy()
+    return np.flatnonzero(np.append(True, fids[1:] != fids[:-1]))
 
 
-def _aggregate_features(table_fid, table_columns, feature_list):
-    df = pd.DataFrame(table_columns)
-    aggregated = [table_fid]
-    
-    for f in feature_list:
-        f_name = f['name']
-        f_type = f['type']
+def aggregate_chunk_features(chunk, starts, feature_list, header):
+    if not len(chunk):
+        return pd.DataFrame([], columns=header)
 
-        v = df[f_name]
+    feature_names = [f['name'] for f in feature_list]
+    # Boolean features are aggregated as numbers
+    g = GroupedFeatures(chunk[feature_names].astype(float), starts)
 
-        aggregation_functions = c_aggregation_functions if f_type == 'boolean' else q_aggregation_functions
+    aggregated = {FID: chunk[FID].to_numpy()[starts]}
+    c_features = [f['name'] for f in feature_list if f['type'] == 'boolean']
+    q_features = [f['name'] for f in feature_list if f['type'] != 'boolean']
+
+    # The features are reduced as floats, the counts of the boolean features, which skip the
+    # missing values, and the other integer aggregations of the features without missing values
+    # are cast back so they are written as integers
+    dtypes = dict([(f_name, chunk[f_name].dtype) for f_name in feature_names if chunk[f_name].dtype.kind in 'iub'])
+
+    for f_names, aggregation_functions in [(c_features, c_aggregation_functions), (q_features, q_aggregation_functions)]:
+        for agg_func_name, agg_func in aggregation_functions.items():
+            values = agg_func(g)
+            for f_name in f_names:
+                values_f = values[f_name].to_numpy()
+                if agg_func_name == 'num' or (f_name in dtypes and agg_func_name in integer_aggregations):
+                    values_f = values_f.astype(integer_aggregations[agg_func_name] or dtypes[f_name])
+                aggregated[f'{f_name}-{agg_func_name}'] = values_f
 
-        for agg_func in aggregation_functions.values():
-            aggregated.append(agg_func(v))
+    if APPROXIMATED in chunk:
+        aggregated[APPROXIMATED] = np.logical_or.reduceat(chunk[APPROXIMATED].to_numpy(dtype=bool), starts)
+    else:
+        aggregated[APPROXIMATED] = False
 
-    return aggregated
+    return pd.DataFrame(aggregated, columns=header)
 
-                
 
-         
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
@@ -120,6 +226,8 @@ if __name__ == '__main__':
     parser.add_argument('-o', required=True, help='Output file path')
     parser.add_argument('-s', help='Aggregate single column features', action='store_const', const=True, default=False)
     parser.add_argument('-p', help='Aggregate pairwise column features', action='store_const', const=True, default=False)
+    parser.add_argument('--resume', help='Resume a previous run from its last checkpoint', action='store_const', const=True, default=False)
+    parser.add_argument('--shard', type=parse_shard, help='Aggregate only the features of the tables of the shard i of N of the input, as i/N')
     args = parser.parse_args()
 
     input_file_name = args.i
@@ -135,9 +243,9 @@ if __name__ == '__main__':
 
     if args.s:
         print('Aggregating single column features from file ', input_file_name)
-        aggregate_features(input_file_name, output_file_name, all_single_features_list)
+        aggregate_features(input_file_name, output_file_name, all_single_features_list, resume=args.resume, shard=args.shard)
 
     if args.p:
         print('Aggregating pairwise column features from file ', input_file_name)
-        aggregate_features(input_file_name, output_file_name, all_pairwise_features_list)
+        aggregate_features(input_file_name, output_file_name, all_pairwise_features_list, resume=args.resume, shard=args.shard)
 
@@ -0,0 +1,202 @@
+import gzip
+import io
+import os
+import threading
+from queue import Queue, Empty
+
+# Writes the rows of the outputs of the stages from a background thread, so the computation of
+# the next rows doesn't wait for the disk. The output file is opened once for the whole run and
+# the rows are written in large batches. Checkpoints go through the writer with sync, and run
+# once the rows written before them are on disk, so a checkpoint never counts rows that were
+# not saved. The outputs ending in .gz or .zst are compressed with gzip or zstd, the rows of
+# every checkpoint are a separate gzip member or zstd frame, so the output truncated to a
+# checkpoint by a resumed run is still a valid compressed file.
+
+compressions = {
+    '.gz' : 'gzip',
+    '.zst' : 'zstd'
+}
+
+_WRITE = 0
+_CALL = 1
+_SYNC = 2
+_FLUSH = 3
+_CLOSE = 4
+
+
+def get_compression(file_name):
+    return compressions.get(os.path.splitext(file_name)[1])
+
+
+def _import_zstandard():
+    # zstandard is only needed for the .zst files
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('The .zst files need the zstandard package')
+    return zstandard
+
+
+def open_text(file_name):
+    # Opens a file written by AsyncWriter as a text file, decompressing it when compressed
+    compression = get_compression(file_name)
+    if compression == 'gzip':
+        return gzip.open(file_name, 'rt', encoding='utf-8')
+    if compression == 'zstd':
+        zstandard = _import_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_name, 'rb'), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8')
+    return open(file_name, 'r')
+
+
+class AsyncWriter:
+    # max_pending is the number of dataframes waiting to be written, over it write blocks until
+    # the writer catches up, and buffer_size the number of bytes of rows written at once
+
+    def __init__(self, output_file_name, append=False, sep=',', max_pending=16, buffer_size=4 * 1024 * 1024):
+        self.output_file_name = output_file_name
+        self.sep = sep
+        self.buffer_size = buffer_size
+        self.compression = get_compression(output_file_name)
+        if self.compression == 'zstd':
+            self.zstandard = _import_zstandard()
+        # The header is only written at the start of the file, also when appending to a file
+        # without rows
+        self.file = open(output_file_name, 'ab' if append else 'wb')
+        self.header = not self.file.tell()
+        self.stream = None
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.error = None
+        self.queue = Queue(max_pending)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, df):
+        # The dataframe must not be modified after it is passed to the writer
+        self._put((_WRITE, df))
+
+    def call(self, func, *args):
+        # Calls func(*args) from the writer thread, in order with the rows, e.g. to write the
+        # data of other files of the output
+        self._put((_CALL, func, args))
+
+    def sync(self, func, *args):
+        # Calls func(*args) from the writer thread once the rows written before are on disk,
+        # and before the rows written after. When several syncs are waiting only the last one
+        # is called, e.g. the last checkpoint
+        self._put((_SYNC, func, args))
+
+    def flush(self):
+        # Waits until the rows written before are on disk
+        done = threading.Event()
+        self._put((_FLUSH, done))
+        done.wait()
+        self._raise_error()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put((_CLOSE,))
+            self.thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        # The rows written before an error are saved too, an error of the writer doesn't hide
+        # the error of the stage
+        try:
+            self.close()
+        except Exception:
+            if exc_type is None:
+                raise
+
+    def _put(self, item):
+        self._raise_error()
+        self.queue.put(item)
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        closed = False
+        while not closed:
+            # All the items waiting are handled together, so the pending rows go in a single
+            # write and only the last sync is called
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            last_sync = max([j for j, item in enumerate(items) if item[0] == _SYNC], default=None)
+            flushes = []
+            for j, item in enumerate(items):
+                if item[0] == _WRITE:
+                    self._add_rows(item[1])
+                elif item[0] == _FLUSH:
+                    flushes.append(item[1])
+                elif item[0] == _CLOSE:
+                    closed = True
+                elif item[0] == _CALL or j == last_sync:
+                    self._call(item[0] == _SYNC, *item[1:])
+            if flushes or closed:
+                self._call(True)
+            for done in flushes:
+                done.set()
+        self.file.close()
+
+    def _call(self, save, func=None, args=()):
+        if self.error is not None:
+            return
+        try:
+            if save:
+                self._save_rows()
+            if func:
+                func(*args)
+        except Exception as e:
+            self._fail(e)
+
+    def _add_rows(self, df):
+        if self.error is not None:
+            return
+        try:
+            rows = df.to_csv(index=False, header=self.header, sep=self.sep).encode('utf-8')
+            self.header = False
+            self.buffer.append(rows)
+            self.buffer_bytes += len(rows)
+            if self.buffer_bytes >= self.buffer_size:
+                self._write_buffer()
+        except Exception as e:
+            self._fail(e)
+
+    def _write_buffer(self):
+        if not self.buffer:
+            return
+        if self.compression and self.stream is None:
+            self.stream = self._open_stream()
+        (self.stream or self.file).write(b''.join(self.buffer))
+        self.buffer = []
+        self.buffer_bytes = 0
+
+    def _save_rows(self):
+        # Writes the pending rows and ends the current gzip member or zstd frame
+        self._write_buffer()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.file.flush()
+
+    def _open_stream(self):
+        if self.compression == 'gzip':
+            # Without the time the same rows are always compressed to the same bytes
+            return gzip.GzipFile(fileobj=self.file, mode='wb', mtime=0)
+        return self.zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+
+    def _fail(self, e):
+        # The rows after an error are dropped, the error is raised in the thread of the stage
+        self.error = e
+        self.buffer = []
+        self.buffer_bytes = 0
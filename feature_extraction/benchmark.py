@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from generate_corpus import generate_corpus, parse_range, parse_dtypes_mix, default_dtypes_mix
+
+# Times every stage of the pipeline over a corpus, by default a synthetic corpus generated with
+# generate_corpus. Each stage runs its script in a new process, so the peak RSS reported is the
+# one of that stage (without the worker processes), and the report is saved as JSON to compare
+# runs before and after a change.
+
+
+def get_stages(work_dir, raw_file_name, store=False, workers=1):
+    columns = os.path.join(work_dir, 'columns' if store else 'columns.tsv')
+    tables = os.path.join(work_dir, 'tables.csv')
+    clean = os.path.join(work_dir, 'clean' if store else 'clean.tsv')
+    single = os.path.join(work_dir, 'single.csv')
+    pairwise = os.path.join(work_dir, 'pairwise.csv')
+    extract_columns_args = ['--store'] if store else []
+    workers_args = ['--workers', str(workers)]
+
+    # name, script arguments, input and output
+    return [
+        ('extract_columns', ['extract_columns.py', '-i', raw_file_name, '-o', columns] + extract_columns_args + workers_args, raw_file_name, columns),
+        ('extract_tables_outputs', ['extract_tables_outputs.py', '-i', columns, '-o', tables], columns, tables),
+        ('clean_columns', ['clean_columns.py', '-c', columns, '-t', tables, '-o', clean], columns, clean),
+        ('extract_single_column_features', ['extract_features.py', '-i', clean, '-os', single], clean, single),
+        ('extract_pairwise_column_features', ['extract_features.py', '-i', clean, '-op', pairwise] + workers_args, clean, pairwise),
+        ('aggregate_single_column_features', ['aggregate_features.py', '-i', single, '-o', os.path.join(work_dir, 'aggregated_single.csv'), '-s'], single, os.path.join(work_dir, 'aggregated_single.csv')),
+        ('aggregate_pairwise_column_features', ['aggregate_features.py', '-i', pairwise, '-o', os.path.join(work_dir, 'aggregated_pairwise.csv'), '-p'], pairwise, os.path.join(work_dir, 'aggregated_pairwise.csv'))
+    ]
+
+
+def run_stage(name, args, input_file_name, output_file_name, verbose=False):
+    # Runs the script of the stage and returns its wall time, rows processed and peak RSS
+    output = None if verbose else subprocess.DEVNULL
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + args, cwd=os.path.dirname(os.path.abspath(__file__)), stdout=output)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f'Stage {name} failed with exit code {process.returncode}')
+
+    input_rows = count_rows(input_file_name)
+    return {
+        'stage' : name,
+        'seconds' : seconds,
+        'input_rows' : input_rows,
+        'output_rows' : count_rows(output_file_name),
+        'rows_per_second' : input_rows / seconds if seconds else None,
+        'peak_rss_mb' : usage.ru_maxrss / 1024 # ru_maxrss is in KB on Linux
+    }
+
+
+def count_rows(file_name):
+    # Rows of a TSV or CSV file (or of the index of a column store) without the header, the
+    # JSON encoded data never has line breaks. column_store imports pandas, which the benchmark
+    # itself doesn't need
+    from column_store import is_column_store, INDEX_FILE
+    if is_column_store(file_name):
+        file_name = os.path.join(file_name, INDEX_FILE)
+    with open(file_name, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def run_benchmark(raw_file_name, work_dir, store=False, workers=1, verbose=False):
+    report = []
+    for name, args, input_file_name, output_file_name in get_stages(work_dir, raw_file_name, store, workers):
+        result = run_stage(name, args, input_file_name, output_file_name, verbose)
+        print(f"{name}: {result['seconds']:.2f}s, {result['rows_per_second']:.1f} rows/s, {result['peak_rss_mb']:.1f} MB", file=sys.stderr)
+        report.append(result)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', help='Raw corpus file path, a synthetic corpus is generated when it is not given')
+    parser.add_argument('-o', help='Output file path of the JSON report, the report is written to stdout by default')
+    parser.add_argument('--work-dir', help='Directory for the outputs of the stages, a temporary directory by default')
+    parser.add_argument('--store', help='Save the columns in column stores instead of TSV files', action='store_const', const=True, default=False)
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes of the stages that support them')
+    parser.add_argument('-v', help='Show the output of the stages', action='store_const', const=True, default=False)
+    parser.add_argument('--tables', type=int, default=1000, help='Number of tables of the synthetic corpus')
+    parser.add_argument('--columns', type=parse_range, default=(2, 6), help='Range of the number of columns of a table of the synthetic corpus, e.g. 2:6')
+    parser.add_argument('--lengths', type=parse_range, default=(2, 1000), help='Range of the length of the columns of the synthetic corpus, e.g. 2:1000')
+    parser.add_argument('--dtypes', type=parse_dtypes_mix, default=default_dtypes_mix, help='Weights of the data types of the synthetic corpus, e.g. int=3,float=4,string=2,datetime=1,bool=1')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic corpus')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+        corpus = {'file' : args.i}
+        raw_file_name = args.i
+        if not raw_file_name:
+            raw_file_name = os.path.join(work_dir, 'corpus.tsv')
+            corpus = {'tables' : args.tables, 'columns' : args.columns, 'lengths' : args.lengths, 'dtypes' : args.dtypes, 'seed' : args.seed}
+            with open(raw_file_name, 'w', newline='') as f:
+                generate_corpus(f, tables=args.tables, columns=args.columns, lengths=args.lengths, dtypes_mix=args.dtypes, seed=args.seed)
+
+        report = {
+            'corpus' : corpus,
+            'store' : args.store,
+            'workers' : args.workers,
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'stages' : run_benchmark(raw_file_name, work_dir, args.store, args.workers, args.v)
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.o:
+        with open(args.o, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from generate_corpus import generate_column, get_length, parse_range, parse_dtypes_mix, default_dtypes_mix
+from feature_service import FeatureService, LatencyMetrics, create_server, open_connection, request_features, request_metrics, is_within_target
+
+# Measures the latency of the feature service under concurrent load. The clients send synthetic
+# tables, like the ones of generate_corpus, from several threads with a connection each, and the
+# percentiles of the latencies seen by the clients are compared with the targets. Without the
+# address of a running service, a service is started in this process on a Unix socket.
+
+
+def generate_tables(n, columns=(2, 6), lengths=(10, 1000), dtypes_mix=default_dtypes_mix, missing=0.0, seed=0):
+    rng = random.Random(seed)
+    dtypes, weights = zip(*dtypes_mix.items())
+    tables = []
+    for _ in range(n):
+        length = get_length(rng, lengths)
+        tables.append(dict([(f'col{c}', generate_column(rng, rng.choices(dtypes, weights)[0], length, missing)) for c in range(rng.randint(*columns))]))
+    return tables
+
+
+def run_load(tables, concurrency, host='127.0.0.1', port=8000, socket_path=None):
+    # Returns the latencies in seconds of the requests, every client sends the tables of its
+    # turn over its own connection
+    local = threading.local()
+
+    def send(table):
+        if not hasattr(local, 'connection'):
+            local.connection = open_connection(host, port, socket_path)
+        start = time.perf_counter()
+        request_features(local.connection, table)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        return np.array(list(executor.map(send, tables)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500, help='Number of tables sent')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients')
+    parser.add_argument('--columns', type=parse_range, default=(2, 6), help='Range of the number of columns of a table, e.g. 2:6')
+    parser.add_argument('--lengths', type=parse_range, default=(10, 1000), help='Range of the length of the columns, e.g. 10:1000')
+    parser.add_argument('--dtypes', type=parse_dtypes_mix, default=default_dtypes_mix, help='Weights of the data types of the columns, e.g. int=3,float=4,string=2,datetime=1,bool=1')
+    parser.add_argument('--missing', type=float, default=0.0, help='Probability of a missing element, a bool column with missing elements makes its table invalid')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the tables')
+    parser.add_argument('--host', default='127.0.0.1', help='Host of a running service')
+    parser.add_argument('--port', type=int, help='Port of a running service')
+    parser.add_argument('--socket', help='Unix socket of a running service')
+    parser.add_argument('--batch-size', type=int, default=16, help='Maximum number of tables computed together by the service started')
+    parser.add_argument('--batch-wait', type=float, default=2, help='Milliseconds to wait for more tables to fill a batch in the service started')
+    parser.add_argument('--target-p50', type=float, help='Target of the median latency in milliseconds')
+    parser.add_argument('--target-p99', type=float, help='Target of the 99th percentile of the latency in milliseconds')
+    parser.add_argument('-o', help='Output file path for the JSON report')
+
+    args = parser.parse_args()
+
+    tables = generate_tables(args.requests, args.columns, args.lengths, args.dtypes, args.missing, args.seed)
+
+    service = server = None
+    socket_path = args.socket
+    if args.port is None and socket_path is None:
+        # The socket is in a new private directory, removed with the socket at the end
+        socket_path = os.path.join(tempfile.mkdtemp(prefix='feature_service_'), 'service.sock')
+        service = FeatureService(args.batch_size, args.batch_wait / 1000, metrics=LatencyMetrics(target_p50=args.target_p50, target_p99=args.target_p99))
+        server = create_server(service, socket_path=socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        # A first round warms up the service and the connections
+        run_load(tables[:args.concurrency], args.concurrency, args.host, args.port, socket_path)
+        start = time.perf_counter()
+        latencies = run_load(tables, args.concurrency, args.host, args.port, socket_path)
+        seconds = time.perf_counter() - start
+        service_metrics = request_metrics(open_connection(args.host, args.port, socket_path))
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+            service.close()
+            os.rmdir(os.path.dirname(socket_path))
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    latency_ms = {'p50' : p50, 'p90' : p90, 'p99' : p99, 'max' : latencies.max() * 1000}
+    report = {
+        'requests' : args.requests,
+        'concurrency' : args.concurrency,
+        'seconds' : seconds,
+        'tables_per_second' : args.requests / seconds,
+        'latency_ms' : latency_ms,
+        'target_ms' : {'p50' : args.target_p50, 'p99' : args.target_p99},
+        'within_target' : is_within_target(latency_ms, args.target_p50, args.target_p99),
+        'service' : service_metrics
+    }
+    print(f'{args.requests} tables in {seconds:.2f} s ({report["tables_per_second"]:.1f} tables/s) with {args.concurrency} clients')
+    print(f'latency p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms, max {latency_ms["max"]:.1f} ms')
+    print(f'mean batch size {service_metrics["mean_batch_size"]:.1f}')
+    if args.o:
+        with open(args.o, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['within_target'] is False:
+        print('The latency is over the target')
+        sys.exit(1)
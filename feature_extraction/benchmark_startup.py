@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures the startup time of the vizkg commands, the time to run `vizkg.py <command> -h` in a
+# new process, which is the time to import the modules of the command. The startup of every
+# command is compared with a maximum and with the report of a previous run, so a change that
+# makes the startup slower than the threshold fails with exit status 1.
+
+
+def measure_startup(args, repeat=5):
+    # Median and minimum wall time in seconds of running python with args
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=cwd, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+
+def find_regressions(report, max_ms=None, baseline=None, tolerance=0.25):
+    # Returns the commands over max_ms or slower than (1 + tolerance) times their baseline
+    regressions = []
+    for command, startup in report['commands'].items():
+        if max_ms is not None and startup['median_ms'] > max_ms:
+            regressions.append(f'{command}: {startup["median_ms"]:.0f} ms is over the maximum of {max_ms:.0f} ms')
+        if baseline and command in baseline['commands']:
+            baseline_ms = baseline['commands'][command]['median_ms']
+            if startup['median_ms'] > baseline_ms * (1 + tolerance):
+                regressions.append(f'{command}: {startup["median_ms"]:.0f} ms is over the baseline of {baseline_ms:.0f} ms by more than {tolerance:.0%}')
+    return regressions
+
+
+if __name__ == '__main__':
+    from vizkg import COMMANDS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('commands', nargs='*', help='Commands measured, all by default')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs of every command, the median is reported')
+    parser.add_argument('--max-ms', type=float, help='Maximum startup time in milliseconds of a command')
+    parser.add_argument('--baseline', help='Report of a previous run, a command slower than its baseline by more than the tolerance fails')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Fraction of the baseline startup time a command can be slower by')
+    parser.add_argument('-o', help='Output file path for the JSON report')
+
+    args = parser.parse_args()
+
+    commands = args.commands or list(COMMANDS)
+    for command in commands:
+        if command not in COMMANDS:
+            parser.error(f'unknown command {command}')
+
+    # The startup of the interpreter alone, which no change of the scripts can improve
+    interpreter_median, interpreter_min = measure_startup(['-c', 'pass'], args.repeat)
+    report = {
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'repeat' : args.repeat,
+        'interpreter_ms' : interpreter_median * 1000,
+        'commands' : {}
+    }
+    print(f'{"interpreter":<24}{interpreter_median * 1000:8.0f} ms')
+    for command in commands:
+        median, minimum = measure_startup(['vizkg.py', command, '-h'], args.repeat)
+        report['commands'][command] = {'median_ms' : median * 1000, 'min_ms' : minimum * 1000}
+        print(f'{command:<24}{median * 1000:8.0f} ms')
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    regressions = find_regressions(report, args.max_ms, baseline, args.tolerance)
+    report['regressions'] = regressions
+
+    if args.o:
+        with open(args.o, 'w') as f:
+            json.dump(report, f, indent=2)
+    if regressions:
+        print('\n'.join(['The startup regressed:'] + regressions))
+        sys.exit(1)
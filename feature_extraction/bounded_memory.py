@@ -0,0 +1,65 @@
+import argparse
+import numpy as np
+
+# Limits of the columns and tables whose features are computed on all their rows. The features
+# of a longer column or a larger table are computed on a sample of its rows. The sample only
+# depends on the length of the column, so all the columns of a table are sampled at the same
+# rows and a column always gets the same features. A sample has at least 2 rows, the least
+# the statistical features (e.g. the correlations) need.
+
+MIN_SAMPLE_LENGTH = 2
+
+
+def parse_max_column_length(value):
+    max_column_length = int(value)
+    if max_column_length < MIN_SAMPLE_LENGTH:
+        raise argparse.ArgumentTypeError(f'The maximum column length {value} must be at least {MIN_SAMPLE_LENGTH}')
+    return max_column_length
+
+
+def parse_max_table_size(value):
+    max_table_size = int(value)
+    if max_table_size < 1:
+        raise argparse.ArgumentTypeError(f'The maximum table size {value} must be at least 1 MB')
+    return max_table_size
+
+
+def get_sample_indices(length, sample_length):
+    # Sorted so the sample keeps the order of the rows for the sequence features
+    rng = np.random.default_rng(length)
+    return np.sort(rng.choice(length, sample_length, replace=False))
+
+
+def sample_column(data, sample_length):
+    if len(data) <= sample_length:
+        return data
+    return data[get_sample_indices(len(data), sample_length)]
+
+
+def bound_column(data, max_column_length=None):
+    # Returns the data of the column, sampled when it is longer than max_column_length, and
+    # whether it was sampled
+    if max_column_length is None:
+        return data, False
+    sample_length = max(max_column_length, MIN_SAMPLE_LENGTH)
+    if len(data) <= sample_length:
+        return data, False
+    return sample_column(data, sample_length), True
+
+
+def bound_table(table_columns, max_column_length=None, max_table_size=None):
+    # table_columns is a list of ColumnRecord, max_table_size is the maximum size in bytes of
+    # the arrays of the columns. Returns the columns, sampled to the same number of rows when
+    # the table is over a limit, and whether they were sampled
+    lengths = [len(column.data) for column in table_columns]
+    sample_length = max(lengths, default=0)
+    if max_column_length is not None:
+        sample_length = min(sample_length, max_column_length)
+    if max_table_size is not None and table_columns:
+        row_size = sum(column.data.itemsize for column in table_columns)
+        sample_length = min(sample_length, max_table_size // row_size)
+    sample_length = max(sample_length, MIN_SAMPLE_LENGTH)
+
+    if all(length <= sample_length for length in lengths):
+        return table_columns, False
+    return [column.with_data(sample_column(column.data, sample_length)) for column in table_columns], True
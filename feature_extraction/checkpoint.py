@@ -0,0 +1,98 @@
+import os
+import json
+
+# A checkpoint is a manifest saved next to the output of a stage with its progress: the last
+# completed chunk, the number of input rows consumed, the number of output rows and the size
+# of the output files at that point. A resumed run truncates the outputs to those sizes, so
+# anything written after the last checkpoint is discarded, and skips the input rows already
+# consumed. Stages that keep a table across chunks only count as consumed the rows before the
+# table, so the table is read again when resuming.
+
+
+class Checkpoint:
+
+    def __init__(self, output_file_name, resume=False):
+        self.file_name = get_checkpoint_file_name(output_file_name)
+        self.chunk = -1
+        self.input_rows = 0
+        self.output_rows = 0
+        self.output_sizes = {}
+        self.finished = False
+        self.resumed = False
+
+        if resume and os.path.exists(self.file_name):
+            with open(self.file_name, 'r') as f:
+                manifest = json.load(f)
+            self.chunk = manifest['chunk']
+            self.input_rows = manifest['input_rows']
+            self.output_rows = manifest['output_rows']
+            self.output_sizes = manifest['output_sizes']
+            self.finished = manifest['finished']
+            self.resumed = True
+            print(f'Resuming after chunk {self.chunk}, skipping {self.input_rows} input rows')
+        else:
+            # A new run replaces the manifest of a previous run of the same output, which would
+            # be trusted by a later resume or by the merge of the shards
+            self._write()
+
+    def restore_outputs(self):
+        # Discards everything written to the outputs after the last checkpoint
+        for output_file_name, size in self.output_sizes.items():
+            with open(output_file_name, 'r+') as f:
+                f.truncate(size)
+
+    def skip(self, chunks):
+        # Yields the chunks with their index, without the input rows already consumed. The index
+        # of the chunks is the row number in the input, also when only some tables are read. The
+        # chunks without rows, e.g. when all their lines are bad, are skipped
+        for i, chunk in enumerate(chunks):
+            if not len(chunk) or chunk.index[-1] < self.input_rows:
+                continue
+            if chunk.index[0] < self.input_rows:
+                chunk = chunk[chunk.index >= self.input_rows]
+            yield i, chunk
+
+    def save(self, chunk, input_rows, output_rows, output_files):
+        self.chunk = chunk
+        self.input_rows = input_rows
+        self.output_rows = output_rows
+        self.output_sizes = dict([(f, os.path.getsize(f)) for f in output_files])
+        self._write()
+
+    def finish(self):
+        self.finished = True
+        self._write()
+
+    def _write(self):
+        manifest = {
+            'chunk': self.chunk,
+            'input_rows': self.input_rows,
+            'output_rows': self.output_rows,
+            'output_sizes': self.output_sizes,
+            'finished': self.finished
+        }
+        # Replace the manifest atomically so a crash never leaves it half written
+        temp_file_name = self.file_name + '.tmp'
+        with open(temp_file_name, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_file_name, self.file_name)
+
+
+def get_checkpoint_file_name(output_file_name):
+    return output_file_name.rstrip(os.sep) + '.checkpoint.json'
+
+
+def remove_checkpoint(output_file_name):
+    # Removes the manifest of an output written by a stage that doesn't save checkpoints
+    checkpoint_file_name = get_checkpoint_file_name(output_file_name)
+    if os.path.exists(checkpoint_file_name):
+        os.remove(checkpoint_file_name)
+
+
+def prepare_output(output_file_name, checkpoint):
+    # Cleans the output file, or restores it to the last checkpoint when resuming
+    if checkpoint.resumed:
+        checkpoint.restore_outputs()
+    else:
+        with open(output_file_name, 'w') as f:
+            pass
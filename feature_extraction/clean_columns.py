@@ -1,34 +1,41 @@
-from utils import load_raw_data
+from column_store import open_columns, open_columns_writer, is_column_store
 import argparse
 from constants import FID, TRACE_TYPE, IS_XSRC,IS_YSRC, N_TRACES, N_XSRC, N_YSRC, DATA, DTYPE, LENGTH
 from data_types import DSTRING, DINT, DFLOAT, DBOOL, DDATE
 import pandas as pd
+from checkpoint import Checkpoint
+from async_writer import open_text
+from sharding import parse_shard
 
 
-def clean_corpus_columns(input_columns_file_name, input_tables_file_name, output_file_name):
-    with open(output_file_name, 'w') as f:
-        pass
-    
+def clean_corpus_columns(input_columns_file_name, input_tables_file_name, output_file_name, resume=False, shard=None):
+    checkpoint = Checkpoint(output_file_name, resume)
+    if checkpoint.finished:
+        print('The corpus columns were already cleaned')
+        return
+    checkpoint.restore_outputs()
+
     tables = None
-    with open(input_tables_file_name, 'r') as f:
+    with open_text(input_tables_file_name) as f:
         tables_df = pd.read_csv(f)
         tables = set(tables_df[FID]) # Get the correct tables
 
-    with open(input_columns_file_name, 'r') as f:
-        raw_data = load_raw_data(f, chunk_size=2000)
-        total_columns = 0
-        for i, chunk in enumerate(raw_data):
-            chunk_columns = []
-            for row in chunk.iterrows():
-                column = row[1]
-
-                if column[FID] in tables:
-                    chunk_columns.append(column)
-
-            df = pd.DataFrame(chunk_columns, columns=chunk.columns)
-            df.to_csv(output_file_name, mode='a', index=False, header=(i == 0), sep='\t')
-            print(f'Processed chunk {i}, saved {len(chunk_columns)} columns.')
-            total_columns += len(chunk_columns)
+    # A column store is cleaned into another column store
+    store = is_column_store(input_columns_file_name)
+    # Only the rows of the correct tables are read when the columns file has a fid index
+    with open_columns(input_columns_file_name, chunk_size=2000, fids=tables, shard=shard) as raw_data, open_columns_writer(output_file_name, store, checkpoint.resumed) as writer:
+        total_columns = checkpoint.output_rows
+        input_rows = checkpoint.input_rows
+        for i, chunk in checkpoint.skip(raw_data):
+            df = chunk[chunk[FID].isin(tables)]
+            writer.write(df)
+            print(f'Processed chunk {i}, saved {len(df)} columns.')
+            total_columns += len(df)
+            input_rows = int(chunk.index[-1]) + 1
+
+            writer.sync(checkpoint.save, i, input_rows, total_columns, writer.output_files)
+        writer.flush()
+        checkpoint.finish()
         print(f'Finished cleaning the corpus columns, saved a total of {total_columns} columns.')
 
 
@@ -37,6 +44,8 @@ if __name__ == '__main__':
     parser.add_argument('-c', required=True, help='Columns file path')
     parser.add_argument('-t', required=True, help='Tables file path')
     parser.add_argument('-o', required=True, help='Output file path')
+    parser.add_argument('--resume', help='Resume a previous run from its last checkpoint', action='store_const', const=True, default=False)
+    parser.add_argument('--shard', type=parse_shard, help='Clean only the columns of the shard i of N of the columns, as i/N')
 
     args = parser.parse_args()
 
@@ -46,4 +55,4 @@ if __name__ == '__main__':
 
     output_file_name = args.o
     
-    clean_corpus_columns(input_columns_file_name, input_tables_file_name, output_file_name)
+    clean_corpus_columns(input_columns_file_name, input_tables_file_name, output_file_name, resume=args.resume, shard=args.shard)
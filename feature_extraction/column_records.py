@@ -0,0 +1,95 @@
+import numpy as np
+from column_store import decode_column_data
+from constants import FID, FIELD_ID, TRACE_TYPE, IS_XSRC, IS_YSRC, IS_ONLY_XSRC, IS_ONLY_YSRC, DTYPE, DATA, data_types_list
+
+# Compact records of the columns, used by the stages instead of the rows of the chunks. A row of
+# a chunk given by iterrows is a new pandas Series for every column, with an index and the
+# values boxed as objects, which weighs and costs more than the data of most columns. A record
+# only keeps the metadata of the column, its axes as bit flags, the code of its dtype and its
+# data as a numpy array.
+
+# Flags of the axes of a column
+XSRC = 1
+YSRC = 2
+ONLY_XSRC = 4
+ONLY_YSRC = 8
+
+flag_columns = [(IS_XSRC, XSRC), (IS_YSRC, YSRC), (IS_ONLY_XSRC, ONLY_XSRC), (IS_ONLY_YSRC, ONLY_YSRC)]
+
+dtype_codes = dict([(dtype, code) for code, dtype in enumerate(data_types_list)])
+
+
+class ColumnRecord:
+    __slots__ = ('fid', 'field_id', 'trace_type', 'flags', 'dtype_code', 'data')
+
+    def __init__(self, fid, field_id, trace_type, flags, dtype_code, data):
+        self.fid = fid
+        self.field_id = field_id
+        self.trace_type = trace_type
+        self.flags = flags
+        self.dtype_code = dtype_code
+        self.data = data
+
+    @property
+    def dtype(self):
+        return data_types_list[self.dtype_code]
+
+    @property
+    def is_xsrc(self):
+        return bool(self.flags & XSRC)
+
+    @property
+    def is_ysrc(self):
+        return bool(self.flags & YSRC)
+
+    @property
+    def is_only_xsrc(self):
+        return bool(self.flags & ONLY_XSRC)
+
+    @property
+    def is_only_ysrc(self):
+        return bool(self.flags & ONLY_YSRC)
+
+    def with_data(self, data):
+        # The same column with other data, e.g. a sample of its data
+        return ColumnRecord(self.fid, self.field_id, self.trace_type, self.flags, self.dtype_code, data)
+
+
+class ColumnTable:
+    # The columns of a table, position is passed through the stages to locate the table in
+    # their input
+
+    __slots__ = ('fid', 'position', 'columns')
+
+    def __init__(self, fid, columns, position=None):
+        self.fid = fid
+        self.columns = columns
+        self.position = position
+
+
+def iter_column_records(chunk, decode=True):
+    # Yields the records of the columns of a chunk, built from the arrays of the chunk. The data
+    # is decoded as each record is yielded, or left as it is in the chunk without decode
+    n = len(chunk)
+    flags = np.zeros(n, dtype=np.int64)
+    for column, flag in flag_columns:
+        if column in chunk:
+            flags |= np.where(chunk[column].to_numpy(dtype=bool), flag, 0)
+    trace_types = chunk[TRACE_TYPE].to_numpy() if TRACE_TYPE in chunk else [None] * n
+    dtype_code = dtype_codes.get
+    for fid, field_id, trace_type, column_flags, dtype, data in zip(chunk[FID].to_numpy(), chunk[FIELD_ID].to_numpy(), trace_types, flags.tolist(),
+            chunk[DTYPE].to_numpy(), chunk[DATA].to_numpy()):
+        yield ColumnRecord(fid, field_id, trace_type, column_flags, dtype_code(dtype), decode_column_data(data) if decode else data)
+
+
+def iter_tables(records):
+    # Groups the records, sorted by fid, in tables
+    table = None
+    for record in records:
+        if table is None or table.fid != record.fid:
+            if table is not None:
+                yield table
+            table = ColumnTable(record.fid, [])
+        table.columns.append(record)
+    if table is not None:
+        yield table
@@ -0,0 +1,195 @@
+import os
+from contextlib import contextmanager
+import json
+import numpy as np
+import pandas as pd
+from utils import load_raw_data
+from fid_index import load_fid_index, read_tables, OFFSET, ROW
+from sharding import open_shard, get_shard_range
+from constants import DATA, DATA_BLOB, DATA_OFFSET, DATA_LENGTH
+from async_writer import AsyncWriter
+
+# A column store is a directory with the metadata of the columns in a TSV index and the data
+# of all the columns concatenated in binary files, one per numeric type. The index keeps the
+# blob, offset and length of every column so the data can be loaded as views of memory mapped
+# arrays instead of parsing the JSON encoded data of the TSV files.
+
+INDEX_FILE = 'index.tsv'
+
+BLOB_INT = 'int64'
+BLOB_FLOAT = 'float64'
+
+blob_dtypes = {
+    BLOB_INT : np.int64,
+    BLOB_FLOAT : np.float64
+}
+
+store_columns = [DATA_BLOB, DATA_OFFSET, DATA_LENGTH]
+
+
+def is_column_store(path):
+    return os.path.isdir(path)
+
+
+class ColumnStoreWriter:
+    # The index and the blobs are written by the thread of an AsyncWriter of the index
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.output_files = [os.path.join(path, INDEX_FILE)] + [get_blob_file_name(path, blob) for blob in blob_dtypes]
+        if append:
+            # Continue a store written by a previous run
+            self.blob_files = dict([(blob, open(get_blob_file_name(path, blob), 'ab')) for blob in blob_dtypes])
+            self.blob_offsets = dict([(blob, f.tell() // np.dtype(blob_dtypes[blob]).itemsize) for blob, f in self.blob_files.items()])
+        else:
+            os.makedirs(path, exist_ok=True)
+            # Clean the index and the blobs in case they exist
+            self.blob_files = dict([(blob, open(get_blob_file_name(path, blob), 'wb')) for blob in blob_dtypes])
+            self.blob_offsets = dict([(blob, 0) for blob in blob_dtypes])
+        self.writer = AsyncWriter(os.path.join(path, INDEX_FILE), append, sep='\t')
+
+    def write(self, df):
+        # df has the metadata columns and the DATA column with a list or array per row
+        blobs, offsets, lengths, arrays = [], [], [], []
+        for data in df[DATA]:
+            data = np.asarray(data)
+            blob = BLOB_INT if data.dtype.kind in 'iub' else BLOB_FLOAT
+            arrays.append((blob, data.astype(blob_dtypes[blob], copy=False)))
+            blobs.append(blob)
+            offsets.append(self.blob_offsets[blob])
+            lengths.append(len(data))
+            self.blob_offsets[blob] += len(data)
+        self.writer.call(self._write_blobs, arrays)
+
+        index = df.drop(columns=[c for c in [DATA] + store_columns if c in df.columns])
+        index[DATA_BLOB] = blobs
+        index[DATA_OFFSET] = offsets
+        index[DATA_LENGTH] = lengths
+        self.writer.write(index)
+
+    def _write_blobs(self, arrays):
+        for blob, data in arrays:
+            self.blob_files[blob].write(data.tobytes())
+
+    def sync(self, func, *args):
+        self.writer.sync(self._flush_blobs, func, args)
+
+    def _flush_blobs(self, func, args):
+        for f in self.blob_files.values():
+            f.flush()
+        func(*args)
+
+    def flush(self):
+        self.writer.flush()
+        for f in self.blob_files.values():
+            f.flush()
+
+    def close(self):
+        try:
+            self.writer.close()
+        finally:
+            for f in self.blob_files.values():
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_blob_file_name(path, blob):
+    return os.path.join(path, f'{blob}.bin')
+
+
+def load_blob(path, blob):
+    file_name = get_blob_file_name(path, blob)
+    if not os.path.getsize(file_name):
+        return np.empty(0, dtype=blob_dtypes[blob]) # np.memmap can not map empty files
+    return np.memmap(file_name, dtype=blob_dtypes[blob], mode='r')
+
+
+@contextmanager
+def open_columns(input_file_name, chunk_size=500, fids=None, shard=None):
+    # Opens a columns file to be read by chunks, either a TSV file with the data encoded as
+    # JSON or a column store with the data as numpy arrays. With fids, only the rows of those
+    # tables are read when the file has a fid index, otherwise all the rows are read. With
+    # shard, (i, N), only the rows of the shard i of N are read, see sharding
+    if is_column_store(input_file_name):
+        blobs = dict([(blob, load_blob(input_file_name, blob)) for blob in blob_dtypes])
+        with _open_chunks(os.path.join(input_file_name, INDEX_FILE), chunk_size, fids, shard) as index:
+            yield _load_column_store_chunks(index, blobs)
+    else:
+        with _open_chunks(input_file_name, chunk_size, fids, shard) as chunks:
+            yield chunks
+
+
+@contextmanager
+def _open_chunks(file_name, chunk_size, fids=None, shard=None):
+    fid_index = load_fid_index(file_name) if fids is not None else None
+    if fid_index is not None:
+        if shard is not None:
+            start, end = get_shard_range(file_name, shard)
+            fid_index = fid_index[(fid_index[OFFSET] >= start) & (fid_index[OFFSET] < end)]
+            # The rows are numbered from the start of the shard, like when the shard is read whole
+            if len(fid_index):
+                fid_index = fid_index.assign(**{ROW: fid_index[ROW] - fid_index[ROW].iloc[0]})
+        yield read_tables(file_name, fids, chunk_size, fid_index)
+    else:
+        with open_shard(file_name, shard) as f:
+            yield load_raw_data(f, chunk_size=chunk_size)
+
+
+def _load_column_store_chunks(index, blobs):
+    for chunk in index:
+        data = [
+            blobs[blob][offset:offset + length]
+            for blob, offset, length in zip(chunk[DATA_BLOB], chunk[DATA_OFFSET], chunk[DATA_LENGTH])
+        ]
+        chunk[DATA] = pd.Series(data, index=chunk.index, dtype=object)
+        yield chunk
+
+
+def decode_column_data(data):
+    if isinstance(data, str):
+        return np.array(json.loads(data))
+    return data
+
+
+def encode_column_data(data):
+    if isinstance(data, np.ndarray):
+        return json.dumps(data.tolist())
+    return data
+
+
+def open_columns_writer(output_file_name, store, append=False):
+    if store:
+        return ColumnStoreWriter(output_file_name, append)
+    return ColumnsTSVWriter(output_file_name, append)
+
+
+class ColumnsTSVWriter:
+
+    def __init__(self, output_file_name, append=False):
+        self.output_file_name = output_file_name
+        self.output_files = [output_file_name]
+        self.writer = AsyncWriter(output_file_name, append, sep='\t')
+
+    def write(self, df):
+        # The data of the columns kept in memory as arrays is saved as JSON
+        self.writer.write(df.assign(**{DATA: df[DATA].map(encode_column_data)}))
+
+    def sync(self, func, *args):
+        self.writer.sync(func, *args)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,3 +1,28 @@
+# Variable types of the columns
+CATEG = 'c'
+QUANT = 'q'
+TIME = 't'
+
+var_types_list = [CATEG, QUANT, TIME]
+
+# Data types of the columns, defined here so the scripts that only need their names don't
+# import pandas through data_types
+DINT = 'int'
+DFLOAT = 'float'
+DSTRING = 'string'
+DDATE = 'datetime'
+DBOOL = 'bool'
+
+data_types_list = [DINT, DFLOAT, DSTRING, DDATE, DBOOL]
+
+dtype_to_vtype = {
+    DINT : QUANT,
+    DFLOAT : QUANT,
+    DSTRING : CATEG,
+    DBOOL : CATEG,
+    DDATE : TIME
+}
+
 # Columns of the result dataset
 FID = 'fid'
 FIELD_ID = 'field_id'
@@ -9,7 +34,13 @@ IS_ONLY_YSRC = 'is_only_ysrc'
 DATA = 'data'
 DTYPE = 'dtype'
 LENGTH = 'length'
+APPROXIMATED = 'approximated'
 
 N_XSRC = 'n_xsrc'
 N_YSRC = 'n_ysrc'
 N_TRACES = 'n_traces'
+
+# Columns of the column store index
+DATA_BLOB = 'data_blob'
+DATA_OFFSET = 'data_offset'
+DATA_LENGTH = 'data_length'
@@ -1,33 +1,18 @@
 from datetime import datetime
 from collections.abc import Hashable
+from functools import lru_cache
 import numpy as np
 import random
 import pandas as pd
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    # Only public since pandas 2.2, tests/test_data_types.py checks the guessed formats
+    from pandas._libs.tslibs.parsing import guess_datetime_format
 import warnings
+from constants import CATEG, QUANT, TIME, var_types_list, DINT, DFLOAT, DSTRING, DDATE, DBOOL, data_types_list, dtype_to_vtype
 warnings.filterwarnings(action='ignore')
 
-CATEG = 'c'
-QUANT = 'q'
-TIME = 't'
-
-var_types_list = [CATEG, QUANT, TIME]
-
-DINT = 'int'
-DFLOAT = 'float'
-DSTRING = 'string'
-DDATE = 'datetime'
-DBOOL = 'bool'
-
-data_types_list = [DINT, DFLOAT, DSTRING, DDATE, DBOOL]
-
-dtype_to_vtype = {
-    DINT : QUANT,
-    DFLOAT : QUANT,
-    DSTRING : CATEG,
-    DBOOL : CATEG,
-    DDATE : TIME
-}
-
 dtypes = {
     'bool': DBOOL,
 
@@ -75,7 +60,7 @@ def detect_dtype(elements : list, sample_size=500, confidence=0.01):
 
     try:
         # Try casting to datetime
-        datetime_cast = pd.to_datetime(elements_sample, infer_datetime_format=True, errors='coerce')
+        datetime_cast = to_datetime(elements_sample)
         datetime_errors = datetime_cast.isna().sum()
         if datetime_errors < max_errors: # Matched datetime
             return DDATE
@@ -102,10 +87,9 @@ def cast_dtype(elements : pd.Series, dtype : str, bag=dict()):
     
     if dtype == DDATE:
         try:
-            temp = pd.to_datetime(elements, infer_datetime_format=True, errors='coerce', utc=True)
-            # Cast datetime to milliseconds for more efficient storage and computation
-            temp = [ e.timestamp() if e is not pd.NaT else np.nan for e in temp]
-            return pd.Series(temp), DDATE
+            temp = to_datetime(elements, utc=True)
+            # Cast datetime to seconds for more efficient storage and computation
+            return pd.Series(get_timestamps(temp)), DDATE
         except:
             pass
     
@@ -117,17 +101,58 @@ def cast_dtype(elements : pd.Series, dtype : str, bag=dict()):
     
     # Use bag of words representation for string arrays since it's more efficient
     # for storage and computation speed.
-    temp = []
-    for e in elements:
-        if not e or not isinstance(e, str): 
-            temp.append(np.nan)
-        elif e in bag:
-            temp.append(bag[e])
-        else:
-            bag[e] = len(bag)
-            temp.append(bag[e])
-
-    return pd.Series(temp), DSTRING
+    return pd.Series(get_bag_of_words(elements, bag)), DSTRING
+
+
+def to_datetime(elements, utc=None):
+    # Same as pd.to_datetime inferring the format of the dates. pandas guesses the format from
+    # the first valid element, the guesses are cached so the columns that start with the same
+    # element (e.g. the sample and the whole column) don't parse it again
+    values = pd.Series(elements, dtype=np.dtype('object')).to_numpy()
+    valid = np.flatnonzero(pd.notna(values))
+    date_format = None
+    if len(valid) and isinstance(values[valid[0]], str):
+        date_format = guess_date_format(values[valid[0]])
+    return pd.to_datetime(elements, format=date_format, infer_datetime_format=date_format is not None, errors='coerce', utc=utc)
+
+
+@lru_cache(maxsize=4096)
+def guess_date_format(element):
+    return guess_datetime_format(element)
+
+
+def get_timestamps(datetimes):
+    # Same as Timestamp.timestamp for every element (seconds rounded to microseconds) computed over
+    # the int64 view of the datetimes, NaT is casted to NaN
+    datetimes = pd.DatetimeIndex(datetimes)
+    ns = datetimes.asi8
+    us, rest = np.divmod(ns, 1000)
+    # The dates with microsecond precision are exactly us / 1e6 while the integer is exact as float,
+    # the rest are rounded from the exact division like Timestamp.timestamp
+    exact = (rest == 0) & (np.abs(us) < 2 ** 53)
+    timestamps = np.empty(len(ns))
+    timestamps[exact] = us[exact] / 1e6
+    timestamps[~exact] = [round(e / 10 ** 9, 6) for e in ns[~exact].tolist()]
+    timestamps[np.asarray(datetimes.isna())] = np.nan
+    return timestamps
+
+
+def get_bag_of_words(elements, bag):
+    # Codes of the strings in the bag shared by the columns of a table, new strings are added
+    # to the bag in order of appearance. Empty strings and elements that are not strings are NaN
+    values = pd.Series(elements, dtype=np.dtype('object'))
+    try:
+        codes, uniques = pd.factorize(values)
+    except TypeError:
+        # Unhashable elements (e.g. lists) are not strings
+        values = values.map(lambda e: e if isinstance(e, str) else None)
+        codes, uniques = pd.factorize(values)
+    words = np.array([bag.setdefault(e, len(bag)) if e and isinstance(e, str) else np.nan for e in uniques] + [np.nan])
+    # Missing elements have code -1, the last word
+    temp = words[codes]
+    if not np.isnan(temp).any():
+        temp = temp.astype(np.int64)
+    return temp
 
 
 def fill_dtype(elements : pd.Series , dtype : str):
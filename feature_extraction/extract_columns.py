@@ -1,134 +1,186 @@
 import pandas as pd
 import argparse 
-from utils import load_raw_data 
+from utils import load_raw_data, imap_bounded
 import json
+import random
+from json_columns import iter_table_columns
+from sharding import open_shard, parse_shard
+from multiprocessing import Pool
+from functools import partial
+from column_store import open_columns_writer
+from checkpoint import Checkpoint
 from data_types import detect_dtype, cast_dtype, fill_dtype
 from constants import FID, FIELD_ID, TRACE_TYPE, IS_XSRC,IS_YSRC, IS_ONLY_XSRC, IS_ONLY_YSRC, DTYPE, DATA
-import sys
 
-def extract_columns(input_file_name, output_file_name, verbose=False):
-    header = [FID, FIELD_ID, TRACE_TYPE, IS_XSRC, IS_YSRC, IS_ONLY_XSRC, IS_ONLY_YSRC, DTYPE, DATA ]
-    with open(output_file_name, 'w') as output_file:
-        # just to clean the output file
-        pass
+HEADER = [FID, FIELD_ID, TRACE_TYPE, IS_XSRC, IS_YSRC, IS_ONLY_XSRC, IS_ONLY_YSRC, DTYPE, DATA ]
 
-    with open(input_file_name, 'r') as input_file:
+def extract_columns(input_file_name, output_file_name, verbose=False, workers=1, store=False, resume=False, streaming=False, shard=None):
+    checkpoint = Checkpoint(output_file_name, resume)
+    if checkpoint.finished:
+        print('The columns were already extracted')
+        return
+    checkpoint.restore_outputs()
+
+    # The column store keeps the data as arrays, the TSV file as JSON encoded lists
+    extract_chunk = partial(extract_chunk_columns, encode_data=not store, streaming=streaming)
+
+    with open_shard(input_file_name, shard) as input_file, open_columns_writer(output_file_name, store, checkpoint.resumed) as writer:
         raw_data = load_raw_data(input_file)
         
         print('Raw data loaded...')
 
-        total_chunks = None
-        total_columns = 0
+        total_chunks = checkpoint.chunk
+        total_columns = checkpoint.output_rows
+        input_rows = checkpoint.input_rows
 
 #        with_errors = { 'allenfrostline:14', 'oscjaguar:1'}
 
-        for i, chunk in enumerate(raw_data):
-            total_chunks = i
-            chunk_columns = []
+        if workers > 1:
+            pool = Pool(workers)
+            # Keep a few chunks in flight per worker, results come back in input order
+            chunks_columns = imap_bounded(pool, extract_chunk, checkpoint.skip(raw_data), 2 * workers)
+        else:
+            pool = None
+            chunks_columns = map(extract_chunk, checkpoint.skip(raw_data))
 
-            for chart_num, chart_obj in chunk.iterrows():
-                fid = chart_obj.fid
-                clean_fid = fid.split(':')[0]
-            
-                # Extract columns data from the dataset
+        try:
+            for i, chunk_rows, chunk_columns in chunks_columns:
+                total_chunks = i
 
-                data = json.loads(chart_obj.table_data)
-                columns = list(data.popitem()[1]['cols'].values())
+                df = pd.DataFrame(chunk_columns, columns=HEADER)
+                writer.write(df)
 
-                columns_info = {}
+                if verbose:
+                    print(f'Finished processing chunk {i}, saved {len(chunk_columns)} data columns.') 
                 
-                bag = {}
-                for column in columns:
-                    uid = column['uid']
-                    column_data = list(column['data'])
-
-                    # Infer the data type of the column using a small sample of elements
-                    infered_dtype = detect_dtype(column_data) 
-
-                    # Try to cast the column elements to the infered type, this returns the casted column
-                    # and true_dtype, if the cast to the infered type is successful then infered_dtype == true_dtype
-                    # otherwise true_dtype is a default, in this case string.
-                    column_data, true_dtype = cast_dtype(column_data, infered_dtype, bag) 
-
-                    column_data, success = fill_dtype(column_data, true_dtype) # Fill missing data points
-
-                    column_data = column_data.to_list()
-                    column_data = json.dumps(column_data)
-                    
-                    columns_info[uid] = { 
-                        FID : fid, 
-                        FIELD_ID : f'{clean_fid}:{uid}',
-                        TRACE_TYPE : None,
-                        IS_XSRC : False,
-                        IS_YSRC : False,
-                        IS_ONLY_XSRC: False,
-                        IS_ONLY_YSRC: False,
-                        DTYPE : true_dtype,
-                        DATA : column_data
-                    }
-
-                # Extract columns outputs (i.e trace type, axis, is shared axis)
-                specification = json.loads(chart_obj.chart_data)
-                columns_in_x = []
-                columns_in_y = []
-
-                for trace in specification:
-                    ttype = get_trace_type(trace)
-
-                    try:
-                        xsrc = trace.get('xsrc')
-                    except:
-                        # could not exist in a single axis chart
-                        xsrc = None
-
-                    try:
-                        ysrc = trace.get('ysrc')
-                    except:
-                        # could not exist in a single axis chart
-                        ysrc = None
-
-                    if xsrc:
-                        try:
-                            xsrc = get_src_uid(xsrc)
-                            columns_info[xsrc][IS_XSRC] = True
-                            columns_info[xsrc][TRACE_TYPE] = ttype
-                            columns_in_x.append(xsrc)
-                        except KeyError:
-                            pass
-                    if ysrc:
-                        try:
-                            ysrc = get_src_uid(ysrc)
-                            columns_info[ysrc][IS_YSRC] = True
-                            columns_info[ysrc][TRACE_TYPE] = ttype
-                            columns_in_y.append(ysrc)
-                        except KeyError:
-                            pass
-                
-                if len(columns_in_x) == 1:
-                    columns_info[columns_in_x[0]][IS_ONLY_XSRC] = True
-                if len(columns_in_y) == 1:
-                    columns_info[columns_in_y[0]][IS_ONLY_YSRC] = True
-
-                del specification
+                total_columns += len(chunk_columns)
+                input_rows += chunk_rows
 
-                chunk_columns.extend(list(columns_info.values()))
+                writer.sync(checkpoint.save, i, input_rows, total_columns, writer.output_files)
 
-               
-            df = pd.DataFrame(chunk_columns, columns=header)
-            df.to_csv(output_file_name, mode='a', index=False, header=(i == 0), sep='\t')
-
-            if verbose:
-                print(f'Finished processing chunk {i}, saved {len(chunk_columns)} data columns.') 
-            
-            total_columns += len(chunk_columns)
-
-            del df, chunk_columns
+                del df, chunk_columns
+        finally:
+            if pool:
+                pool.terminate()
 
+        writer.flush()
+        checkpoint.finish()
         print('Finished execution')
         print('Processed chunks: ', total_chunks + 1)
         print('Processed columns: ', total_columns)
 
 
+def extract_chunk_columns(indexed_chunk, encode_data=True, streaming=False):
+    chunk_index, chunk = indexed_chunk
+
+    chunk_columns = []
+    for chart_num, chart_obj in chunk.iterrows():
+        chunk_columns.extend(extract_chart_columns(chart_obj, encode_data, streaming))
+    return chunk_index, len(chunk), chunk_columns
+
+
+def extract_chart_columns(chart_obj, encode_data=True, streaming=False):
+    fid = chart_obj.fid
+    clean_fid = fid.split(':')[0]
+
+    # detect_dtype samples long columns, seed by chart so the serial, parallel and sharded runs
+    # infer the same types
+    random.seed(fid)
+
+    # Extract columns data from the dataset. When streaming the columns are decoded one at a
+    # time, otherwise the whole table data is decoded and every column frees its data once cast
+
+    if streaming:
+        columns = iter_table_columns(chart_obj.table_data)
+    else:
+        columns = list(json.loads(chart_obj.table_data).popitem()[1]['cols'].values())
+
+    columns_info = {}
+    
+    # The bag of words is shared only by the columns of the same table
+    bag = {}
+    for column in columns:
+        uid = column['uid']
+        column_data, true_dtype = cast_column(list(column.pop('data')), bag)
+
+        if encode_data:
+            column_data = column_data.to_list()
+            column_data = json.dumps(column_data)
+        else:
+            column_data = column_data.to_numpy()
+        
+        columns_info[uid] = { 
+            FID : fid, 
+            FIELD_ID : f'{clean_fid}:{uid}',
+            TRACE_TYPE : None,
+            IS_XSRC : False,
+            IS_YSRC : False,
+            IS_ONLY_XSRC: False,
+            IS_ONLY_YSRC: False,
+            DTYPE : true_dtype,
+            DATA : column_data
+        }
+
+    # Extract columns outputs (i.e trace type, axis, is shared axis)
+    specification = json.loads(chart_obj.chart_data)
+    columns_in_x = []
+    columns_in_y = []
+
+    for trace in specification:
+        ttype = get_trace_type(trace)
+
+        try:
+            xsrc = trace.get('xsrc')
+        except:
+            # could not exist in a single axis chart
+            xsrc = None
+
+        try:
+            ysrc = trace.get('ysrc')
+        except:
+            # could not exist in a single axis chart
+            ysrc = None
+
+        if xsrc:
+            try:
+                xsrc = get_src_uid(xsrc)
+                columns_info[xsrc][IS_XSRC] = True
+                columns_info[xsrc][TRACE_TYPE] = ttype
+                columns_in_x.append(xsrc)
+            except KeyError:
+                pass
+        if ysrc:
+            try:
+                ysrc = get_src_uid(ysrc)
+                columns_info[ysrc][IS_YSRC] = True
+                columns_info[ysrc][TRACE_TYPE] = ttype
+                columns_in_y.append(ysrc)
+            except KeyError:
+                pass
+    
+    if len(columns_in_x) == 1:
+        columns_info[columns_in_x[0]][IS_ONLY_XSRC] = True
+    if len(columns_in_y) == 1:
+        columns_info[columns_in_y[0]][IS_ONLY_YSRC] = True
+
+    del specification
+
+    return list(columns_info.values())
+
+
+def cast_column(column_data, bag):
+    # Infer the data type of the column using a small sample of elements
+    infered_dtype = detect_dtype(column_data) 
+
+    # Try to cast the column elements to the infered type, this returns the casted column
+    # and true_dtype, if the cast to the infered type is successful then infered_dtype == true_dtype
+    # otherwise true_dtype is a default, in this case string.
+    column_data, true_dtype = cast_dtype(column_data, infered_dtype, bag) 
+
+    column_data, success = fill_dtype(column_data, true_dtype) # Fill missing data points
+    return column_data, true_dtype
+
+
 def get_trace_type(trace):
     try:
         ttype = trace.get('type')
@@ -159,10 +211,15 @@ if __name__ == '__main__':
     parser.add_argument('-i', required=True, help='Input file path')
     parser.add_argument('-o', required=True, help='Output file path')
     parser.add_argument('-v', help='Verbose option', action='store_const', const=True, default=False)
+    parser.add_argument('--store', help='Save the columns in a column store directory instead of a TSV file', action='store_const', const=True, default=False)
+    parser.add_argument('--resume', help='Resume a previous run from its last checkpoint', action='store_const', const=True, default=False)
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to extract the chunks')
+    parser.add_argument('--streaming', help='Decode the table data of a chart one column at a time to bound the memory of large charts', action='store_const', const=True, default=False)
+    parser.add_argument('--shard', type=parse_shard, help='Extract only the charts of the shard i of N of the raw corpus, as i/N')
 
     args = parser.parse_args()
 
     input_file_name = args.i
     output_file_name =args.o
 
-    extract_columns(input_file_name, output_file_name, verbose=args.v)
+    extract_columns(input_file_name, output_file_name, verbose=args.v, workers=args.workers, store=args.store, resume=args.resume, streaming=args.streaming, shard=args.shard)
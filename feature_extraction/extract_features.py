@@ -1,84 +1,270 @@
-from single_column_features import get_single_column_features, single_column_features_names
-from pairwise_column_features import get_pairwise_column_features, pairwise_column_features_names
+from single_column_features import get_single_column_features_batch, get_single_column_features_sketch, single_column_features_names, single_column_features_version, sketch_chunk_size
+from pairwise_column_features import ColumnProfile, get_profiles_pairwise_features, pairwise_column_features_names, pairwise_column_features_version
+import numpy as np
 import pandas as pd
-from utils import load_raw_data
-import json
-from constants import FID, FIELD_ID, TRACE_TYPE, DATA, DTYPE, IS_XSRC, IS_YSRC
+from column_store import open_columns
+from column_records import ColumnTable, iter_column_records
+from utils import imap_bounded
+from constants import FID, FIELD_ID, TRACE_TYPE, IS_XSRC, IS_YSRC, APPROXIMATED
 import argparse
-import numpy as np
 from itertools import combinations
+from multiprocessing import Pool
+from checkpoint import Checkpoint, prepare_output
+from async_writer import AsyncWriter
+from profiling import enable_profiling, is_profiling_enabled, collect_stats, merge_stats, get_profiling_report, profile_call
+import cProfile
+from feature_cache import open_feature_cache, get_features_version, get_column_hash, get_single_column_key, get_pairwise_column_key
+from bounded_memory import bound_column, bound_table, parse_max_column_length, parse_max_table_size
+from sharding import parse_shard
 
-single_column_features_header = [FID, FIELD_ID, TRACE_TYPE, IS_XSRC, IS_YSRC] + single_column_features_names
-pairwise_column_features_header = [FID, 'a_field_id', 'b_field_id'] + pairwise_column_features_names
+# The features of the rows marked as approximated were computed on a sample of the rows of their
+# column or table, see bounded_memory
+single_column_features_header = [FID, FIELD_ID, TRACE_TYPE, IS_XSRC, IS_YSRC] + single_column_features_names + [APPROXIMATED]
+pairwise_column_features_header = [FID, 'a_field_id', 'b_field_id'] + pairwise_column_features_names + [APPROXIMATED]
 
-def extract_single_column_features(input_file_name, output_file_name):
-    with open(output_file_name, 'w') as f:
-        pass
+def extract_single_column_features(input_file_name, output_file_name, resume=False, cache_file_name=None, cache_size=1024 * 1024 * 1024, max_column_length=None,
+        sketch_threshold=None, sketch_error=0.01, shard=None):
+    checkpoint = Checkpoint(output_file_name, resume)
+    if checkpoint.finished:
+        print(f'Single column features were already extracted to {output_file_name}')
+        return
+    prepare_output(output_file_name, checkpoint)
     print(f'Extracting single column features from {input_file_name}')
-    with open(input_file_name, 'r') as f:
-        data = load_raw_data(f,chunk_size=1000)
-        for i, chunk in enumerate(data):
-            chunk_features = []
-            for index, column in chunk.iterrows():
-                column_data = json.loads(column[DATA])
-                column_data = np.array(column_data)
-                column_output = [column[FID], column[FIELD_ID], column[TRACE_TYPE], column[IS_XSRC], column[IS_YSRC]]
-                features = column_output + get_single_column_features(column_data, column[DTYPE])
-                chunk_features.append(features)
-            df = pd.DataFrame(chunk_features, columns=single_column_features_header)
-            df.to_csv(output_file_name, mode='a', index=False, header=(i == 0))
-            print(f'finished processing chunk {i}, extracted features from {len(chunk_features)} columns.')
-
-
-def extract_pairwise_column_features(input_file_name, output_file_name):
-    with open(output_file_name, 'w') as f:
-        pass
+    with open_columns(input_file_name, chunk_size=1000, shard=shard) as data, open_feature_cache(cache_file_name, cache_size) as cache, AsyncWriter(output_file_name, append=True) as writer:
+        input_rows = checkpoint.input_rows
+        output_rows = checkpoint.output_rows
+        for i, chunk in checkpoint.skip(data):
+            df = extract_chunk_single_column_features(chunk, cache, max_column_length, sketch_threshold, sketch_error)
+            writer.write(df)
+            print(f'finished processing chunk {i}, extracted features from {len(df)} columns.')
+
+            input_rows += len(chunk)
+            output_rows += len(df)
+            if cache:
+                cache.commit()
+            writer.sync(checkpoint.save, i, input_rows, output_rows, [output_file_name])
+        writer.flush()
+        checkpoint.finish()
+        if cache:
+            print(cache.summary())
+
+
+def extract_chunk_single_column_features(chunk, cache=None, max_column_length=None, sketch_threshold=None, sketch_error=0.01):
+    return extract_records_single_column_features(list(iter_column_records(chunk)), cache, max_column_length, sketch_threshold, sketch_error)
+
+
+def extract_records_single_column_features(records, cache=None, max_column_length=None, sketch_threshold=None, sketch_error=0.01):
+    # records is a list of ColumnRecord. The columns longer than sketch_threshold are
+    # approximated with sketches instead of being sampled to max_column_length
+    version = get_features_version(single_column_features_version, single_column_features_names)
+    sketch_version = f'{version}.sketch{sketch_error}'
+    chunk_features = []
+    chunk_data = []
+    chunk_sketched = []
+    chunk_approximated = []
+    for column in records:
+        column_data = column.data
+        sketched = _use_sketch(column_data, sketch_threshold)
+        approximated = sketched
+        if not sketched:
+            column_data, approximated = bound_column(column_data, max_column_length)
+        chunk_data.append(column_data)
+        chunk_sketched.append(sketched)
+        chunk_approximated.append(approximated)
+        column_output = [column.fid, column.field_id, column.trace_type, column.is_xsrc, column.is_ysrc]
+        chunk_features.append(column_output)
+
+    # Columns are computed in batches of the same dtype and similar length to limit the padding,
+    # the columns with their features in the cache are not computed again
+    batches = {}
+    keys = [None] * len(chunk_data)
+    for j, (column_data, dtype, sketched) in enumerate(zip(chunk_data, [column.dtype for column in records], chunk_sketched)):
+        if cache:
+            keys[j] = get_single_column_key(get_column_hash(column_data, dtype), sketch_version if sketched else version)
+            features = cache.get(keys[j])
+            if features is not None:
+                chunk_features[j] = chunk_features[j] + features
+                continue
+        if sketched:
+            features = profile_call('sketch', dtype, get_single_column_features_sketch, column_data, dtype, sketch_error, elements=len(column_data))
+            chunk_features[j] = chunk_features[j] + features
+            if cache:
+                cache.put(keys[j], features)
+            continue
+        batches.setdefault((dtype, len(column_data).bit_length()), []).append(j)
+    for (dtype, _), batch in batches.items():
+        batch_features = get_single_column_features_batch([chunk_data[j] for j in batch], dtype)
+        for j, features in zip(batch, batch_features):
+            chunk_features[j] = chunk_features[j] + features
+            if cache:
+                cache.put(keys[j], features)
+    chunk_features = [features + [approximated] for features, approximated in zip(chunk_features, chunk_approximated)]
+    df = pd.DataFrame(chunk_features, columns=single_column_features_header)
+    # Only the statistics of a sampled column are approximated, its length is the length of
+    # all its rows
+    df['length'] = [len(column.data) for column in records]
+    return df
+
+
+def _use_sketch(column_data, sketch_threshold):
+    # The sketches need finite values, the long columns with missing values are computed exactly
+    if sketch_threshold is None or len(column_data) <= sketch_threshold:
+        return False
+    return all(np.isfinite(column_data[start:start + sketch_chunk_size]).all() for start in range(0, len(column_data), sketch_chunk_size))
+
+
+def extract_pairwise_column_features(input_file_name, output_file_name, workers=1, pairs_per_task=1000, resume=False, cache_file_name=None, cache_size=1024 * 1024 * 1024,
+        max_column_length=None, max_table_size=None, shard=None):
+    checkpoint = Checkpoint(output_file_name, resume)
+    if checkpoint.finished:
+        print(f'Pairwise column features were already extracted to {output_file_name}')
+        return
+    prepare_output(output_file_name, checkpoint)
     print(f'Extracting pairwise column features from {input_file_name}')
-    with open(input_file_name, 'r') as f:
-        data = load_raw_data(f)
-        current_fid = None
-        table_columns = []
+    with open_columns(input_file_name, shard=shard) as data, open_feature_cache(cache_file_name, cache_size) as cache, AsyncWriter(output_file_name, append=True) as writer:
+        tables = _load_tables(checkpoint.skip(data), checkpoint.input_rows)
+        pool = Pool(workers) if workers > 1 else None
+
         tables_processed = 0
-        for i, chunk in enumerate(data):
-
-            for row in chunk.iterrows():
-                column = row[1]
-
-                if current_fid != column[FID]:
-
-                    if current_fid:            
-                        _extract_pairwise_column_features(output_file_name, current_fid, table_columns, tables_processed == 0)
-                        table_columns = []
-                        tables_processed += 1
-
-                    current_fid = column[FID]
-                
-                column[DATA] = np.array(json.loads(column[DATA]))
-                table_columns.append(column)
-            print(f'Finished processing chunk {i}')
-        if table_columns:
-            _extract_pairwise_column_features(output_file_name, current_fid, table_columns, tables_processed == 0)
-            tables_processed += 1
+        output_rows = checkpoint.output_rows
+        try:
+            for table_fid, table_position, table_pairwise_features in extract_tables_pairwise_column_features(tables, pairs_per_task, cache, pool, 2 * workers,
+                    max_column_length, max_table_size):
+                output_rows += _save_pairwise_column_features(writer, table_pairwise_features, table_position, output_rows, checkpoint, cache)
+                tables_processed += 1
+        finally:
+            if pool:
+                pool.terminate()
+        writer.flush()
+        checkpoint.finish()
         print(f'Finished, processed a total of {tables_processed} tables')
+        if cache:
+            print(cache.summary())
+
 
+def extract_tables_pairwise_column_features(tables, pairs_per_task=1000, cache=None, pool=None, max_pending=2, max_column_length=None, max_table_size=None):
+    # Yields the pairwise column features of each table, tables is an iterable of ColumnTable
+    # and the position of a table is passed through. With a pool the tasks
+    # are computed by its processes, with at most max_pending tasks in flight
+    tasks = _split_pairwise_tasks(tables, pairs_per_task, cache, max_column_length, max_table_size)
+    if pool:
+        # The number of tasks in flight is bounded so the reader doesn't get too far ahead
+        # of the workers, the results come back in input order
+        results = imap_bounded(pool, _extract_pairwise_column_features, tasks, max_pending)
+    else:
+        results = map(_extract_pairwise_column_features, tasks)
 
-def _extract_pairwise_column_features(output_file_name, table_fid, table_columns, header):
+    # The results of the tasks of the same table are merged
+    current_fid = None
+    current_position = None
     table_pairwise_features = []
-    for a, b in combinations(table_columns, 2):
+    for table_fid, table_position, task_pairwise_features, task_stats in results:
+        # The profiling stats of the tasks computed by other processes are merged in this process
+        merge_stats(task_stats)
+        if current_fid != table_fid:
+            if current_fid:
+                yield current_fid, current_position, _merge_pairwise_column_features(table_pairwise_features, cache)
+                table_pairwise_features = []
+            current_fid = table_fid
+            current_position = table_position
+        table_pairwise_features.extend(task_pairwise_features)
+    if current_fid:
+        yield current_fid, current_position, _merge_pairwise_column_features(table_pairwise_features, cache)
+
+
+def _merge_pairwise_column_features(table_pairwise_features, cache=None):
+    # The features come with the index of their pair in the table, and the cache key when they
+    # were computed by the task
+    table_pairwise_features.sort(key=lambda pair_features: pair_features[0])
+    if cache:
+        for _, key, row in table_pairwise_features:
+            if key:
+                cache.put(key, row[3:-1])
+    return [row for _, _, row in table_pairwise_features]
+
+
+def _save_pairwise_column_features(writer, table_pairwise_features, table_position, output_rows, checkpoint, cache=None):
+    # The checkpoint is saved by the writer once the features are on disk, after the cache
+    # has the features of the table
+    df = pd.DataFrame(table_pairwise_features, columns=pairwise_column_features_header)
+    writer.write(df)
+
+    if cache:
+        cache.commit()
+    chunk, input_rows = table_position
+    writer.sync(checkpoint.save, chunk, input_rows, output_rows + len(df), [writer.output_file_name])
+    return len(df)
+
+
+def _load_tables(data, input_rows=0):
+    # Groups the columns, sorted by FID, in tables. Each table comes with its position in the
+    # input: the chunk and the number of input rows read after its last column
+    table = None
+    for i, chunk in data:
+
+        for column in iter_column_records(chunk):
+
+            if table is None or table.fid != column.fid:
+
+                if table is not None:
+                    yield table
+
+                table = ColumnTable(column.fid, [])
+
+            table.columns.append(column)
+            input_rows += 1
+            table.position = (i, input_rows)
+        print(f'Finished processing chunk {i}')
+    if table is not None:
+        yield table
+
+
+def _split_pairwise_tasks(tables, pairs_per_task, cache=None, max_column_length=None, max_table_size=None):
+    # The pairs of wide tables are split in several tasks, each task only carries
+    # the columns used by its pairs. The pairs with their features in the cache are
+    # not computed again, they go with the first task of the table. The tables over
+    # the limits are sampled before, so only the samples are sent to the tasks
+    version = get_features_version(pairwise_column_features_version, pairwise_column_features_names)
+    for table in tables:
+        table_fid, table_position = table.fid, table.position
+        table_columns, approximated = bound_table(table.columns, max_column_length, max_table_size)
+        if cache:
+            hashes = [get_column_hash(column.data, column.dtype) for column in table_columns]
+        pairs = []
+        cached_pairwise_features = []
+        for p, (a, b) in enumerate(combinations(range(len(table_columns)), 2)):
+            key = None
+            if cache:
+                key = get_pairwise_column_key(hashes[a], hashes[b], version)
+                features = cache.get(key)
+                if features is not None:
+                    row = [table_fid, table_columns[a].field_id, table_columns[b].field_id] + features + [approximated]
+                    cached_pairwise_features.append((p, None, row))
+                    continue
+            pairs.append((p, a, b, key))
+        for start in range(0, max(len(pairs), 1), pairs_per_task):
+            task_pairs = pairs[start:start + pairs_per_task]
+            task_columns = dict([(j, table_columns[j]) for _, a, b, _ in task_pairs for j in (a, b)])
+            yield table_fid, table_position, task_columns, task_pairs, cached_pairwise_features if start == 0 else [], approximated
+
+
+def _extract_pairwise_column_features(task):
+    table_fid, table_position, table_columns, pairs, cached_pairwise_features, approximated = task
+    table_pairwise_features = list(cached_pairwise_features)
+    # The uniques, codes, sorted copies and ranges of the columns are computed once for all
+    # the pairs of the task
+    profiles = dict([(j, ColumnProfile(column.data, column.dtype)) for j, column in table_columns.items()])
+    for p, a, b, key in pairs:
         pairwise_features = [
             table_fid,
-            a[FIELD_ID],
-            b[FIELD_ID]
+            table_columns[a].field_id,
+            table_columns[b].field_id
         ]
-        
-        a_data, a_dtype = a[DATA], a[DTYPE]
-        b_data, b_dtype = b[DATA], b[DTYPE]
-
-        pairwise_features += get_pairwise_column_features(a_data, b_data, a_dtype, b_dtype)
-        table_pairwise_features.append(pairwise_features)
-    df = pd.DataFrame(table_pairwise_features, columns=pairwise_column_features_header)
-    df.to_csv(output_file_name, mode='a', index=False, header=header)
 
+        pairwise_features += get_profiles_pairwise_features(profiles[a], profiles[b])
+        pairwise_features.append(approximated)
+        table_pairwise_features.append((p, key, pairwise_features))
+    return table_fid, table_position, table_pairwise_features, collect_stats()
 
 
 if __name__ == '__main__':
@@ -87,6 +273,18 @@ if __name__ == '__main__':
     parser.add_argument('-i', required=True, help='Input file path')
     parser.add_argument('-os', help='Output file path for single column features')
     parser.add_argument('-op', help='Output file path for pairwise column features')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to extract the pairwise column features')
+    parser.add_argument('--resume', help='Resume a previous run from its last checkpoint', action='store_const', const=True, default=False)
+    parser.add_argument('--pairs-per-task', type=int, default=1000, help='Maximum number of column pairs of a table processed by a single task')
+    parser.add_argument('--cache', help='Path of the feature cache, the features of columns already in the cache are not computed again')
+    parser.add_argument('--profile', help='Report the time spent in every group of features by dtype', action='store_const', const=True, default=False)
+    parser.add_argument('--profile-out', help='Output file path for the cProfile stats of the extraction (of the main process), implies --profile')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Maximum size of the feature cache in MB')
+    parser.add_argument('--max-column-length', type=parse_max_column_length, help='Maximum number of elements of a column, the features of longer columns are computed on a sample')
+    parser.add_argument('--max-table-size', type=parse_max_table_size, help='Maximum size in MB of the columns of a table for the pairwise column features, the features of larger tables are computed on a sample')
+    parser.add_argument('--sketch-threshold', type=int, help='Columns longer than this number of elements get their single column features approximated with sketches')
+    parser.add_argument('--sketch-error', type=float, default=0.01, help='Relative error of the quantile and distinct count sketches')
+    parser.add_argument('--shard', type=parse_shard, help='Extract only the features of the columns of the shard i of N of the input, as i/N')
 
     args = parser.parse_args()
     if not args.os and not args.op:
@@ -95,8 +293,24 @@ if __name__ == '__main__':
 
     input_file_name = args.i
     
+    if args.profile or args.profile_out:
+        enable_profiling()
+    profiler = cProfile.Profile() if args.profile_out else None
+    if profiler:
+        profiler.enable()
+
+    cache_size = args.cache_size * 1024 * 1024
+    max_table_size = args.max_table_size * 1024 * 1024 if args.max_table_size else None
     if args.os:
-        extract_single_column_features(input_file_name, args.os)
+        extract_single_column_features(input_file_name, args.os, resume=args.resume, cache_file_name=args.cache, cache_size=cache_size,
+            max_column_length=args.max_column_length, sketch_threshold=args.sketch_threshold, sketch_error=args.sketch_error, shard=args.shard)
     if args.op:
-        extract_pairwise_column_features(input_file_name, args.op)
+        extract_pairwise_column_features(input_file_name, args.op, workers=args.workers, pairs_per_task=args.pairs_per_task, resume=args.resume, cache_file_name=args.cache, cache_size=cache_size,
+            max_column_length=args.max_column_length, max_table_size=max_table_size, shard=args.shard)
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile_out)
+    if is_profiling_enabled():
+        print(get_profiling_report())
 
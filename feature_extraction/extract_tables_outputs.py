@@ -1,112 +1,142 @@
-from utils import load_raw_data
+from column_store import open_columns, decode_column_data
+from column_records import iter_column_records
 import argparse
-from constants import FID, TRACE_TYPE, IS_XSRC,IS_YSRC, N_TRACES, N_XSRC, N_YSRC, DATA, DTYPE, LENGTH
+from constants import FID, TRACE_TYPE, N_TRACES, N_XSRC, N_YSRC, LENGTH
 from data_types import DSTRING, DINT, DFLOAT, DBOOL, DDATE
 import pandas as pd
-import json
+from checkpoint import Checkpoint, prepare_output
+from async_writer import AsyncWriter
+from sharding import parse_shard
 
+TABLES_HEADER = [FID, TRACE_TYPE, N_TRACES, N_XSRC, N_YSRC, LENGTH]
 
-def extract_tables_outputs(input_file_name, output_file_name):
-    with open(output_file_name, 'w') as f:
-        pass
 
-    with open(input_file_name, 'r') as f:
-        raw_data = load_raw_data(f, chunk_size=500)
+def extract_tables_outputs(input_file_name, output_file_name, resume=False, shard=None):
+    checkpoint = Checkpoint(output_file_name, resume)
+    if checkpoint.finished:
+        print('The tables outputs were already extracted')
+        return
+    prepare_output(output_file_name, checkpoint)
+
+    with open_columns(input_file_name, chunk_size=500, shard=shard) as raw_data, AsyncWriter(output_file_name, append=True) as writer:
 
         current_fid = None # The current table 
         table_error = False # A True value indicates that a column in the table has an error
         table_info = None # Information about the table
+        table_start = checkpoint.input_rows # Input row of the first column of the current table
+        input_rows = checkpoint.input_rows
+        output_rows = checkpoint.output_rows
 
-        for i, chunk in enumerate(raw_data):
+        for i, chunk in checkpoint.skip(raw_data):
             chunk_datasets = []
 
-            for row in chunk.iterrows():
-                column = row[1]
+            # The data is decoded by add_table_column, only for the columns of the tables
+            # without errors
+            for row_number, column in enumerate(iter_column_records(chunk, decode=False), input_rows):
 
                 # All columns are sorted by FID 
                 
-                if current_fid != column[FID]: # Founded new table
+                if current_fid != column.fid: # Founded new table
                     
                     if table_info and not table_error: 
                         # Save the results of the processed table
                         chunk_datasets.append(list(table_info.values()))
 
                     # Setup for the new table
-                    current_fid = column[FID] 
-                    table_info = {
-                        FID : column[FID],
-                        TRACE_TYPE : column[TRACE_TYPE],
-                        N_TRACES : 0,
-                        N_XSRC : 0,
-                        N_YSRC : 0,
-                        LENGTH : None
-                    }
+                    current_fid = column.fid 
+                    table_start = row_number
+                    table_info = new_table_info(column)
                     table_error = False
 
                 if table_error:
                     continue # skip the columns until a new table is found
-    
-                # Exclusion criteria for tables
-
-                # Has a column that is used in both axis at the same time or is not used at all
-                if (column[IS_XSRC] and column[IS_YSRC]) or (not column[IS_XSRC] and not column[IS_YSRC]) :
-                    table_error = True
-
-                # The chart of the table has multiple trace types, this is a relaxation of the problem
-                if column[TRACE_TYPE] != table_info[TRACE_TYPE]:
-                    table_error = True
-
-                # Account for errors during the extraction of the column data
-                data = column[DATA]
-                if data is None:
-                    table_error = True
-                    continue
-
-                try: 
-                    data = json.loads(data)
-                except Exception as e:
-                    table_error = True
-                    continue
-                
 
-                if len(data) < 2:
-                    table_error = True
-                    continue
-                
-                # All data columns in a chart must have the same dimension.
-                if table_info[LENGTH] is None:
-                    table_info[LENGTH] = len(data)
-                elif table_info[LENGTH] != len(data):
-                    table_error = True
-                    continue
-                
+                table_error = not add_table_column(table_info, column)
 
-                table_info[N_TRACES] += 1
-                if column[IS_XSRC]:
-                    table_info[N_XSRC] += 1
-                if column[IS_YSRC]:
-                    table_info[N_YSRC] += 1
-                
-                # The chart of the table must have a single column on the x-axis
-                if table_info[N_XSRC] > 1:
-                    table_error = True
+            writer.write(pd.DataFrame(chunk_datasets, columns=TABLES_HEADER))
 
-            df = pd.DataFrame(chunk_datasets, columns=[FID, TRACE_TYPE, N_TRACES, N_XSRC, N_YSRC, LENGTH])
-            df.to_csv(output_file_name, mode='a', index=False, header=(i == 0))
+            # The current table could continue in the next chunk, a resumed run reads it again
+            input_rows += len(chunk)
+            output_rows += len(chunk_datasets)
+            writer.sync(checkpoint.save, i, table_start, output_rows, [output_file_name])
 
         if not table_error: # check the last table :)
-            df = pd.DataFrame([list(table_info.values())], columns=[FID, TRACE_TYPE, N_TRACES, N_XSRC, N_YSRC, LENGTH])
-            df.to_csv(output_file_name, mode='a', index=False, header=False)
+            writer.write(pd.DataFrame([list(table_info.values())], columns=TABLES_HEADER))
+
+    checkpoint.finish()
+
+
+def new_table_info(column):
+    # Information about the table of the column
+    return {
+        FID : column.fid,
+        TRACE_TYPE : column.trace_type,
+        N_TRACES : 0,
+        N_XSRC : 0,
+        N_YSRC : 0,
+        LENGTH : None
+    }
+
+
+def add_table_column(table_info, column):
+    # Accounts the column, a ColumnRecord, in the information of its table, returns False
+    # when the column has an error and the table must be excluded
+
+    # Exclusion criteria for tables
+
+    # Has a column that is used in both axis at the same time or is not used at all
+    if (column.is_xsrc and column.is_ysrc) or (not column.is_xsrc and not column.is_ysrc) :
+        return False
+
+    # The chart of the table has multiple trace types, this is a relaxation of the problem
+    if column.trace_type != table_info[TRACE_TYPE]:
+        return False
+
+    # Account for errors during the extraction of the column data
+    data = column.data
+    if data is None:
+        return False
+
+    try: 
+        # The data that is not an array, e.g. a missing field, has no length
+        length = len(decode_column_data(data))
+    except Exception:
+        return False
+    
+
+    if length < 2:
+        return False
+    
+    # All data columns in a chart must have the same dimension.
+    if table_info[LENGTH] is None:
+        table_info[LENGTH] = length
+    elif table_info[LENGTH] != length:
+        return False
+    
+
+    table_info[N_TRACES] += 1
+    if column.is_xsrc:
+        table_info[N_XSRC] += 1
+    if column.is_ysrc:
+        table_info[N_YSRC] += 1
+    
+    # The chart of the table must have a single column on the x-axis
+    if table_info[N_XSRC] > 1:
+        return False
+
+    return True
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', required=True, help='Input file path')
     parser.add_argument('-o', required=True, help='Output file path')
+    parser.add_argument('--resume', help='Resume a previous run from its last checkpoint', action='store_const', const=True, default=False)
+    parser.add_argument('--shard', type=parse_shard, help='Extract only the outputs of the tables of the shard i of N of the columns, as i/N')
 
     args = parser.parse_args()
 
     input_file_name = args.i
     output_file_name = args.o
     
-    extract_tables_outputs(input_file_name, output_file_name)
+    extract_tables_outputs(input_file_name, output_file_name, resume=args.resume, shard=args.shard)
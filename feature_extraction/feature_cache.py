@@ -0,0 +1,106 @@
+import sqlite3
+import pickle
+import hashlib
+import numpy as np
+from contextlib import nullcontext
+
+# On disk cache of the features of the columns, the entries are keyed by a hash of the content
+# of the columns (dtype and data) and the version of the feature set, so the charts that share
+# their data only compute the features once. When the cache grows past its maximum size the
+# least recently used entries are evicted.
+
+
+class FeatureCache:
+
+    def __init__(self, file_name, max_size=1024 * 1024 * 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.connection = sqlite3.connect(file_name)
+        # The features can always be computed again, so the cache doesn't wait for the disk on commits
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+        self.size, self.clock = self.connection.execute('SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM entries').fetchone()
+        self.used = []
+
+    def get(self, key):
+        row = self.connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        self.used.append((self.clock, key))
+        return pickle.loads(row[0])
+
+    def put(self, key, features):
+        value = pickle.dumps(features)
+        self.clock += 1
+        previous = self.connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        if previous:
+            self.size -= previous[0]
+        self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', (key, value, len(value), self.clock))
+        self.size += len(value)
+        if self.size > self.max_size:
+            self._evict()
+
+    def _evict(self):
+        # Removes the least recently used entries until the cache is 10% below its maximum size
+        self._update_last_used()
+        target = 0.9 * self.max_size
+        for key, size in self.connection.execute('SELECT key, size FROM entries ORDER BY last_used').fetchall():
+            if self.size <= target:
+                break
+            self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.size -= size
+            self.evictions += 1
+
+    def _update_last_used(self):
+        self.connection.executemany('UPDATE entries SET last_used = ? WHERE key = ?', self.used)
+        self.used = []
+
+    def commit(self):
+        self._update_last_used()
+        self.connection.commit()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def summary(self):
+        return f'Feature cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, {self.size / 1024 / 1024:.1f} MB'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_feature_cache(file_name, max_size):
+    # The cache is optional, without a file name there is no cache
+    if file_name:
+        return FeatureCache(file_name, max_size)
+    return nullcontext()
+
+
+def get_column_hash(data, dtype):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{dtype}:{data.dtype.str}:'.encode())
+    h.update(np.ascontiguousarray(data))
+    return h.hexdigest()
+
+
+def get_features_version(version, names):
+    # Adding, removing or renaming features also changes the version
+    return f'{version}.' + hashlib.blake2b(','.join(names).encode(), digest_size=4).hexdigest()
+
+
+def get_single_column_key(column_hash, version):
+    return f'single:{version}:{column_hash}'
+
+
+def get_pairwise_column_key(a_hash, b_hash, version):
+    return f'pairwise:{version}:{a_hash}:{b_hash}'
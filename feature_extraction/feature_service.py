@@ -0,0 +1,415 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+from queue import Queue, Empty
+from extract_columns import cast_column, HEADER
+from extract_features import extract_chunk_single_column_features, extract_tables_pairwise_column_features, pairwise_column_features_header
+from aggregate_features import aggregate_chunk_features, get_aggregated_features_header, get_tables_starts
+from single_column_features import all_single_features_list
+from pairwise_column_features import all_pairwise_features_list
+from feature_cache import open_feature_cache
+from column_records import iter_column_records, iter_tables
+from bounded_memory import parse_max_column_length, parse_max_table_size
+from constants import FID, APPROXIMATED
+
+# Long-lived service that returns the aggregated features of a table, for the tables that are
+# not in a corpus file. The modules are imported once and the tables are computed in memory by
+# the same functions as the pipeline, so a table gets the same features as in the outputs of
+# aggregate_features. The requests that arrive together are computed in batches by a single
+# thread, and the latency of every request is recorded for the /metrics endpoint.
+
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+single_header = get_aggregated_features_header(all_single_features_list)
+pairwise_header = get_aggregated_features_header(all_pairwise_features_list)
+# Names of the features of the vector returned for a table, the single column features first
+feature_names = single_header[1:-1] + pairwise_header[1:-1]
+
+
+class InvalidTable(ValueError):
+    pass
+
+
+class LatencyMetrics:
+    # Latencies of the last requests, in seconds from the arrival of the request to its
+    # response, and the sizes of the batches
+
+    def __init__(self, window=10000, target_p50=None, target_p99=None):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_tables = 0
+        self.target_p50 = target_p50
+        self.target_p99 = target_p99
+
+    def add_request(self, seconds, error=False):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.errors += error
+
+    def add_batch(self, size):
+        with self.lock:
+            self.batches += 1
+            self.batched_tables += size
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            summary = {
+                'requests' : self.requests,
+                'errors' : self.errors,
+                'batches' : self.batches,
+                'mean_batch_size' : self.batched_tables / self.batches if self.batches else None
+            }
+        # Milliseconds over the last requests
+        if len(latencies):
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+            summary['latency_ms'] = {'p50' : p50, 'p90' : p90, 'p99' : p99, 'max' : latencies.max() * 1000}
+        else:
+            summary['latency_ms'] = dict.fromkeys(['p50', 'p90', 'p99', 'max'])
+        summary['target_ms'] = {'p50' : self.target_p50, 'p99' : self.target_p99}
+        summary['within_target'] = is_within_target(summary['latency_ms'], self.target_p50, self.target_p99)
+        return summary
+
+
+def is_within_target(latency_ms, target_p50=None, target_p99=None):
+    # None when there are no targets or no requests yet
+    if (target_p50 is None and target_p99 is None) or latency_ms['p50'] is None:
+        return None
+    return bool((target_p50 is None or latency_ms['p50'] <= target_p50) and (target_p99 is None or latency_ms['p99'] <= target_p99))
+
+
+class FeatureService:
+    # Computes the features of the tables submitted from any thread. A table is a dict with
+    # the name of each column and the list of its elements, in the order of the columns
+
+    def __init__(self, batch_size=16, batch_wait=0.002, workers=1, pairs_per_task=1000, cache_file_name=None, cache_size=1024 * 1024 * 1024,
+            max_column_length=None, max_table_size=None, sketch_threshold=None, sketch_error=0.01, metrics=None):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.pairs_per_task = pairs_per_task
+        self.cache_file_name = cache_file_name
+        self.cache_size = cache_size
+        self.max_column_length = max_column_length
+        self.max_table_size = max_table_size
+        self.sketch_threshold = sketch_threshold
+        self.sketch_error = sketch_error
+        self.metrics = metrics if metrics is not None else LatencyMetrics()
+        self.workers = workers
+        self.pool = Pool(workers) if workers > 1 else None
+        self.requests = Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, table, fid=None):
+        # Returns a future with the features of the table, the latency counts from now
+        future = Future()
+        self.requests.put((time.perf_counter(), fid, table, future))
+        return future
+
+    def extract(self, table, fid=None):
+        return self.submit(table, fid).result()
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+        if self.pool:
+            self.pool.terminate()
+
+    def _run(self):
+        # The cache is a sqlite connection, so it's opened by the thread that uses it
+        with open_feature_cache(self.cache_file_name, self.cache_size) as cache:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._extract_batch(batch, cache)
+                if cache:
+                    cache.commit()
+
+    def _next_batch(self):
+        # Waits for a request, then takes the requests that arrive in the next batch_wait
+        # seconds up to batch_size
+        request = self.requests.get()
+        if request is None:
+            return None
+        batch = [request]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                request = self.requests.get(timeout=max(deadline - time.perf_counter(), 0))
+            except Empty:
+                break
+            if request is None:
+                # Finish the batch and stop with the next call
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _extract_batch(self, batch, cache=None):
+        self.metrics.add_batch(len(batch))
+
+        # The tables are given internal fids, the position in the batch, since the fids of the
+        # requests can repeat or be missing
+        table_columns = {}
+        for position, (arrival, fid, table, future) in enumerate(batch):
+            try:
+                table_columns[position] = get_table_columns(str(position), table)
+            except Exception as e:
+                self._finish(batch[position], error=e)
+        if not table_columns:
+            return
+
+        try:
+            features = self._extract_features(pd.DataFrame([row for columns in table_columns.values() for row in columns], columns=HEADER), cache)
+        except Exception as e:
+            if len(table_columns) == 1:
+                self._finish(batch[next(iter(table_columns))], error=e)
+                return
+            # The error of a table fails the whole batch, the tables are computed again one by
+            # one so only the requests of the tables with errors fail
+            features = {}
+            for position, columns in table_columns.items():
+                try:
+                    features.update(self._extract_features(pd.DataFrame(columns, columns=HEADER), cache))
+                except Exception as e:
+                    self._finish(batch[position], error=e)
+
+        for position in table_columns:
+            if str(position) in features:
+                self._finish(batch[position], features=features[str(position)])
+
+    def _extract_features(self, chunk, cache=None):
+        # Returns the features of every table of the chunk by its fid
+        single = extract_chunk_single_column_features(chunk, cache, self.max_column_length, self.sketch_threshold, self.sketch_error)
+        single = aggregate_chunk_features(single, get_tables_starts(single), all_single_features_list, single_header)
+
+        tables = iter_tables(iter_column_records(chunk))
+        pairwise_rows = []
+        for table_fid, _, table_pairwise_features in extract_tables_pairwise_column_features(tables, self.pairs_per_task, cache, self.pool, 2 * self.workers,
+                self.max_column_length, self.max_table_size):
+            pairwise_rows.extend(table_pairwise_features)
+        pairwise = pd.DataFrame(pairwise_rows, columns=pairwise_column_features_header)
+        pairwise = aggregate_chunk_features(pairwise, get_tables_starts(pairwise), all_pairwise_features_list, pairwise_header)
+
+        # A table with a single column has no pairs, its pairwise features are missing
+        pairwise = pairwise.set_index(FID).reindex(single[FID])
+        vectors = np.hstack([single[single_header[1:-1]].to_numpy(dtype=float), pairwise[pairwise_header[1:-1]].to_numpy(dtype=float)])
+        approximated = single[APPROXIMATED].to_numpy(dtype=bool) | pairwise[APPROXIMATED].fillna(False).to_numpy(dtype=bool)
+        return dict([(fid, (vector, bool(a))) for fid, vector, a in zip(single[FID], vectors, approximated)])
+
+    def _finish(self, request, features=None, error=None):
+        arrival, fid, table, future = request
+        latency = time.perf_counter() - arrival
+        self.metrics.add_request(latency, error is not None)
+        if error is not None:
+            future.set_exception(error)
+            return
+        vector, approximated = features
+        future.set_result({
+            'fid' : fid,
+            'features' : dict(zip(feature_names, [None if np.isnan(value) else float(value) for value in vector])),
+            APPROXIMATED : approximated,
+            'latency_ms' : latency * 1000
+        })
+
+
+def get_table_columns(fid, table):
+    # Casts the columns of the table like extract_columns, with the bag of words shared by the
+    # columns of the table. Returns the rows of the columns with the HEADER of extract_columns.
+    # The tables are checked like the data of the columns in extract_tables_outputs
+    if not isinstance(table, dict) or not table:
+        raise InvalidTable('A table must be an object with the elements of each column')
+    # detect_dtype samples long columns, the seed makes the dtypes of a table always the same
+    random.seed(0)
+    rows = []
+    bag = {}
+    for name, column_data in table.items():
+        if not isinstance(column_data, list) or not column_data:
+            raise InvalidTable(f'The column {name} must be a non empty list')
+        column_data, dtype = cast_column(column_data, bag)
+        if len(column_data) < 2:
+            raise InvalidTable(f'The column {name} has less than 2 valid elements')
+        if len(column_data) != len(rows[0][-1] if rows else column_data):
+            raise InvalidTable('All the columns of a table must have the same number of valid elements')
+        rows.append([fid, f'{fid}:{name}', None, False, False, False, False, dtype, column_data.to_numpy()])
+    return rows
+
+
+def read_json_table(body):
+    # Either {"fid": ..., "columns": {name: [elements]}} or only the columns
+    request = json.loads(body)
+    if isinstance(request, dict) and 'columns' in request:
+        return request.get('fid'), request['columns']
+    return None, request
+
+
+def read_arrow_table(body, fid=None):
+    # pyarrow is only needed for the Arrow requests
+    try:
+        import pyarrow
+    except ImportError:
+        raise InvalidTable('Arrow requests need pyarrow')
+    table = pyarrow.ipc.open_stream(body).read_all()
+    return fid, dict([(name, table.column(name).to_pylist()) for name in table.column_names])
+
+
+class FeatureRequestHandler(BaseHTTPRequestHandler):
+    # POST /features with a table returns its features, GET /metrics the latency metrics
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/features':
+            return self._send(404, {'error' : 'Not found'})
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if self.headers.get('Content-Type', '').startswith(ARROW_CONTENT_TYPE):
+                fid, table = read_arrow_table(body, self.headers.get('X-Fid'))
+            else:
+                fid, table = read_json_table(body)
+            result = self.server.service.extract(table, fid)
+        except (InvalidTable, ValueError) as e:
+            return self._send(400, {'error' : str(e)})
+        except Exception as e:
+            return self._send(500, {'error' : str(e)})
+        self._send(200, result)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            return self._send(200, self.server.service.metrics.summary())
+        self._send(404, {'error' : 'Not found'})
+
+    def _send(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # The clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self):
+        # Closing the socket leaves its file behind
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for the connections of many concurrent clients
+    request_queue_size = 128
+
+
+def create_server(service, host='127.0.0.1', port=8000, socket_path=None, verbose=False):
+    if socket_path:
+        server = UnixHTTPServer(socket_path, FeatureRequestHandler)
+    else:
+        server = TCPHTTPServer((host, port), FeatureRequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def open_connection(host='127.0.0.1', port=8000, socket_path=None):
+    if socket_path:
+        return UnixHTTPConnection(socket_path)
+    return http.client.HTTPConnection(host, port, timeout=60)
+
+
+def request_features(connection, table, fid=None):
+    # Client of the service, returns the response to a table with the columns in JSON
+    connection.request('POST', '/features', json.dumps({'fid' : fid, 'columns' : table}), {'Content-Type' : 'application/json'})
+    response = connection.getresponse()
+    content = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f'The service returned {response.status}: {content["error"]}')
+    return content
+
+
+def request_metrics(connection):
+    connection.request('GET', '/metrics')
+    return json.loads(connection.getresponse().read())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help='Host of the HTTP server')
+    parser.add_argument('--port', type=int, default=8000, help='Port of the HTTP server')
+    parser.add_argument('--socket', help='Path of a Unix socket to serve on instead of a TCP port')
+    parser.add_argument('--batch-size', type=int, default=16, help='Maximum number of tables computed together')
+    parser.add_argument('--batch-wait', type=float, default=2, help='Milliseconds to wait for more tables to fill a batch')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to extract the pairwise column features')
+    parser.add_argument('--pairs-per-task', type=int, default=1000, help='Maximum number of column pairs of a table processed by a single task')
+    parser.add_argument('--cache', help='Path of the feature cache, the features of columns already in the cache are not computed again')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Maximum size of the feature cache in MB')
+    parser.add_argument('--max-column-length', type=parse_max_column_length, help='Maximum number of elements of a column, the features of longer columns are computed on a sample')
+    parser.add_argument('--max-table-size', type=parse_max_table_size, help='Maximum size in MB of the columns of a table for the pairwise column features, the features of larger tables are computed on a sample')
+    parser.add_argument('--sketch-threshold', type=int, help='Columns longer than this number of elements get their single column features approximated with sketches')
+    parser.add_argument('--sketch-error', type=float, default=0.01, help='Relative error of the quantile and distinct count sketches')
+    parser.add_argument('--target-p50', type=float, help='Target of the median latency in milliseconds, reported by /metrics')
+    parser.add_argument('--target-p99', type=float, help='Target of the 99th percentile of the latency in milliseconds, reported by /metrics')
+    parser.add_argument('-v', help='Verbose option, logs every request', action='store_const', const=True, default=False)
+
+    args = parser.parse_args()
+
+    max_table_size = args.max_table_size * 1024 * 1024 if args.max_table_size is not None else None
+    metrics = LatencyMetrics(target_p50=args.target_p50, target_p99=args.target_p99)
+    service = FeatureService(args.batch_size, args.batch_wait / 1000, args.workers, args.pairs_per_task, args.cache, args.cache_size * 1024 * 1024,
+        args.max_column_length, max_table_size, args.sketch_threshold, args.sketch_error, metrics)
+    server = create_server(service, args.host, args.port, args.socket, args.v)
+    print(f'Serving on {args.socket or f"http://{args.host}:{args.port}"}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(json.dumps(metrics.summary()))
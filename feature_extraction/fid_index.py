@@ -0,0 +1,144 @@
+import argparse
+import csv
+import io
+import os
+import numpy as np
+import pandas as pd
+from constants import FID
+
+# A fid index records, for every table of a columns or features file sorted by fid, the row
+# number and byte offset of its first row, its number of rows and its length in bytes, so the
+# rows of some tables can be read seeking to them instead of scanning the whole file. The fid
+# index of a column store is the one of its index.tsv file.
+
+ROW = 'row'
+ROWS = 'rows'
+OFFSET = 'offset'
+BYTES = 'bytes'
+
+
+def get_fid_index_file_name(file_name):
+    return file_name + '.fid_index.tsv'
+
+
+def build_fid_index(file_name):
+    tables = []
+    with open(file_name, 'rb') as f:
+        header = f.readline()
+        sep = b'\t' if b'\t' in header else b','
+        if get_line_fid(header, sep) != FID:
+            raise ValueError(f'The first column of {file_name} must be {FID}')
+
+        # The JSON encoded data never has line breaks, every line is a row. The bad lines and the
+        # blank lines are skipped by the readers, so they are not numbered as rows, like in the
+        # index of the chunks of load_raw_data, and their bytes stay in the range of the table
+        # before them
+        header_fields = _count_fields(header, sep)
+        offset = f.tell()
+        row = 0
+        for line in f:
+            if not _is_row(line, sep, header_fields):
+                if tables:
+                    tables[-1][4] += len(line)
+                offset += len(line)
+                continue
+            fid = get_line_fid(line, sep)
+            if tables and tables[-1][0] == fid:
+                tables[-1][2] += 1
+                tables[-1][4] += len(line)
+            else:
+                tables.append([fid, row, 1, offset, len(line)])
+            offset += len(line)
+            row += 1
+
+    df = pd.DataFrame(tables, columns=[FID, ROW, ROWS, OFFSET, BYTES])
+    df.to_csv(get_fid_index_file_name(file_name), index=False, sep='\t')
+    return df
+
+
+def get_line_fid(line, sep):
+    # The fid of a row given as the bytes of its line, the first field
+    if line.startswith(b'"'):
+        return next(csv.reader([line.decode('utf-8')], delimiter=sep.decode()))[0]
+    return line.split(sep, 1)[0].rstrip(b'\r\n').decode('utf-8')
+
+
+def load_fid_index(file_name):
+    # Returns the fid index of the file, or None when it doesn't exist or is older than the file
+    index_file_name = get_fid_index_file_name(file_name)
+    if not os.path.exists(index_file_name):
+        return None
+    if os.path.getmtime(index_file_name) < os.path.getmtime(file_name):
+        return None
+    return pd.read_table(index_file_name, dtype={FID: str}, keep_default_na=False)
+
+
+def read_tables(file_name, fids, chunk_size=500, index=None):
+    # Yields the rows of the tables in fids by chunks, in the order of the file. Like with
+    # load_raw_data the index of the chunks is the row number in the file, without the bad lines
+    if index is None:
+        index = load_fid_index(file_name)
+    tables = index[index[FID].isin([str(fid) for fid in fids])]
+
+    with open(file_name, 'rb') as f:
+        header = f.readline()
+        sep = b'\t' if b'\t' in header else b','
+        parts = []
+        rows = []
+        chunk_rows = 0
+        for row, n_rows, offset, n_bytes in zip(tables[ROW], tables[ROWS], tables[OFFSET], tables[BYTES]):
+            f.seek(offset)
+            parts.append(f.read(n_bytes))
+            rows.append(np.arange(row, row + n_rows))
+            chunk_rows += n_rows
+            if chunk_rows >= chunk_size:
+                yield _parse_rows(header, parts, rows, sep)
+                parts = []
+                rows = []
+                chunk_rows = 0
+        if parts:
+            yield _parse_rows(header, parts, rows, sep)
+
+
+def _parse_rows(header, parts, rows, sep):
+    # Without index_col a bad first line would be read as an index instead of being skipped
+    data = b''.join(parts)
+    chunk = _read_lines(header, data, sep)
+    rows = np.concatenate(rows)
+    if len(rows) != len(chunk):
+        # A bad first line is kept with index_col, the lines that are rows are parsed again
+        # together so the dtypes are the same as with load_raw_data
+        header_fields = _count_fields(header, sep)
+        lines = [line for line in data.splitlines(keepends=True) if _is_row(line, sep, header_fields)]
+        chunk = _read_lines(header, b''.join(lines), sep)
+    chunk.index = rows
+    return chunk
+
+
+def _read_lines(header, data, sep):
+    return pd.read_table(io.BytesIO(header + data), on_bad_lines='skip', index_col=False, encoding='utf-8', delimiter=sep.decode())
+
+
+def _is_row(line, sep, header_fields):
+    # The readers skip the blank lines and the bad lines, with more fields than the header
+    if not line.strip():
+        return False
+    return _count_fields(line, sep) <= header_fields
+
+
+def _count_fields(line, sep):
+    # Only the quoted fields can have the separator inside
+    if b'"' not in line:
+        return line.count(sep) + 1
+    return pd.read_table(io.BytesIO(line), header=None, encoding='utf-8', delimiter=sep.decode()).shape[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', required=True, nargs='+', help='Columns or features file paths to index, for a column store its index.tsv file')
+
+    args = parser.parse_args()
+
+    for file_name in args.i:
+        df = build_fid_index(file_name)
+        print(f'Indexed {len(df)} tables of {file_name} in {get_fid_index_file_name(file_name)}')
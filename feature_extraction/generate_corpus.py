@@ -0,0 +1,123 @@
+import argparse
+import csv
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from constants import DINT, DFLOAT, DSTRING, DDATE, DBOOL, data_types_list
+
+# Generates a synthetic corpus with the structure of the Plotly corpus (fid, table_data and
+# chart_data) to measure the performance of the pipeline without downloading the corpus. The
+# corpus only depends on the arguments, the same seed always generates the same corpus.
+
+HEADER = ['fid', 'table_data', 'chart_data']
+
+TRACE_TYPES = ['bar', 'box', 'histogram', 'line', 'scatter']
+
+default_dtypes_mix = {
+    DINT : 3,
+    DFLOAT : 4,
+    DSTRING : 2,
+    DDATE : 1,
+    DBOOL : 1
+}
+
+
+def generate_corpus(output_file, tables=1000, columns=(2, 6), lengths=(2, 1000), dtypes_mix=default_dtypes_mix,
+        missing=0.02, invalid=0.1, users=100, seed=0):
+    rng = random.Random(seed)
+    writer = csv.writer(output_file, delimiter='\t')
+    writer.writerow(HEADER)
+    for t in range(tables):
+        user = f'user{rng.randrange(users)}'
+        fid = f'{user}:{t}'
+        writer.writerow(generate_chart(rng, fid, rng.randint(*columns), get_length(rng, lengths), dtypes_mix, missing, rng.random() < invalid))
+
+
+def generate_chart(rng, fid, n_columns, length, dtypes_mix, missing, invalid=False):
+    # The first column is in the x axis and the rest in the y axis of a trace each, an invalid
+    # chart has a column shorter than the rest so it is dropped by the data cleaning
+    dtypes, weights = zip(*dtypes_mix.items())
+    cols = {}
+    for c in range(n_columns):
+        dtype = rng.choices(dtypes, weights)[0]
+        column_length = length - 1 if invalid and c == n_columns - 1 else length
+        cols[f'col{c}'] = {
+            'uid' : f'u{c}',
+            'data' : generate_column(rng, dtype, column_length, missing)
+        }
+
+    trace_type = rng.choice(TRACE_TYPES)
+    traces = [{'type' : trace_type, 'xsrc' : f'{fid}:u0', 'ysrc' : f'{fid}:u{c}'} for c in range(1, n_columns)]
+    return [fid, json.dumps({fid : {'cols' : cols}}), json.dumps(traces)]
+
+
+def generate_column(rng, dtype, length, missing):
+    if dtype == DINT:
+        high = rng.choice([10, 1000, 1000000])
+        data = [rng.randint(0, high) for _ in range(length)]
+    elif dtype == DFLOAT:
+        mu, sigma = rng.uniform(-100, 100), rng.uniform(0.1, 50)
+        data = [round(rng.gauss(mu, sigma), 3) for _ in range(length)]
+    elif dtype == DSTRING:
+        words = [f'category {i}' for i in range(rng.randint(2, 50))]
+        data = [rng.choice(words) for _ in range(length)]
+    elif dtype == DDATE:
+        start = datetime(2000, 1, 1) + timedelta(days=rng.randrange(7000))
+        step = timedelta(hours=rng.choice([1, 24, 24 * 7]))
+        data = [(start + i * step).strftime('%Y-%m-%d %H:%M:%S') for i in range(length)]
+    elif dtype == DBOOL:
+        data = [rng.random() < 0.5 for _ in range(length)]
+    else:
+        raise ValueError(f'Unknown data type {dtype}')
+    return [None if rng.random() < missing else e for e in data]
+
+
+def get_length(rng, lengths):
+    # Lengths are log-uniform so there are many short columns and a few long ones
+    low, high = lengths
+    return int(round(low * (high / low) ** rng.random()))
+
+
+def parse_range(value):
+    # e.g. 2:6, the lengths are log-uniform so the low end must be at least 1
+    low, _, high = value.partition(':')
+    low, high = int(low), int(high or low)
+    if not 1 <= low <= high:
+        raise argparse.ArgumentTypeError(f'The range {value} must be low:high with 1 <= low <= high')
+    return low, high
+
+
+def parse_dtypes_mix(value):
+    # e.g. int=3,float=4,string=2,datetime=1,bool=1
+    dtypes_mix = {}
+    for item in value.split(','):
+        dtype, _, weight = item.partition('=')
+        if dtype not in data_types_list:
+            raise argparse.ArgumentTypeError(f'Unknown data type {dtype}, the data types are {", ".join(data_types_list)}')
+        dtypes_mix[dtype] = float(weight or 1)
+        if dtypes_mix[dtype] < 0:
+            raise argparse.ArgumentTypeError(f'The weight of {dtype} must not be negative')
+    if not sum(dtypes_mix.values()):
+        raise argparse.ArgumentTypeError('At least one data type must have a positive weight')
+    return dtypes_mix
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', help='Output file path, the corpus is written to stdout by default')
+    parser.add_argument('--tables', type=int, default=1000, help='Number of tables (charts)')
+    parser.add_argument('--columns', type=parse_range, default=(2, 6), help='Range of the number of columns of a table, e.g. 2:6')
+    parser.add_argument('--lengths', type=parse_range, default=(2, 1000), help='Range of the length of the columns, e.g. 2:1000')
+    parser.add_argument('--dtypes', type=parse_dtypes_mix, default=default_dtypes_mix, help='Weights of the data types of the columns, e.g. int=3,float=4,string=2,datetime=1,bool=1')
+    parser.add_argument('--missing', type=float, default=0.02, help='Probability of a missing element')
+    parser.add_argument('--invalid', type=float, default=0.1, help='Fraction of tables dropped by the data cleaning')
+    parser.add_argument('--users', type=int, default=100, help='Number of users owning the tables')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    args = parser.parse_args()
+
+    output_file = open(args.o, 'w', newline='') if args.o else sys.stdout
+    with output_file:
+        generate_corpus(output_file, tables=args.tables, columns=args.columns, lengths=args.lengths, dtypes_mix=args.dtypes,
+            missing=args.missing, invalid=args.invalid, users=args.users, seed=args.seed)
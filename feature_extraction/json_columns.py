@@ -0,0 +1,85 @@
+import json
+import re
+
+# Decoding of the table data of a chart one column at a time. A structural scan finds where the
+# data of every column starts and ends without decoding it, then the columns are decoded one by
+# one, so only the data of one column is in memory as Python objects instead of the data of the
+# whole chart.
+
+_special = re.compile(r'["{}\[\]]')
+_scalar_end = re.compile(r'[,}\]\s]')
+_whitespace = re.compile(r'[ \t\n\r]*')
+_scanstring = json.decoder.scanstring
+
+
+def iter_table_columns(table_data):
+    # Yields the same columns as list(json.loads(table_data).popitem()[1]['cols'].values())
+    try:
+        members = list(_iter_members(table_data, 0))
+        # Only whitespace can follow the object, after the } of its last member
+        if _skip_whitespace(table_data, _skip_whitespace(table_data, members[-1][2]) + 1) != len(table_data):
+            raise ValueError('Extra data after the object')
+        tables = dict([(key, start) for key, start, end in members])
+        table_start = tables.popitem()[1]
+        cols_start = dict([(key, start) for key, start, end in _iter_members(table_data, table_start)])['cols']
+        columns = dict([(key, (start, end)) for key, start, end in _iter_members(table_data, cols_start)])
+    except Exception:
+        # Not the expected structure, decoding the whole table data raises the same errors as before
+        yield from list(json.loads(table_data).popitem()[1]['cols'].values())
+        return
+
+    for start, end in columns.values():
+        yield json.loads(table_data[start:end])
+
+
+def _iter_members(s, i):
+    # Yields the key and the start and end of the value of every member of the JSON object at i
+    i = _skip_whitespace(s, i)
+    if s[i] != '{':
+        raise ValueError(f'Expected an object at {i}')
+    i = _skip_whitespace(s, i + 1)
+    if s[i] == '}':
+        return
+    while True:
+        if s[i] != '"':
+            raise ValueError(f'Expected a key at {i}')
+        key, i = _scanstring(s, i + 1)
+        i = _skip_whitespace(s, i)
+        if s[i] != ':':
+            raise ValueError(f'Expected : at {i}')
+        start = _skip_whitespace(s, i + 1)
+        end = _skip_value(s, start)
+        yield key, start, end
+        i = _skip_whitespace(s, end)
+        if s[i] == '}':
+            return
+        if s[i] != ',':
+            raise ValueError(f'Expected , at {i}')
+        i = _skip_whitespace(s, i + 1)
+
+
+def _skip_value(s, i):
+    # Returns the end of the JSON value at i. The strings are skipped with scanstring so the
+    # brackets inside them are not counted, and the numbers are skipped by the regular expression
+    if s[i] == '"':
+        return _scanstring(s, i + 1)[1]
+    if s[i] not in '{[':
+        match = _scalar_end.search(s, i)
+        return match.start() if match else len(s)
+    depth = 0
+    while True:
+        match = _special.search(s, i)
+        c = match.group()
+        i = match.end()
+        if c == '"':
+            i = _scanstring(s, i)[1]
+        elif c in '{[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return i
+
+
+def _skip_whitespace(s, i):
+    return _whitespace.match(s, i).end()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from column_store import is_column_store, get_blob_file_name, blob_dtypes, INDEX_FILE
+from checkpoint import get_checkpoint_file_name
+from async_writer import get_compression
+
+# Concatenates the outputs of the shards of a stage, given in the order of the shards, into the
+# output of the whole input. The rows are copied as they are, only the header of the first
+# output is kept, and the columns of the column stores are appended to the blobs of the output
+# with their offsets moved accordingly. The output of a shard without rows can be empty.
+
+
+def merge_shards(input_file_names, output_file_name):
+    unfinished = [f for f in input_file_names if not _is_finished(f)]
+    if unfinished:
+        raise ValueError(f'The shards {", ".join(unfinished)} did not finish')
+    compressed = [f for f in input_file_names + [output_file_name] if get_compression(f)]
+    if compressed:
+        raise ValueError(f'The compressed files {", ".join(compressed)} can not be merged')
+    if any(is_column_store(f) for f in input_file_names):
+        return merge_column_stores(input_file_names, output_file_name)
+    return merge_files(input_file_names, output_file_name)
+
+
+def _is_finished(file_name):
+    # A shard without a checkpoint was written by a stage that doesn't save them, e.g. the
+    # pipeline, so it is taken as finished
+    checkpoint_file_name = get_checkpoint_file_name(file_name)
+    if not os.path.exists(checkpoint_file_name):
+        return True
+    with open(checkpoint_file_name, 'r') as f:
+        return json.load(f)['finished']
+
+
+def merge_files(input_file_names, output_file_name):
+    # Returns the number of rows of the output
+    header = None
+    rows = 0
+    with open(output_file_name, 'wb') as output_file:
+        for input_file_name in input_file_names:
+            with open(input_file_name, 'rb') as f:
+                input_header = f.readline()
+                if not input_header:
+                    continue
+                if header is None:
+                    header = input_header
+                    output_file.write(header)
+                elif input_header != header:
+                    raise ValueError(f'The header of {input_file_name} is not the header of the other shards')
+                rows += _copy_rows(f, output_file)
+    return rows
+
+
+def merge_column_stores(input_file_names, output_file_name):
+    # The blob, offset and length of the data are the last columns of the index, see ColumnStoreWriter
+    os.makedirs(output_file_name, exist_ok=True)
+    blob_files = dict([(blob, open(get_blob_file_name(output_file_name, blob), 'wb')) for blob in blob_dtypes])
+    blob_offsets = dict([(blob, 0) for blob in blob_dtypes])
+    header = None
+    rows = 0
+    try:
+        with open(os.path.join(output_file_name, INDEX_FILE), 'w') as output_index:
+            for input_file_name in input_file_names:
+                with open(os.path.join(input_file_name, INDEX_FILE), 'r') as f:
+                    input_header = f.readline()
+                    if input_header:
+                        if header is None:
+                            header = input_header
+                            output_index.write(header)
+                        elif input_header != header:
+                            raise ValueError(f'The header of {input_file_name} is not the header of the other shards')
+                    for line in f:
+                        fields, blob, offset, length = line.rstrip('\n').rsplit('\t', 3)
+                        output_index.write(f'{fields}\t{blob}\t{int(offset) + blob_offsets[blob]}\t{length}\n')
+                        rows += 1
+
+                for blob, blob_file in blob_files.items():
+                    with open(get_blob_file_name(input_file_name, blob), 'rb') as f:
+                        shutil.copyfileobj(f, blob_file)
+                    blob_offsets[blob] = blob_file.tell() // np.dtype(blob_dtypes[blob]).itemsize
+    finally:
+        for blob_file in blob_files.values():
+            blob_file.close()
+    return rows
+
+
+def _copy_rows(f, output_file):
+    rows = 0
+    for line in f:
+        output_file.write(line)
+        rows += 1
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', required=True, nargs='+', help='Output file paths of the shards, in the order of the shards')
+    parser.add_argument('-o', required=True, help='Output file path')
+
+    args = parser.parse_args()
+
+    rows = merge_shards(args.i, args.o)
+    print(f'Merged {len(args.i)} shards with a total of {rows} rows into {args.o}')
@@ -1,10 +1,11 @@
-from cmath import e
+from functools import cached_property
 import numpy as np
-import pandas as pd 
-from scipy.stats import pearsonr, f_oneway, chi2_contingency, ks_2samp
-from utils import get_unique, get_list_uniqueness, calculate_overlap
-from data_types import dtype_to_vtype
+from utils import get_unique, calculate_range_overlap
+from set_similarity import count_shared, get_shared_percent, is_identical, count_distinct_pairs
+from constants import dtype_to_vtype
+from profiling import profile_call
 
+# scipy is imported on the first use by the statistical features, like in single_column_features
 
 general_pairwise_features_list = [
     {'name': 'has_shared_elements', 'type': 'boolean'},
@@ -57,35 +58,80 @@ all_pairwise_features_list = \
     statistical_pairwise_features_list
 
 pairwise_column_features_names = [f['name'] for f in all_pairwise_features_list]
+# Bump when the computation of the features changes, the cached features of older versions are not used
+pairwise_column_features_version = 3
 
-def get_general_pairwise_features(a_data, b_data, a_unique_data, b_unique_data):
+
+class ColumnProfile:
+    # The values of a column used by the pairwise features, shared by all the pairs of the column
+    # in a table. Each one is computed the first time a pair needs it.
+
+    def __init__(self, data, dtype):
+        self.data = data
+        self.dtype = dtype
+        self.vtype = dtype_to_vtype[dtype]
+
+    @cached_property
+    def unique(self):
+        return profile_call('pairwise_unique', self.dtype, get_unique, self.data, elements=len(self.data))
+
+    @cached_property
+    def has_nan(self):
+        # np.unique sorts NaN last and keeps a single one
+        return bool(len(self.unique)) and self.unique.dtype.kind == 'f' and np.isnan(self.unique[-1])
+
+    @cached_property
+    def num_values(self):
+        # Number of unique values without NaN
+        return len(self.unique) - self.has_nan
+
+    @cached_property
+    def codes(self):
+        # Factorization of the column, the position of each value in unique, -1 for NaN
+        codes = np.searchsorted(self.unique, self.data)
+        if self.has_nan:
+            codes[codes == self.num_values] = -1
+        return codes
+
+    @cached_property
+    def sorted(self):
+        return np.sort(self.data)
+
+    @cached_property
+    def min(self):
+        return np.min(self.data)
+
+    @cached_property
+    def max(self):
+        return np.max(self.data)
+
+
+def get_general_pairwise_features(a, b):
     r = dict([ (f['name'], None) for f in general_pairwise_features_list ])
     
-    a_unique_data = set(a_unique_data)
-    b_unique_data = set(b_unique_data)
-    num_identical_elements = np.count_nonzero(a_data == b_data)
+    num_identical_elements = np.count_nonzero(a.data == b.data)
     r['has_shared_elements'] = (num_identical_elements > 0)
     r['num_shared_elements'] = num_identical_elements
-    r['percent_shared_elements'] = num_identical_elements / len(a_data)
-    r['identical'] = num_identical_elements == len(a_data)
+    r['percent_shared_elements'] = num_identical_elements / len(a.data)
+    r['identical'] = num_identical_elements == len(a.data)
 
-    num_shared_unique_elements = len(a_unique_data.intersection(b_unique_data))
+    num_shared_unique_elements = count_shared(a.unique, b.unique)
     r['has_shared_unique_elements'] = (num_shared_unique_elements > 0)
     r['num_shared_unique_elements'] = num_shared_unique_elements
-    r['percent_shared_unique_elements'] = num_shared_unique_elements/ max(len(a_unique_data), len(b_unique_data))
-    r['identical_unique'] = (a_unique_data == b_unique_data)  
+    r['percent_shared_unique_elements'] = get_shared_percent(a.unique, b.unique, num_shared_unique_elements)
+    r['identical_unique'] = is_identical(a.unique, b.unique, num_shared_unique_elements)
     return r
 
-def get_statistical_pairwise_features(a_data, b_data, a_unique_data, b_unique_data, a_vtype, b_vtype, MAX_GROUPS=50):
+def get_statistical_pairwise_features(a, b, MAX_GROUPS=1000):
+    from scipy.stats import pearsonr, chi2_contingency, ks_2samp
     r = dict([ (f['name'], None) for f in statistical_pairwise_features_list ])
-
-    a = ('a_data', a_unique_data)
-    b = ('b_data', b_unique_data)
+    a_vtype, b_vtype = a.vtype, b.vtype
 
     if (a_vtype == 'q' and b_vtype == 'q'):
-        correlation_value, correlation_p = pearsonr(a_data, b_data)
-        ks_statistic, ks_p = ks_2samp(a_data, b_data)
-        has_overlap, overlap_percent = calculate_overlap(a_data, b_data)
+        correlation_value, correlation_p = pearsonr(a.data, b.data)
+        # ks_2samp sorts the samples, the sorted copies are sorted faster
+        ks_statistic, ks_p = ks_2samp(a.sorted, b.sorted)
+        has_overlap, overlap_percent = calculate_range_overlap(a.min, a.max, b.min, b.max)
 
         r['correlation_value'] = correlation_value
         r['correlation_p'] = correlation_p
@@ -99,58 +145,109 @@ def get_statistical_pairwise_features(a_data, b_data, a_unique_data, b_unique_da
         r['percent_range_overlap'] = overlap_percent
 
     if (a_vtype == 'c' and b_vtype == 'c'):
-        if len(a_unique_data) > MAX_GROUPS or len(b_unique_data) > MAX_GROUPS:
+        if len(a.unique) > MAX_GROUPS or len(b.unique) > MAX_GROUPS:
+            return r
+        ct = get_contingency_table(a, b)
+        if not ct.size:
             return r
-        df = pd.DataFrame({ 'a_data': a_data, 'b_data': b_data })
-        ct = pd.crosstab(a_data, b_data)
         chi2_statistic, chi2_p, dof, exp_frequencies = chi2_contingency(ct)
 
         r['chi2_statistic'] = chi2_statistic
         r['chi2_p'] = chi2_p
         r['chi2_significant_005'] = (chi2_p < 0.05)
 
-        nestedness_values = []
-        for parent, child in ([a, b], [b, a]):
-            
-            parent_name, parent_unique_data = parent
-            child_name, child_unique_data = child
-           
-            child_field_unique_corresponding_values = []
-            unique_parent_field_values = parent_unique_data
-            for unique_parent_field_value in unique_parent_field_values:
-                child_field_unique_corresponding_values.extend(set(df[df[parent_name] == unique_parent_field_value][child_name]))
-            nestedness = get_list_uniqueness(child_field_unique_corresponding_values)     
-            nestedness_values.append(nestedness) 
-
-        r['nestedness'] = max(nestedness_values)
-        r['nestedness_95'] == (nestedness > 0.95)
+        r['nestedness'] = get_nestedness(a, b)
 
     if (a_vtype == 'q' and b_vtype == 'c') or (a_vtype == 'c' and  b_vtype == 'q'):
-        c_field = a if a_vtype == 'c' else b
-        q_field = a if a_vtype == 'q' else b
-        
-        c_field_name, c_field_unique_data = c_field
-        q_field_name, q_field_unique_data = q_field
-
-        unique_c_field_values = c_field_unique_data
-        if 1 < len(unique_c_field_values) <= MAX_GROUPS:
-            df = pd.DataFrame({ 'a_data': a_data, 'b_data': b_data })
-            group_values = [ df[df[c_field_name] == v][q_field_name] for v in unique_c_field_values ]
-            anova_result = f_oneway(*group_values)  
-
-            r['one_way_anova_statistic'] = anova_result.statistic
-            r['one_way_anova_p'] = anova_result.pvalue
-            r['one_way_anova_significant_005'] = (anova_result.pvalue < 0.05)
+        c, q = (a, b) if a_vtype == 'c' else (b, a)
+
+        if 1 < len(c.unique) <= MAX_GROUPS:
+            anova_statistic, anova_p = get_one_way_anova(c, q.data)
+
+            r['one_way_anova_statistic'] = anova_statistic
+            r['one_way_anova_p'] = anova_p
+            r['one_way_anova_significant_005'] = (anova_p < 0.05)
     return r
 
+def get_contingency_table(a, b):
+    # Counts every combination of the codes of both columns in a single pass. Like pd.crosstab
+    # the rows with NaN in any column are left out, and so are the values only found in them
+    na, nb = a.num_values, b.num_values
+    valid = (a.codes >= 0) & (b.codes >= 0)
+    ct = np.bincount(a.codes[valid] * nb + b.codes[valid], minlength=na * nb).reshape(na, nb)
+    return ct[ct.sum(axis=1) > 0][:, ct.sum(axis=0) > 0]
+
+
+def get_nestedness(a, b):
+    # Returns the max of the nestedness of both directions, None without pairs of values
+    nestedness = [n for n in (_get_nestedness(a, b), _get_nestedness(b, a)) if n is not None]
+    return max(nestedness, default=None)
+
+
+def _get_nestedness(parent, child):
+    # The number of unique child values over the number of unique child values per parent
+    # value, the last one are the distinct pairs of values. The rows with a NaN parent are left
+    # out, and a NaN child is a new value in every row, as in the sets of the child values of
+    # the original implementation
+    rows = parent.codes >= 0
+    child_nan = rows & (child.codes < 0)
+    rows &= child.codes >= 0
+    num_nan = np.count_nonzero(child_nan)
+    num_combinations = count_distinct_pairs(parent.codes[rows], child.codes[rows], child.num_values) + num_nan
+    if not num_combinations:
+        return None
+    num_child_values = len(np.unique(child.codes[rows])) + (num_nan > 0)
+    return num_child_values / num_combinations
+
+
+def get_one_way_anova(c, q_data):
+    from scipy.special import fdtrc
+    # Same as f_oneway over the groups of q_data for each categorical value of the column
+    # profile c, the sums of the groups are computed with np.bincount over its codes. NaN is a
+    # value of c whose group is always empty, so like f_oneway with an empty group the
+    # result is NaN
+    if c.has_nan:
+        return np.nan, np.nan
+    q_data = np.asarray(q_data, dtype=float)
+    codes = c.codes
+    num_groups = len(c.unique)
+    n = len(q_data)
+
+    counts = np.bincount(codes, minlength=num_groups)
+    if np.all(counts == 1):
+        return np.nan, np.nan
+
+    # Constant groups
+    groups_min = np.full(num_groups, np.inf)
+    groups_max = np.full(num_groups, -np.inf)
+    np.minimum.at(groups_min, codes, q_data)
+    np.maximum.at(groups_max, codes, q_data)
+    all_const = np.all(groups_min == groups_max)
+    if all_const and np.all(q_data == q_data[0]):
+        return np.nan, np.nan
+
+    centered = q_data - q_data.mean()
+    normalized_ss = centered.sum() ** 2 / n
+    sstot = np.sum(centered * centered) - normalized_ss
+    ssbn = np.sum(np.bincount(codes, weights=centered, minlength=num_groups) ** 2 / counts) - normalized_ss
+    sswn = sstot - ssbn
+    dfbn = num_groups - 1
+    dfwn = n - num_groups
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = (ssbn / dfbn) / (sswn / dfwn)
+    if all_const:
+        return np.inf, 0.0
+    return f, fdtrc(dfbn, dfwn, f)
+
+
 def get_pairwise_column_features(a_data, b_data, a_dtype, b_dtype):
-    a_vtype = dtype_to_vtype[a_dtype]
-    b_vtype = dtype_to_vtype[b_dtype]
+    return get_profiles_pairwise_features(ColumnProfile(a_data, a_dtype), ColumnProfile(b_data, b_dtype))
 
-    a_unique_data = get_unique(a_data)
-    b_unique_data = get_unique(b_data)
 
-    general_pairwise_features = get_general_pairwise_features(a_data, b_data, a_unique_data, b_unique_data)
-    statistical_pairwise_features = get_statistical_pairwise_features(a_data, b_data, a_unique_data, b_unique_data, a_vtype, b_vtype)
+def get_profiles_pairwise_features(a, b):
+    # The profiles of the columns of a table are reused by all its pairs
+    dtypes = f'{a.dtype}/{b.dtype}'
+    general_pairwise_features = profile_call('pairwise_general', dtypes, get_general_pairwise_features, a, b, elements=len(a.data))
+    statistical_pairwise_features = profile_call('pairwise_statistical', dtypes, get_statistical_pairwise_features, a, b, elements=len(a.data))
         
     return list(general_pairwise_features.values()) + list(statistical_pairwise_features.values())
@@ -0,0 +1,212 @@
+import pandas as pd
+import argparse
+from contextlib import ExitStack
+from functools import partial
+from multiprocessing import Pool
+from utils import load_raw_data, imap_bounded
+from column_store import open_columns_writer
+from async_writer import AsyncWriter
+from checkpoint import remove_checkpoint
+from feature_cache import open_feature_cache
+from extract_columns import extract_chunk_columns, HEADER
+from extract_tables_outputs import new_table_info, add_table_column, TABLES_HEADER
+from extract_features import extract_chunk_single_column_features, extract_tables_pairwise_column_features, pairwise_column_features_header
+from aggregate_features import aggregate_chunk_features, get_aggregated_features_header, get_tables_starts
+from single_column_features import all_single_features_list
+from pairwise_column_features import all_pairwise_features_list
+from column_records import iter_column_records, iter_tables
+from constants import FID
+from bounded_memory import parse_max_column_length, parse_max_table_size
+from sharding import open_shard, parse_shard
+
+# Runs all the stages in a single pass over the raw corpus. The chunks of columns extracted from
+# the raw data are passed in memory from one stage to the next, so the intermediate files are
+# not written and read again, and only the requested outputs are written. The outputs have the
+# same content as the ones of the scripts of every stage.
+
+COLUMNS_OUTPUT = 'columns'
+TABLES_OUTPUT = 'tables'
+CLEAN_OUTPUT = 'clean'
+SINGLE_OUTPUT = 'single'
+PAIRWISE_OUTPUT = 'pairwise'
+AGGREGATED_SINGLE_OUTPUT = 'aggregated_single'
+AGGREGATED_PAIRWISE_OUTPUT = 'aggregated_pairwise'
+
+columns_outputs = [COLUMNS_OUTPUT, CLEAN_OUTPUT]
+
+
+def run_pipeline(input_file_name, outputs, workers=1, store=False, pairs_per_task=1000, cache_file_name=None, cache_size=1024 * 1024 * 1024, verbose=False, streaming=False,
+        max_column_length=None, max_table_size=None, sketch_threshold=None, sketch_error=0.01, shard=None):
+    # outputs maps the name of each requested output to its file name
+    single = SINGLE_OUTPUT in outputs or AGGREGATED_SINGLE_OUTPUT in outputs
+    pairwise = PAIRWISE_OUTPUT in outputs or AGGREGATED_PAIRWISE_OUTPUT in outputs
+    clean = single or pairwise or TABLES_OUTPUT in outputs or CLEAN_OUTPUT in outputs
+
+    single_header = get_aggregated_features_header(all_single_features_list)
+    pairwise_header = get_aggregated_features_header(all_pairwise_features_list)
+
+    # The pipeline doesn't save checkpoints, the manifests of previous runs of the stages to
+    # the same outputs are removed
+    for output_file_name in outputs.values():
+        remove_checkpoint(output_file_name)
+
+    pool = Pool(workers) if workers > 1 else None
+    with open_shard(input_file_name, shard) as input_file, open_feature_cache(cache_file_name, cache_size) as cache, ExitStack() as writers:
+        columns_writers = dict([
+            (name, writers.enter_context(open_columns_writer(outputs[name], store)))
+            for name in columns_outputs if name in outputs
+        ])
+        output_writers = dict([
+            (name, writers.enter_context(AsyncWriter(output_file_name)))
+            for name, output_file_name in outputs.items() if name not in columns_outputs
+        ])
+
+        chunks = _extract_columns(load_raw_data(input_file), pool, 2 * workers, streaming)
+        total_columns = 0
+        total_tables = 0
+        try:
+            for i, chunk in enumerate(_group_tables(chunks)):
+                total_columns += len(chunk)
+                if COLUMNS_OUTPUT in outputs:
+                    columns_writers[COLUMNS_OUTPUT].write(chunk)
+                if not clean:
+                    continue
+
+                tables, chunk = _clean_tables(chunk)
+                total_tables += len(tables)
+                if TABLES_OUTPUT in outputs:
+                    output_writers[TABLES_OUTPUT].write(tables)
+                if CLEAN_OUTPUT in outputs:
+                    columns_writers[CLEAN_OUTPUT].write(chunk)
+
+                if single:
+                    df = extract_chunk_single_column_features(chunk, cache, max_column_length, sketch_threshold, sketch_error)
+                    if SINGLE_OUTPUT in outputs:
+                        output_writers[SINGLE_OUTPUT].write(df)
+                    if AGGREGATED_SINGLE_OUTPUT in outputs:
+                        df = aggregate_chunk_features(df, get_tables_starts(df), all_single_features_list, single_header)
+                        output_writers[AGGREGATED_SINGLE_OUTPUT].write(df)
+
+                if pairwise:
+                    chunk_pairwise_features = []
+                    for _, _, table_pairwise_features in extract_tables_pairwise_column_features(_get_tables(chunk), pairs_per_task, cache, pool, 2 * workers,
+                            max_column_length, max_table_size):
+                        chunk_pairwise_features.extend(table_pairwise_features)
+                    df = pd.DataFrame(chunk_pairwise_features, columns=pairwise_column_features_header)
+                    if PAIRWISE_OUTPUT in outputs:
+                        output_writers[PAIRWISE_OUTPUT].write(df)
+                    if AGGREGATED_PAIRWISE_OUTPUT in outputs:
+                        df = aggregate_chunk_features(df, get_tables_starts(df), all_pairwise_features_list, pairwise_header)
+                        output_writers[AGGREGATED_PAIRWISE_OUTPUT].write(df)
+
+                if cache:
+                    cache.commit()
+                if verbose:
+                    print(f'Finished processing chunk {i}, {len(chunk)} columns of {len(tables)} tables after cleaning.')
+        finally:
+            if pool:
+                pool.terminate()
+
+        print('Finished execution')
+        print('Processed columns: ', total_columns)
+        if clean:
+            print('Correct tables: ', total_tables)
+        if cache:
+            print(cache.summary())
+
+
+def _extract_columns(raw_data, pool=None, max_pending=2, streaming=False):
+    # Yields the columns of the chunks of the raw corpus, with the data of the columns as arrays
+    extract_chunk = partial(extract_chunk_columns, encode_data=False, streaming=streaming)
+    if pool:
+        chunks_columns = imap_bounded(pool, extract_chunk, enumerate(raw_data), max_pending)
+    else:
+        chunks_columns = map(extract_chunk, enumerate(raw_data))
+    for i, chunk_rows, chunk_columns in chunks_columns:
+        yield pd.DataFrame(chunk_columns, columns=HEADER)
+
+
+def _group_tables(chunks):
+    # The columns of the last table of a chunk could continue in the next chunk, so they are
+    # carried over and every chunk yielded has whole tables
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        starts = get_tables_starts(chunk)
+        carry = chunk.iloc[starts[-1]:]
+        yield chunk.iloc[:starts[-1]]
+    if carry is not None and len(carry):
+        yield carry
+
+
+def _clean_tables(chunk):
+    # Extracts the outputs of the tables of the chunk like extract_tables_outputs, and keeps
+    # only the columns of the correct tables like clean_columns
+    tables = []
+    table_info = None
+    table_error = False
+    for column in iter_column_records(chunk, decode=False):
+        if table_info is None or table_info[FID] != column.fid:
+            if table_info and not table_error:
+                tables.append(list(table_info.values()))
+            table_info = new_table_info(column)
+            table_error = False
+
+        if not table_error:
+            table_error = not add_table_column(table_info, column)
+    if table_info and not table_error:
+        tables.append(list(table_info.values()))
+
+    tables = pd.DataFrame(tables, columns=TABLES_HEADER)
+    return tables, chunk[chunk[FID].isin(tables[FID])]
+
+
+def _get_tables(chunk):
+    # Yields the tables of the chunk as ColumnTable, the data of the columns are already arrays
+    return iter_tables(iter_column_records(chunk))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', required=True, help='Raw corpus file path')
+    parser.add_argument('--columns', help='Output file path for the extracted columns')
+    parser.add_argument('--tables', help='Output file path for the tables outputs')
+    parser.add_argument('--clean', help='Output file path for the columns of the correct tables')
+    parser.add_argument('-os', help='Output file path for single column features')
+    parser.add_argument('-op', help='Output file path for pairwise column features')
+    parser.add_argument('-as', help='Output file path for aggregated single column features')
+    parser.add_argument('-ap', help='Output file path for aggregated pairwise column features')
+    parser.add_argument('-v', help='Verbose option', action='store_const', const=True, default=False)
+    parser.add_argument('--store', help='Save the columns outputs in column store directories instead of TSV files', action='store_const', const=True, default=False)
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes used to extract the columns and the pairwise column features')
+    parser.add_argument('--pairs-per-task', type=int, default=1000, help='Maximum number of column pairs of a table processed by a single task')
+    parser.add_argument('--cache', help='Path of the feature cache, the features of columns already in the cache are not computed again')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Maximum size of the feature cache in MB')
+    parser.add_argument('--max-column-length', type=parse_max_column_length, help='Maximum number of elements of a column, the features of longer columns are computed on a sample')
+    parser.add_argument('--max-table-size', type=parse_max_table_size, help='Maximum size in MB of the columns of a table for the pairwise column features, the features of larger tables are computed on a sample')
+    parser.add_argument('--sketch-threshold', type=int, help='Columns longer than this number of elements get their single column features approximated with sketches')
+    parser.add_argument('--sketch-error', type=float, default=0.01, help='Relative error of the quantile and distinct count sketches')
+    parser.add_argument('--streaming', help='Decode the table data of a chart one column at a time to bound the memory of large charts', action='store_const', const=True, default=False)
+    parser.add_argument('--shard', type=parse_shard, help='Run only over the charts of the shard i of N of the raw corpus, as i/N')
+
+    args = vars(parser.parse_args())
+
+    outputs = {
+        COLUMNS_OUTPUT : args['columns'],
+        TABLES_OUTPUT : args['tables'],
+        CLEAN_OUTPUT : args['clean'],
+        SINGLE_OUTPUT : args['os'],
+        PAIRWISE_OUTPUT : args['op'],
+        AGGREGATED_SINGLE_OUTPUT : args['as'],
+        AGGREGATED_PAIRWISE_OUTPUT : args['ap']
+    }
+    outputs = dict([(name, output_file_name) for name, output_file_name in outputs.items() if output_file_name])
+    if not outputs:
+        print('At least one output file must be specified')
+        exit(1)
+
+    max_table_size = args['max_table_size'] * 1024 * 1024 if args['max_table_size'] else None
+    run_pipeline(args['i'], outputs, workers=args['workers'], store=args['store'], pairs_per_task=args['pairs_per_task'],
+        cache_file_name=args['cache'], cache_size=args['cache_size'] * 1024 * 1024, verbose=args['v'], streaming=args['streaming'],
+        max_column_length=args['max_column_length'], max_table_size=max_table_size, sketch_threshold=args['sketch_threshold'], sketch_error=args['sketch_error'], shard=args['shard'])
@@ -0,0 +1,58 @@
+from time import perf_counter
+
+# Opt-in instrumentation of the feature extractors. The groups of features are computed through
+# profile_call, which records the cumulative time, the number of calls and the size of the input
+# of every group and dtype when the profiling is enabled, and only calls the function otherwise.
+
+_stats = None
+
+
+def enable_profiling():
+    global _stats
+    _stats = {}
+
+
+def is_profiling_enabled():
+    return _stats is not None
+
+
+def profile_call(group, dtype, func, *args, columns=1, elements=0):
+    if _stats is None:
+        return func(*args)
+    start = perf_counter()
+    result = func(*args)
+    _record(group, dtype, perf_counter() - start, columns, elements)
+    return result
+
+
+def _record(group, dtype, seconds, columns=1, elements=0, calls=1):
+    stats = _stats.setdefault((group, dtype), [0, 0, 0, 0.0])
+    stats[0] += calls
+    stats[1] += columns
+    stats[2] += elements
+    stats[3] += seconds
+
+
+def collect_stats():
+    # Returns the stats recorded since the last collect and resets them, so the stats of the
+    # worker processes can be sent to the main process
+    global _stats
+    if _stats is None:
+        return None
+    stats, _stats = _stats, {}
+    return stats
+
+
+def merge_stats(stats):
+    if _stats is None or not stats:
+        return
+    for (group, dtype), (calls, columns, elements, seconds) in stats.items():
+        _record(group, dtype, seconds, columns, elements, calls)
+
+
+def get_profiling_report():
+    lines = [f"{'group':<24}{'dtype':<20}{'calls':>10}{'columns':>10}{'elements':>14}{'seconds':>12}{'us/element':>12}"]
+    for (group, dtype), (calls, columns, elements, seconds) in sorted(_stats.items(), key=lambda item: -item[1][3]):
+        per_element = f'{1e6 * seconds / elements:.3f}' if elements else '-'
+        lines.append(f'{group:<24}{dtype:<20}{calls:>10}{columns:>10}{elements:>14}{seconds:>12.3f}{per_element:>12}')
+    return '\n'.join(lines)
@@ -0,0 +1,36 @@
+import numpy as np
+
+# Set operations over sorted arrays of unique values, as returned by np.unique, so the values
+# are never boxed in Python sets. The strings are compared through the codes of the bag of
+# words of their table, and like in Python sets NaN is never equal to NaN.
+
+
+def count_shared(a_unique, b_unique):
+    # Binary search of the values of the smaller array in the larger one
+    if len(a_unique) > len(b_unique):
+        a_unique, b_unique = b_unique, a_unique
+    if not len(a_unique):
+        return 0
+    positions = np.minimum(np.searchsorted(b_unique, a_unique), len(b_unique) - 1)
+    return int(np.count_nonzero(b_unique[positions] == a_unique))
+
+
+def get_shared_percent(a_unique, b_unique, num_shared=None):
+    # Shared values over the number of values of the larger set
+    if num_shared is None:
+        num_shared = count_shared(a_unique, b_unique)
+    return num_shared / max(len(a_unique), len(b_unique))
+
+
+def is_identical(a_unique, b_unique, num_shared=None):
+    if len(a_unique) != len(b_unique):
+        return False
+    if num_shared is None:
+        num_shared = count_shared(a_unique, b_unique)
+    return num_shared == len(a_unique)
+
+
+def count_distinct_pairs(a_codes, b_codes, b_size):
+    # Number of distinct pairs of values of two aligned columns given as codes, b_size is the
+    # number of distinct values of b
+    return len(np.unique(a_codes * b_size + b_codes))
@@ -0,0 +1,119 @@
+import argparse
+import io
+import os
+from contextlib import contextmanager
+from fid_index import get_line_fid
+from async_writer import get_compression, open_text
+
+# A run over a large file can be split in N shards processed independently, e.g. by processes
+# of several machines sharing the files. A shard is a byte range of the rows of a file sorted by
+# fid (the raw corpus, a columns file or the index of a column store, or a features file), and
+# the ranges start at the first row of a table so the rows of a table are always in the same
+# shard. The ranges only depend on the file and N, so every process plans the same shards
+# without any coordination, and the outputs of the shards concatenated in order with
+# merge_shards.py are the output of the whole file.
+
+
+def parse_shard(value):
+    # e.g. 0/4 is the first of 4 shards
+    index, _, shards = value.partition('/')
+    index, shards = int(index), int(shards)
+    if not 0 <= index < shards:
+        raise argparse.ArgumentTypeError(f'The shard {value} must be i/N with 0 <= i < N')
+    return index, shards
+
+
+def plan_shards(file_name, shards):
+    # Returns the byte ranges (start, end) of the rows of the shards of the file. The JSON
+    # encoded data never has line breaks, every line is a row
+    if get_compression(file_name):
+        raise ValueError(f'The compressed file {file_name} can not be split in shards')
+    with open(file_name, 'rb') as f:
+        header = f.readline()
+        sep = b'\t' if b'\t' in header else b','
+        rows_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+
+        boundaries = [rows_start]
+        for i in range(1, shards):
+            target = max(rows_start + (size - rows_start) * i // shards, boundaries[-1])
+            boundaries.append(_find_table_start(f, target, sep, size))
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _find_table_start(f, target, sep, size):
+    # Offset of the first row at or after target that starts a table, the rows of the table of
+    # the row at target stay before it
+    f.seek(max(target - 1, 0))
+    if target > 0:
+        # The rest of the row that target falls in, nothing when target starts a row
+        f.readline()
+    offset = f.tell()
+    line = f.readline()
+    if not line:
+        return size
+    fid = get_line_fid(line, sep)
+    offset += len(line)
+    for line in f:
+        if get_line_fid(line, sep) != fid:
+            break
+        offset += len(line)
+    return offset
+
+
+def get_shard_range(file_name, shard):
+    index, shards = shard
+    return plan_shards(file_name, shards)[index]
+
+
+class ShardFile(io.RawIOBase):
+    # The header of a file followed by the rows of a byte range, read as a file
+
+    def __init__(self, file_name, start, end):
+        self.file = open(file_name, 'rb')
+        self.pending = self.file.readline()
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.pending:
+            n = min(len(buffer), len(self.pending))
+            buffer[:n] = self.pending[:n]
+            self.pending = self.pending[n:]
+            return n
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+@contextmanager
+def open_shard(file_name, shard=None):
+    # Opens the rows of a shard of the file as a text file with the header of the file, or the
+    # whole file without shard, which can be compressed
+    if shard is None:
+        with open_text(file_name) as f:
+            yield f
+        return
+    start, end = get_shard_range(file_name, shard)
+    with io.TextIOWrapper(io.BufferedReader(ShardFile(file_name, start, end)), encoding='utf-8') as f:
+        yield f
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', required=True, help='File sorted by fid to split, for a column store its index.tsv file')
+    parser.add_argument('-n', required=True, type=int, help='Number of shards')
+
+    args = parser.parse_args()
+
+    for index, (start, end) in enumerate(plan_shards(args.i, args.n)):
+        print(f'{index}/{args.n}\t{start}\t{end}\t{end - start}')
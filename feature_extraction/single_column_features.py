@@ -1,9 +1,12 @@
 import numpy as np
-from scipy.stats import entropy, normaltest, mode, kurtosis, skew, pearsonr, moment
 import pandas as pd
 from data_types import data_types_list, var_types_list, dtype_to_vtype, CATEG, QUANT, TIME
 from utils import get_unique
+from profiling import profile_call
+from sketches import MomentsSketch, QuantileSketch, SmallestValuesSketch, DistinctCountSketch, get_sketch_parameters
 
+# scipy.stats takes a large share of the startup of the scripts, so it's imported by the
+# functions that use it and the scripts that only need the lists of features don't load it
 
 
 basic_features_list = [{'name': 'length', 'type': 'numeric'}]
@@ -80,6 +83,14 @@ all_single_features_list = \
     sequence_features_list
 
 single_column_features_names = [f['name'] for f in basic_features_list + uniqueness_features_list + statistical_features_list + sequence_features_list]
+# Bump when the computation of the features changes, the cached features of older versions are not used
+single_column_features_version = 2
+
+# In the sketch mode the columns are read by chunks of this size, and the columns with more
+# distinct values than max_sketch_histogram_size don't get the statistical features of the
+# histogram of their values, which need the count of every value
+sketch_chunk_size = 65536
+max_sketch_histogram_size = 100000
 
 def get_basic_features(v, dtype, vtype):
     r = dict([(f['name'], None) for f in basic_features_list])
@@ -104,6 +115,7 @@ def get_uniqueness_features(v, dtype, vtype):
 
 
 def get_statistical_features(v, var_type):
+    from scipy.stats import entropy, normaltest, kurtosis, skew, moment
     r = dict([(f['name'], None) for f in statistical_features_list])
 
     if not len(v):
@@ -178,6 +190,7 @@ def get_statistical_features(v, var_type):
 
 
 def get_sequence_features(v, vtype):
+    from scipy.stats import pearsonr
     r = dict([(f['name'], None) for f in sequence_features_list])
     if not len(v):
         return r
@@ -208,11 +221,420 @@ def get_single_column_features(v, dtype):
     vtype = dtype_to_vtype[dtype]
     v_hist = np.array(pd.value_counts(v)) if dtype in [CATEG, TIME] else v
     
-    basic_features = get_basic_features(v, dtype, vtype)
-    uniqueness_features = get_uniqueness_features(v, dtype, vtype)
-    statistical_features = get_statistical_features(v_hist, vtype)
-    sequence_features = get_sequence_features(v, vtype)
+    basic_features = profile_call('basic', dtype, get_basic_features, v, dtype, vtype, elements=len(v))
+    uniqueness_features = profile_call('uniqueness', dtype, get_uniqueness_features, v, dtype, vtype, elements=len(v))
+    statistical_features = profile_call('statistical', dtype, get_statistical_features, v_hist, vtype, elements=len(v))
+    sequence_features = profile_call('sequence', dtype, get_sequence_features, v, vtype, elements=len(v))
     return list(basic_features.values()) + list(uniqueness_features.values()) + list(statistical_features.values()) + list(sequence_features.values())
 
 
     
+def get_single_column_features_batch(columns, dtype):
+    # Computes get_single_column_features for many columns of the same dtype. The columns are
+    # padded into a single matrix so the sort, the histograms and the centered powers are
+    # computed once for the whole batch and shared by all the features.
+    vtype = dtype_to_vtype[dtype]
+    features = [None] * len(columns)
+
+    batch = []
+    for i, v in enumerate(columns):
+        # Short columns and columns with missing values go through the per column path,
+        # since the padded kernel relies on finite values to sort the padding at the end
+        if len(v) < 2 or not np.all(np.isfinite(v)):
+            features[i] = get_single_column_features(v, dtype)
+        else:
+            batch.append(i)
+
+    if not batch:
+        return features
+
+    batch_columns = [np.asarray(columns[i]) for i in batch]
+    integer = all(np.issubdtype(v.dtype, np.integer) for v in batch_columns)
+
+    v, n, mask = _pad_columns(batch_columns)
+    # The batch groups are profiled with the number of columns and elements of the batch
+    size = dict(columns=len(batch), elements=int(n.sum()))
+    sorted_v = profile_call('batch_sort', dtype, np.sort, v, 1, **size)
+
+    uniqueness_features = None
+    if vtype in (CATEG, TIME):
+        # The statistical features of categorical variables are computed over the histogram
+        hist, num_unique = profile_call('uniqueness', dtype, _sorted_histograms, sorted_v, mask, **size)
+        hist_n = num_unique
+        hist_mask = np.arange(hist.shape[1]) < hist_n[:, None]
+        uniqueness_features = {
+            'num_unique_elements': num_unique,
+            'unique_percent': num_unique / n,
+            'is_unique': num_unique == n
+        }
+        statistical_features = profile_call('statistical', dtype, _get_statistical_features_batch, hist, hist_n, hist_mask, vtype, True, **size)
+    else:
+        statistical_features = profile_call('statistical', dtype, _get_statistical_features_batch, sorted_v, n, mask, vtype, integer, **size)
+
+    if vtype == TIME:
+        # The sequence features of datetimes are computed over whole seconds
+        v, sorted_v = np.trunc(v), np.trunc(sorted_v)
+    sequence_features = profile_call('sequence', dtype, _get_sequence_features_batch, v, sorted_v, n, mask, vtype, **size)
+
+    for j, i in enumerate(batch):
+        basic = profile_call('basic', dtype, get_basic_features, columns[i], dtype, vtype, elements=int(n[j]))
+        uniqueness = dict([(f['name'], None) for f in uniqueness_features_list])
+        if uniqueness_features:
+            for name, values in uniqueness_features.items():
+                uniqueness[name] = values[j]
+        statistical = [values[j] for values in statistical_features.values()]
+        sequence = [values[j] if values is not None else None for values in sequence_features.values()]
+        features[i] = list(basic.values()) + list(uniqueness.values()) + statistical + sequence
+
+    return features
+
+
+def get_single_column_features_sketch(v, dtype, error=0.01):
+    # Approximates get_single_column_features for long columns of finite values with the
+    # mergeable sketches of sketches, updated in two passes over chunks of the column, so the
+    # column is never copied or sorted as a whole (e.g. a memory mapped column of a column store).
+    # The median, the median absolute deviation, the distinct count and the sortedness have the
+    # error of the sketches, the rest are exact up to rounding (q25 and q75 are the percentiles
+    # 0.25 and 0.75, which are taken from the smallest 1% of the values), and the lin_space and
+    # log_space features are only computed when the column is sorted
+    vtype = dtype_to_vtype[dtype]
+    n = len(v)
+    k, p = get_sketch_parameters(error)
+
+    def chunks():
+        for start in range(0, n, sketch_chunk_size):
+            chunk = np.asarray(v[start:start + sketch_chunk_size])
+            # The sequence features of datetimes are computed over whole seconds
+            yield start, chunk, np.trunc(chunk) if vtype == TIME else chunk
+
+    basic = get_basic_features(v, dtype, vtype)
+    uniqueness = dict([(f['name'], None) for f in uniqueness_features_list])
+    statistical = dict([(f['name'], None) for f in statistical_features_list])
+    sequence = dict([(f['name'], None) for f in sequence_features_list])
+
+    # First pass, the sketches of the values of quantitative columns or of the sequence values
+    # of datetimes, and of the distinct values of categorical and temporal columns
+    moments = MomentsSketch(10 if vtype == QUANT else 2)
+    quantiles = QuantileSketch(k)
+    smallest = SmallestValuesSketch(int(0.0099 * (n - 1)) + 2)
+    distinct = DistinctCountSketch(p)
+    is_sorted = True
+    last = None
+    for start, chunk, sequence_chunk in chunks():
+        if vtype != CATEG:
+            moments.update(sequence_chunk)
+            quantiles.update(sequence_chunk)
+        if vtype == QUANT:
+            smallest.update(chunk)
+        if vtype != QUANT:
+            distinct.update(chunk)
+        is_sorted = is_sorted and np.all(sequence_chunk[1:] >= sequence_chunk[:-1]) and (last is None or sequence_chunk[0] >= last)
+        last = sequence_chunk[-1]
+
+    # Second pass, the deviations and outliers given the mean and quantiles, the correlation
+    # with the sorted column for the sortedness and the counts of the values for the histogram
+    if vtype == QUANT:
+        mean = moments.mean
+        median = quantiles.quantile(0.5)
+        q1, q25, q75, q99 = smallest.quantile([0.0001, 0.0025, 0.0075, 0.0099], n)
+        std = np.sqrt(moments.moment(2))
+        iqr = q75 - q25
+        outliers = {
+            '15iqr': (q25 - 1.5 * iqr, q75 + 1.5 * iqr),
+            '3iqr': (q25 - 3 * iqr, q75 + 3 * iqr),
+            '1_99': (q1, q99),
+            '3std': (mean - 3 * std, mean + 3 * std)
+        }
+        num_outliers = dict.fromkeys(outliers, 0)
+        abs_dev_sum = 0.0
+        abs_dev_median = QuantileSketch(k)
+    if vtype != CATEG:
+        sorted_values, positions = quantiles.get_sorted_values()
+        cross_sum = 0.0
+    spaces = vtype == QUANT and is_sorted
+    if spaces:
+        differences = MomentsSketch(2)
+        ratios = MomentsSketch(2)
+        previous = np.asarray(v[:0])
+    counts = None
+    if vtype != QUANT and distinct.count() <= max_sketch_histogram_size:
+        counts = pd.Series(dtype=np.float64)
+
+    for start, chunk, sequence_chunk in chunks():
+        if vtype == QUANT:
+            abs_dev_sum += np.absolute(chunk - mean).sum()
+            abs_dev_median.update(np.absolute(chunk - median))
+            for name, (low, high) in outliers.items():
+                num_outliers[name] += np.count_nonzero((chunk < low) | (chunk > high))
+        if spaces:
+            # The differences and ratios of consecutive values, including the last of the previous chunk
+            values = np.concatenate([previous, chunk])
+            with np.errstate(all='ignore'):
+                differences.update(np.diff(values))
+                ratios.update(values[:-1] / values[1:])
+            previous = chunk[-1:]
+        if vtype != CATEG:
+            sorted_chunk = np.interp(np.arange(start, start + len(chunk)), positions, sorted_values)
+            cross_sum += np.sum((sequence_chunk - moments.mean) * (sorted_chunk - moments.mean))
+        if counts is not None:
+            values, chunk_counts = np.unique(chunk, return_counts=True)
+            counts = counts.add(pd.Series(chunk_counts, index=values), fill_value=0)
+            if len(counts) > 2 * max_sketch_histogram_size:
+                # The distinct count was too low
+                counts = None
+
+    if vtype == QUANT:
+        with np.errstate(all='ignore'):
+            var = moments.moment(2)
+            # scipy reports nan skewness and kurtosis for constant data
+            zero_var = var <= (np.finfo(np.float64).resolution * mean) ** 2
+            skewness = np.nan if zero_var else moments.moment(3) / var ** 1.5
+            kurt = np.nan if zero_var else moments.moment(4) / var ** 2
+
+            statistical['mean'] = mean
+            statistical['median'] = median
+            statistical['var'] = var
+            statistical['std'] = std
+            statistical['coeff_var'] = var / mean
+            statistical['min'] = moments.min
+            statistical['max'] = moments.max
+            statistical['range'] = moments.max - moments.min
+            statistical['q25'] = q25
+            statistical['q75'] = q75
+            statistical['med_abs_dev'] = abs_dev_median.quantile(0.5)
+            statistical['avg_abs_dev'] = abs_dev_sum / n
+            statistical['quant_coeff_disp'] = (q75 - q25) / (q75 + q25)
+            statistical['skewness'] = skewness
+            statistical['kurtosis'] = kurt - 3
+            for order in range(5, 11):
+                statistical[f'moment_{order}'] = moments.moment(order)
+            for name, num in num_outliers.items():
+                statistical[f'percent_outliers_{name}'] = num / n
+                statistical[f'has_outliers_{name}'] = num > 0
+
+            if n >= 8:
+                normality_k2 = _skewtest_batch(np.array([skewness]), np.array([n]))[0] ** 2 + _kurtosistest_batch(np.array([kurt]), np.array([n]))[0] ** 2
+                normality_p = np.exp(-normality_k2 / 2)
+                statistical['normality_statistic'] = normality_k2
+                statistical['normality_p'] = normality_p
+                statistical['is_normal_5'] = normality_p < 0.05
+                statistical['is_normal_1'] = normality_p < 0.01
+    elif counts is not None:
+        # The statistical features of categorical variables are computed over the histogram
+        hist = np.sort(counts.to_numpy())
+        num_unique = len(hist)
+        uniqueness['num_unique_elements'] = num_unique
+        uniqueness['unique_percent'] = num_unique / n
+        uniqueness['is_unique'] = num_unique == n
+        hist_statistical = _get_statistical_features_batch(hist[None, :], np.array([num_unique]), np.ones((1, num_unique), dtype=bool), vtype, True)
+        statistical = dict([(name, values[0]) for name, values in hist_statistical.items()])
+    else:
+        estimate = distinct.count()
+        uniqueness['num_unique_elements'] = min(int(round(estimate)), n)
+        uniqueness['unique_percent'] = uniqueness['num_unique_elements'] / n
+        # The estimate can't tell a unique column from a nearly unique one, is_unique is unknown
+        uniqueness['is_unique'] = None
+
+    sequence['is_sorted'] = is_sorted
+    if vtype != CATEG:
+        # The differences of the sorted column are never both positive and negative
+        sequence['is_monotonic'] = True
+        with np.errstate(all='ignore'):
+            constant = moments.min == moments.max
+            if constant:
+                sequence['sortedness'] = np.nan
+            elif is_sorted:
+                sequence['sortedness'] = 1.0
+            else:
+                sequence['sortedness'] = np.absolute(np.clip(cross_sum / moments.sums[2], -1, 1))
+    if spaces:
+        with np.errstate(all='ignore'):
+            sequence['lin_space_sequence_coeff'] = np.sqrt(differences.moment(2)) / differences.mean
+            sequence['log_space_sequence_coeff'] = np.sqrt(ratios.moment(2)) / ratios.mean
+        sequence['is_lin_space'] = sequence['lin_space_sequence_coeff'] <= 0.001
+        sequence['is_log_space'] = sequence['log_space_sequence_coeff'] <= 0.001
+
+    return list(basic.values()) + list(uniqueness.values()) + list(statistical.values()) + list(sequence.values())
+
+
+def _pad_columns(columns):
+    n = np.array([len(c) for c in columns])
+    mask = np.arange(n.max()) < n[:, None]
+    # Padding with inf keeps it at the end of every row after sorting
+    v = np.full(mask.shape, np.inf)
+    v[mask] = np.concatenate(columns)
+    return v, n, mask
+
+
+def _sorted_percentile(sorted_v, n, q):
+    # Same as np.percentile with linear interpolation, over rows of different length
+    rows = np.arange(len(n))
+    position = (q / 100) * (n - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, n - 1)
+    fraction = position - lower
+    lower_v = sorted_v[rows, lower]
+    upper_v = sorted_v[rows, upper]
+    return lower_v + (upper_v - lower_v) * fraction
+
+
+def _sorted_histograms(sorted_v, mask):
+    # Counts of each unique element per row, taken from the runs of the sorted rows
+    rows = np.nonzero(mask)[0]
+    values = sorted_v[mask]
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (values[1:] != values[:-1]) | (rows[1:] != rows[:-1])
+    starts = np.nonzero(starts)[0]
+    counts = np.diff(np.append(starts, len(values)))
+    num_unique = np.bincount(rows[starts], minlength=len(mask))
+    hist_mask = np.arange(num_unique.max()) < num_unique[:, None]
+    hist = np.full(hist_mask.shape, np.inf)
+    hist[hist_mask] = counts
+    return np.sort(hist, axis=1), num_unique
+
+
+def _get_statistical_features_batch(sorted_v, n, mask, var_type, integer):
+    r = dict([(f['name'], None) for f in statistical_features_list])
+    k = len(n)
+    rows = np.arange(k)
+    v = np.where(mask, sorted_v, 0)
+
+    with np.errstate(all='ignore'):
+        sample_mean = v.sum(axis=1) / n
+        sample_median = _sorted_percentile(sorted_v, n, 50)
+        sample_min = sorted_v[rows, 0]
+        sample_max = sorted_v[rows, n - 1]
+        if integer:
+            sample_min = sample_min.astype(np.int64)
+            sample_max = sample_max.astype(np.int64)
+        q1, q25, q75, q99 = [_sorted_percentile(sorted_v, n, q) for q in (0.01, 0.25, 0.75, 0.99)]
+        iqr = q75 - q25
+
+        # Central moments 2 to 10 from a single set of centered powers
+        centered = np.where(mask, v - sample_mean[:, None], 0)
+        power = centered.copy()
+        moments = {}
+        for order in range(2, 11):
+            power *= centered
+            moments[order] = power.sum(axis=1) / n
+        del power
+
+        sample_var = moments[2]
+        sample_std = np.sqrt(sample_var)
+        # scipy reports nan skewness and kurtosis for constant data
+        zero_var = sample_var <= (np.finfo(np.float64).resolution * sample_mean) ** 2
+        skewness = np.where(zero_var, np.nan, moments[3] / sample_var ** 1.5)
+        kurt = np.where(zero_var, np.nan, moments[4] / sample_var ** 2)
+
+        r['mean'] = sample_mean
+        r['median'] = sample_median
+        r['var'] = sample_var
+        r['std'] = sample_std
+        r['min'] = sample_min
+        r['max'] = sample_max
+        r['range'] = sample_max - sample_min
+
+        if var_type in (CATEG, TIME):
+            p = v / v.sum(axis=1)[:, None]
+            r['entropy'] = -np.sum(np.where(mask, p * np.log(np.where(mask, p, 1)), 0), axis=1)
+
+        r['q25'] = q25
+        r['q75'] = q75
+        abs_dev_median = np.where(mask, np.absolute(v - sample_median[:, None]), np.inf)
+        r['med_abs_dev'] = _sorted_percentile(np.sort(abs_dev_median, axis=1), n, 50)
+        r['avg_abs_dev'] = np.absolute(centered).sum(axis=1) / n
+        r['quant_coeff_disp'] = (q75 - q25) / (q75 + q25)
+        r['coeff_var'] = sample_var / sample_mean
+        r['skewness'] = skewness
+        r['kurtosis'] = kurt - 3
+        for order in range(5, 11):
+            r[f'moment_{order}'] = moments[order]
+
+        # Outliers
+        outliers = {
+            '15iqr': (q25 - 1.5 * iqr, q75 + 1.5 * iqr),
+            '3iqr': (q25 - 3 * iqr, q75 + 3 * iqr),
+            '1_99': (q1, q99),
+            '3std': (sample_mean - 3 * sample_std, sample_mean + 3 * sample_std)
+        }
+        for name, (low, high) in outliers.items():
+            num_outliers = np.sum(mask & ((sorted_v < low[:, None]) | (sorted_v > high[:, None])), axis=1)
+            r[f'percent_outliers_{name}'] = num_outliers / n
+            r[f'has_outliers_{name}'] = num_outliers > 0
+
+        # Statistical Distribution, D'Agostino and Pearson's test as in scipy.stats.normaltest
+        normality_k2 = _skewtest_batch(skewness, n) ** 2 + _kurtosistest_batch(kurt, n) ** 2
+        normality_p = np.exp(-normality_k2 / 2) # Survival function of chi2 with 2 degrees of freedom
+        testable = n >= 8
+        r['normality_statistic'] = np.where(testable, normality_k2, None)
+        r['normality_p'] = np.where(testable, normality_p, None)
+        r['is_normal_5'] = np.where(testable, normality_p < 0.05, None)
+        r['is_normal_1'] = np.where(testable, normality_p < 0.01, None)
+
+    for name, values in r.items():
+        if values is None:
+            r[name] = [None] * k
+    return r
+
+
+def _skewtest_batch(skewness, n):
+    n = n.astype(np.float64)
+    y = skewness * np.sqrt(((n + 1) * (n + 3)) / (6.0 * (n - 2)))
+    beta2 = (3.0 * (n**2 + 27*n - 70) * (n+1) * (n+3) /
+             ((n-2.0) * (n+5) * (n+7) * (n+9)))
+    W2 = -1 + np.sqrt(2 * (beta2 - 1))
+    delta = 1 / np.sqrt(0.5 * np.log(W2))
+    alpha = np.sqrt(2.0 / (W2 - 1))
+    y = np.where(y == 0, 1, y)
+    return delta * np.log(y / alpha + np.sqrt((y / alpha)**2 + 1))
+
+
+def _kurtosistest_batch(kurt, n):
+    n = n.astype(np.float64)
+    E = 3.0*(n-1) / (n+1)
+    varb2 = 24.0*n*(n-2)*(n-3) / ((n+1)*(n+1.)*(n+3)*(n+5))
+    x = (kurt-E) / np.sqrt(varb2)
+    sqrtbeta1 = 6.0*(n*n-5*n+2)/((n+7)*(n+9)) * np.sqrt((6.0*(n+3)*(n+5)) /
+                                                        (n*(n-2)*(n-3)))
+    A = 6.0 + 8.0/sqrtbeta1 * (2.0/sqrtbeta1 + np.sqrt(1+4.0/(sqrtbeta1**2)))
+    term1 = 1 - 2/(9.0*A)
+    denom = 1 + x*np.sqrt(2/(A-4.0))
+    term2 = np.sign(denom) * np.where(denom == 0.0, np.nan,
+                                      np.power((1-2.0/A)/np.abs(denom), 1/3.0))
+    return (term1 - term2) / np.sqrt(2/(9.0*A))
+
+
+def _get_sequence_features_batch(v, sorted_v, n, mask, vtype):
+    r = dict([(f['name'], None) for f in sequence_features_list])
+    pairs_mask = mask[:, 1:]
+
+    with np.errstate(all='ignore'):
+        r['is_sorted'] = np.all(~mask | (sorted_v == v), axis=1)
+
+        if vtype in ['t', 'q']:
+            subtraction = np.trunc(sorted_v[:, :-1] - sorted_v[:, 1:])
+            r['is_monotonic'] = np.all(~pairs_mask | (subtraction <= 0), axis=1) | np.all(~pairs_mask | (subtraction >= 0), axis=1)
+            # Both rows have the same mean and variance since one is a permutation of the other
+            mean = np.where(mask, v, 0).sum(axis=1) / n
+            v_centered = np.where(mask, v - mean[:, None], 0)
+            sorted_centered = np.where(mask, sorted_v - mean[:, None], 0)
+            sum_squares = np.sum(v_centered * v_centered, axis=1)
+            constant = np.all(~mask | (v == v[:, :1]), axis=1)
+            correlation = np.clip(np.sum(v_centered * sorted_centered, axis=1) / sum_squares, -1, 1)
+            r['sortedness'] = np.absolute(np.where(constant, np.nan, correlation))
+
+        if vtype == 'q':
+            m = n - 1
+            division = np.where(pairs_mask, sorted_v[:, :-1] / sorted_v[:, 1:], 0)
+            subtraction = np.where(pairs_mask, sorted_v[:, 1:] - sorted_v[:, :-1], 0)
+            r['lin_space_sequence_coeff'] = _masked_std(subtraction, pairs_mask, m) / (subtraction.sum(axis=1) / m)
+            r['log_space_sequence_coeff'] = _masked_std(division, pairs_mask, m) / (division.sum(axis=1) / m)
+            r['is_lin_space'] = r['lin_space_sequence_coeff'] <= 0.001
+            r['is_log_space'] = r['log_space_sequence_coeff'] <= 0.001
+    return r
+
+
+def _masked_std(v, mask, n):
+    mean = v.sum(axis=1) / n
+    centered = np.where(mask, v - mean[:, None], 0)
+    return np.sqrt(np.sum(centered * centered, axis=1) / n)
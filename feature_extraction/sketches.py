@@ -0,0 +1,224 @@
+import numpy as np
+from math import comb, ceil, log2
+
+# Mergeable sketches of the values of a column, used to approximate the single column features
+# of long columns from chunks of the column. Two sketches of chunks of the same column can be
+# merged into the sketch of both chunks, so a column is never needed as a whole.
+
+
+def get_sketch_parameters(error):
+    # Size k of the quantile sketch and precision p of the distinct count sketch for a relative
+    # error of about error in the ranks of the quantiles and in the distinct count
+    k = max(ceil(1.65 / error), 8)
+    p = min(max(ceil(log2((1.04 / error) ** 2)), 4), 18)
+    return k, p
+
+
+class MomentsSketch:
+    # Count, mean, min, max and the sums of the powers of the deviations from the mean up to
+    # max_order. The sums of two chunks are merged with the formulas of Pébay (2008), which are
+    # stable for data far from 0 unlike the sums of the powers of the values
+
+    def __init__(self, max_order=10):
+        self.max_order = max_order
+        self.n = 0
+        self.mean = 0.0
+        self.sums = np.zeros(max_order + 1)
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        if not len(values):
+            return
+        chunk = MomentsSketch(self.max_order)
+        chunk.n = len(values)
+        chunk.mean = np.mean(values)
+        chunk.min = np.min(values)
+        chunk.max = np.max(values)
+        centered = values - chunk.mean
+        power = centered * centered
+        for order in range(2, self.max_order + 1):
+            chunk.sums[order] = power.sum()
+            power *= centered
+        self.merge(chunk)
+
+    def merge(self, other):
+        if not other.n:
+            return
+        if not self.n:
+            self.n, self.mean, self.sums, self.min, self.max = other.n, other.mean, other.sums.copy(), other.min, other.max
+            return
+
+        n_a, n_b = self.n, other.n
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        sums = np.zeros_like(self.sums)
+        for order in range(2, self.max_order + 1):
+            s = self.sums[order] + other.sums[order]
+            for k in range(1, order - 1):
+                s += comb(order, k) * delta ** k * ((-n_b / n) ** k * self.sums[order - k] + (n_a / n) ** k * other.sums[order - k])
+            s += (n_a * n_b * delta / n) ** order * (1 / n_b ** (order - 1) - (-1 / n_a) ** (order - 1))
+            sums[order] = s
+
+        self.n = n
+        self.mean = self.mean + delta * n_b / n
+        self.sums = sums
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def moment(self, order):
+        # Central moment like scipy.stats.moment
+        return self.sums[order] / self.n
+
+
+class QuantileSketch:
+    # KLL sketch (Karnin, Lang and Liberty, 2016). The values are kept in levels, a value of the
+    # level h stands for 2^h values of the column. When a level is full it's sorted and half of
+    # its values, the odd or the even ones, are moved to the next level. The rank error is about
+    # 1.65 / k of the number of values
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        # Seeded so the same column always gets the same quantiles
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        self._compress()
+
+    def merge(self, other):
+        self.n += other.n
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                values = np.sort(values)
+                # An odd value stays in the level
+                kept = values[:len(values) % 2]
+                values = values[len(values) % 2:]
+                promoted = values[self.rng.integers(2)::2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # The capacities change when a level is added, so start again
+                level = 0
+            else:
+                level += 1
+
+    def get_sorted_values(self):
+        # Returns the values of the sketch sorted and the position in the column of each one,
+        # the middle of the positions it stands for
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2 ** level) for level, values in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        weights = weights[order]
+        return values, np.cumsum(weights) - (weights + 1) / 2
+
+    def quantile(self, q):
+        # Like np.quantile with linear interpolation, which it equals while no level is full
+        values, positions = self.get_sorted_values()
+        return np.interp(np.asarray(q) * (self.n - 1), positions, values)
+
+
+class SmallestValuesSketch:
+    # The m smallest values of the column, for the exact quantiles below m / n. The values are
+    # buffered and reduced to the m smallest when the buffer doubles, so the cost is linear
+
+    def __init__(self, m):
+        self.m = m
+        self.values = np.empty(0)
+        self.buffer = []
+        self.buffered = 0
+
+    def update(self, values):
+        self.buffer.append(np.asarray(values, dtype=np.float64))
+        self.buffered += len(values)
+        if self.buffered > 2 * self.m:
+            self._reduce()
+
+    def merge(self, other):
+        other._reduce()
+        self.update(other.values)
+
+    def _reduce(self):
+        values = np.concatenate([self.values] + self.buffer)
+        if len(values) > self.m:
+            values = np.partition(values, self.m - 1)[:self.m]
+        self.values = np.sort(values)
+        self.buffer = []
+        self.buffered = 0
+
+    def quantile(self, q, n):
+        # Like np.quantile with linear interpolation over the n values of the column, for q
+        # such that q * (n - 1) + 1 < m
+        self._reduce()
+        position = np.asarray(q) * (n - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, n - 1)
+        return self.values[lower] + (self.values[upper] - self.values[lower]) * (position - lower)
+
+
+class DistinctCountSketch:
+    # HyperLogLog (Flajolet et al., 2007) with 2^p registers, the relative error of the count is
+    # about 1.04 / sqrt(2^p)
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    @property
+    def error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, values):
+        if not len(values):
+            return
+        h = _hash64(values)
+        index = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        # Position of the first 1 bit after the index bits, the guard bit bounds it
+        rest = (h << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        rank = (64 - np.floor(np.log2(rest.astype(np.float64)))).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting for small counts
+            estimate = m * np.log(m / zeros)
+        return estimate
+
+
+def _hash64(values):
+    # splitmix64 of the bits of the values, -0.0 is hashed like 0.0
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer) or values.dtype == bool:
+        x = values.astype(np.int64).view(np.uint64)
+    else:
+        x = (values.astype(np.float64) + 0.0).view(np.uint64)
+    with np.errstate(over='ignore'):
+        z = x + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
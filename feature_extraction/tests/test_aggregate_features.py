@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from aggregate_features import aggregate_chunk_features, get_aggregated_features_header, get_tables_starts
+from constants import FID
+
+feature_list = [{'name': 'length', 'type': 'numeric'}, {'name': 'is_sorted', 'type': 'boolean'}, {'name': 'mean', 'type': 'numeric'}]
+header = get_aggregated_features_header(feature_list)
+
+
+def aggregate(chunk):
+    return aggregate_chunk_features(chunk, get_tables_starts(chunk), feature_list, header)
+
+
+def test_integer_aggregations_are_written_as_integers():
+    chunk = pd.DataFrame({FID: ['a', 'a', 'b'], 'length': [12, 24, 36], 'is_sorted': [True, True, False], 'mean': [1.0, 2.0, 3.0]})
+    rows = aggregate(chunk).to_csv(index=False).splitlines()[1:]
+    values = dict(zip(header, rows[0].split(',')))
+    assert (values['length-min'], values['length-max'], values['length-range']) == ('12', '24', '12')
+    assert values['is_sorted-num'] == '2'
+    assert values['mean-min'] == '1.0'
+
+
+def test_counts_of_boolean_features_with_missing_values_are_integers():
+    chunk = pd.DataFrame({FID: ['a', 'a', 'a'], 'length': [12, np.nan, 6], 'is_sorted': [True, np.nan, True], 'mean': [1.0, 2.0, 3.0]})
+    df = aggregate(chunk)
+    assert df['is_sorted-num'].dtype == np.int64
+    assert df['is_sorted-num'].tolist() == [2]
+    # The other aggregations of features with missing values stay floats
+    assert df['length-max'].dtype == float
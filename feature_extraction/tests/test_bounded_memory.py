@@ -0,0 +1,42 @@
+import argparse
+import numpy as np
+import pytest
+from bounded_memory import bound_column, bound_table, parse_max_column_length, parse_max_table_size
+from column_records import ColumnRecord, dtype_codes
+from data_types import DFLOAT
+from extract_features import extract_records_single_column_features
+
+
+def float_column(data):
+    return ColumnRecord('t:0', 'c', 'scatter', 0, dtype_codes[DFLOAT], np.asarray(data, dtype=float))
+
+
+def test_sampled_column_keeps_its_length():
+    column = float_column(np.arange(1000))
+    df = extract_records_single_column_features([column], max_column_length=100)
+    assert df['approximated'].tolist() == [True]
+    assert df['length'].tolist() == [1000]
+
+
+def test_short_column_is_not_sampled():
+    column = float_column(np.arange(50))
+    df = extract_records_single_column_features([column], max_column_length=100)
+    assert df['approximated'].tolist() == [False]
+    assert df['length'].tolist() == [50]
+
+
+def test_sample_has_at_least_two_rows():
+    data = np.arange(10.0)
+    sample, sampled = bound_column(data, 1)
+    assert sampled and len(sample) == 2
+    columns = [float_column(np.arange(1000)), float_column(np.arange(1000))]
+    sampled_columns, sampled = bound_table(columns, max_table_size=8)
+    assert sampled and [len(column.data) for column in sampled_columns] == [2, 2]
+
+
+def test_max_column_length_below_two_is_rejected():
+    assert parse_max_column_length('2') == 2
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_max_column_length('1')
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_max_table_size('0')
@@ -0,0 +1,30 @@
+import json
+from checkpoint import Checkpoint, get_checkpoint_file_name, remove_checkpoint
+
+
+def test_new_run_replaces_finished_manifest(tmp_path):
+    output_file_name = str(tmp_path / 'features.csv')
+    checkpoint = Checkpoint(output_file_name)
+    checkpoint.save(3, 100, 10, {})
+    checkpoint.finish()
+
+    assert not Checkpoint(output_file_name).finished
+    with open(get_checkpoint_file_name(output_file_name), 'r') as f:
+        manifest = json.load(f)
+    assert not manifest['finished'] and manifest['input_rows'] == 0
+    assert not Checkpoint(output_file_name, resume=True).finished
+
+
+def test_resume_reads_manifest(tmp_path):
+    output_file_name = str(tmp_path / 'features.csv')
+    Checkpoint(output_file_name).save(3, 100, 10, {})
+    checkpoint = Checkpoint(output_file_name, resume=True)
+    assert checkpoint.resumed and checkpoint.chunk == 3 and checkpoint.input_rows == 100
+
+
+def test_remove_checkpoint(tmp_path):
+    output_file_name = str(tmp_path / 'features.csv')
+    Checkpoint(output_file_name).finish()
+    remove_checkpoint(output_file_name)
+    remove_checkpoint(output_file_name)
+    assert not (tmp_path / 'features.csv.checkpoint.json').exists()
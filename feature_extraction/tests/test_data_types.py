@@ -0,0 +1,40 @@
+import json
+import math
+import os
+import random
+import numpy as np
+from data_types import detect_dtype, cast_dtype, to_datetime, get_timestamps
+import pandas as pd
+
+# The golden corpus has the dtypes and the casted values of the original implementation of
+# detect_dtype and cast_dtype, before the formats of the dates were guessed once per column and
+# the timestamps and the bag of words were computed over arrays. The columns of a table share
+# their bag of words
+with open(os.path.join(os.path.dirname(__file__), 'data', 'data_types_golden.json'), 'r') as f:
+    golden = json.load(f)
+
+
+def cast_table(table):
+    bag = dict()
+    casted = {}
+    for name, column in golden[table].items():
+        random.seed(name)
+        dtype = detect_dtype(column['elements'])
+        values, true_dtype = cast_dtype(column['elements'], dtype, bag)
+        values = [None if isinstance(v, float) and math.isnan(v) else v for v in np.asarray(values, dtype=object).tolist()]
+        casted[name] = {'elements': column['elements'], 'dtype': dtype, 'true_dtype': true_dtype, 'values': values}
+    return casted
+
+
+def test_golden_corpus():
+    for table in golden:
+        casted = cast_table(table)
+        for name, column in golden[table].items():
+            assert casted[name] == column, f'{table}.{name}'
+
+
+def test_timestamps_same_as_timestamp():
+    dates = pd.Series(['2020-01-01 00:00:00.123456789', '1677-09-22', '2262-04-11', '1970-01-01 00:00:00.5', None])
+    datetimes = to_datetime(dates, utc=True)
+    expected = [e.timestamp() if e is not pd.NaT else np.nan for e in datetimes]
+    assert np.array_equal(get_timestamps(datetimes), expected, equal_nan=True)
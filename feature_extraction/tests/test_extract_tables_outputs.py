@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from column_records import ColumnRecord, XSRC, YSRC
+from extract_tables_outputs import new_table_info, add_table_column
+
+
+def column(data, flags=YSRC):
+    return ColumnRecord('t:0', 'c', 'scatter', flags, 0, data)
+
+
+def test_column_with_array_data():
+    table_info = new_table_info(column('[1, 2, 3]'))
+    assert add_table_column(table_info, column('[1, 2, 3]', XSRC))
+    assert add_table_column(table_info, column(np.array([4, 5, 6])))
+    assert not add_table_column(table_info, column('[1, 2]'))
+
+
+@pytest.mark.parametrize('data', [np.nan, 5, '5', 'not json', '[1]'])
+def test_column_without_array_data_excludes_table(data):
+    table_info = new_table_info(column(data))
+    assert not add_table_column(table_info, column(data))
@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import Future
+from extract_columns import HEADER
+from feature_service import FeatureService, create_server, open_connection, request_metrics, get_table_columns
+from constants import FID
+
+
+def test_unix_server_removes_its_socket(tmp_path):
+    socket_path = str(tmp_path / 'service.sock')
+    service = FeatureService(batch_size=4)
+    server = create_server(service, socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert request_metrics(open_connection(socket_path=socket_path))['requests'] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+    assert not os.path.exists(socket_path)
+
+
+def test_table_error_only_fails_its_request():
+    service = FeatureService(batch_size=4)
+    extract_features = service._extract_features
+
+    def fail_table_1(chunk, cache=None):
+        if '1' in set(chunk[FID]):
+            raise ValueError('table 1')
+        return extract_features(chunk, cache)
+
+    service._extract_features = fail_table_1
+    tables = [{'a': [1, 2, 3], 'b': [2.5, 1.0, 0.5]}, {'a': [3, 2, 1], 'b': [1.5, 2.0, 0.5]}, {'c': ['x', 'y', 'x']}]
+    batch = [(time.perf_counter(), f'table {j}', table, Future()) for j, table in enumerate(tables)]
+    try:
+        service._extract_batch(batch)
+        vector, _ = extract_features(pd.DataFrame(get_table_columns('0', tables[0]), columns=HEADER))['0']
+    finally:
+        service.close()
+    futures = [future for _, _, _, future in batch]
+    assert isinstance(futures[1].exception(), ValueError)
+    assert futures[0].result()['fid'] == 'table 0'
+    assert futures[2].result()['fid'] == 'table 2'
+    features = [np.nan if value is None else value for value in futures[0].result()['features'].values()]
+    assert np.allclose(features, vector, equal_nan=True)
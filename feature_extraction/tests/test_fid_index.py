@@ -0,0 +1,54 @@
+from checkpoint import Checkpoint
+from column_store import open_columns
+from fid_index import build_fid_index, read_tables
+from utils import load_raw_data
+
+lines = ['a\ta:0\t[1]', 'a\ta:1\t[2]', 'b\tb:0\t[3]\textra\tfields', '', 'b\tb:1\t[4]', 'c\tc:0\t[5]', 'c\tc:1\t[6]\textra', 'd\td:0\t[7]']
+
+
+def write_columns(path, lines):
+    with open(path, 'w') as f:
+        f.write('fid\tfield_id\tdata\n')
+        for line in lines:
+            f.write(line + '\n')
+
+
+def read_index(file_name, fids=None, shard=None):
+    with open_columns(file_name, chunk_size=500, fids=fids, shard=shard) as chunks:
+        return dict([(field_id, row) for chunk in chunks for field_id, row in zip(chunk['field_id'], chunk.index)])
+
+
+def test_read_tables_index_same_as_load_raw_data(tmp_path):
+    file_name = str(tmp_path / 'columns.tsv')
+    write_columns(file_name, lines)
+    with open(file_name, 'r') as f:
+        expected = dict([(field_id, row) for chunk in load_raw_data(f) for field_id, row in zip(chunk['field_id'], chunk.index)])
+    assert expected == {'a:0': 0, 'a:1': 1, 'b:1': 2, 'c:0': 3, 'd:0': 4}
+
+    build_fid_index(file_name)
+    assert read_index(file_name, ['a', 'b', 'c', 'd']) == expected
+    chunks = list(read_tables(file_name, ['b', 'c'], chunk_size=10))
+    assert len(chunks) == 1
+    assert chunks[0].index.tolist() == [2, 3]
+    assert chunks[0]['field_id'].tolist() == ['b:1', 'c:0']
+
+
+def test_read_tables_index_of_shard(tmp_path):
+    file_name = str(tmp_path / 'columns.tsv')
+    write_columns(file_name, lines)
+    without_index = [read_index(file_name, ['a', 'b', 'c', 'd'], (i, 2)) for i in range(2)]
+    build_fid_index(file_name)
+    assert [read_index(file_name, ['a', 'b', 'c', 'd'], (i, 2)) for i in range(2)] == without_index
+
+
+def test_skip_chunks_without_rows(tmp_path):
+    file_name = str(tmp_path / 'columns.tsv')
+    write_columns(file_name, ['a\ta:0\t[1]', 'b\tb:0\t[3]\textra\tfields', 'c\tc:0\t[5]'])
+    build_fid_index(file_name)
+
+    chunks = list(read_tables(file_name, ['a', 'c'], chunk_size=1))
+    assert [chunk.index.tolist() for chunk in chunks] == [[0], [1]]
+    empty = chunks[0].iloc[:0]
+    checkpoint = Checkpoint(str(tmp_path / 'clean.tsv'))
+    checkpoint.input_rows = 1
+    assert [(i, chunk.index.tolist()) for i, chunk in checkpoint.skip([chunks[0], empty, chunks[1]])] == [(2, [1])]
@@ -0,0 +1,27 @@
+import argparse
+import random
+import pytest
+from generate_corpus import generate_column, parse_dtypes_mix, parse_range
+from constants import DBOOL
+
+
+def test_parse_dtypes_mix():
+    assert parse_dtypes_mix('int=3,float=4,bool') == {'int': 3.0, 'float': 4.0, 'bool': 1.0}
+    for value in ['integer=3', 'int=3,date=1', 'int=-1', 'int=0']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_dtypes_mix(value)
+
+
+def test_parse_range():
+    assert parse_range('2:6') == (2, 6)
+    assert parse_range('10') == (10, 10)
+    for value in ['0:10', '5:2', '-1:3']:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_range(value)
+
+
+def test_generate_column_unknown_dtype():
+    rng = random.Random(0)
+    assert all(isinstance(e, bool) for e in generate_column(rng, DBOOL, 10, 0))
+    with pytest.raises(ValueError):
+        generate_column(rng, 'integer', 10, 0)
@@ -0,0 +1,80 @@
+import json
+import random
+import pytest
+from json_columns import iter_table_columns
+
+
+def expected_columns(table_data):
+    return list(json.loads(table_data).popitem()[1]['cols'].values())
+
+
+def assert_same_as_json_loads(table_data):
+    try:
+        expected = expected_columns(table_data)
+    except Exception as e:
+        with pytest.raises(type(e)):
+            list(iter_table_columns(table_data))
+        return
+    assert list(iter_table_columns(table_data)) == expected
+
+
+def table(cols, other='{}'):
+    return json.dumps({'user:1': {'cols': cols, 'layout': json.loads(other)}})
+
+
+@pytest.mark.parametrize('table_data', [
+    table({'x': {'data': [1, 2, 3], 'uid': 'a'}, 'y': {'data': [4.5, None, -1e10], 'uid': 'b'}}),
+    table({'x': {'data': ['[', ']', '{', '}'], 'uid': 'a'}, 'y': {'data': ['"quoted"', 'a\\"b', '\\\\', 'é漢'], 'uid': 'b'}}),
+    table({'x': {'data': [[1, [2]], {'a': [3]}], 'uid': '}]'}}),
+    table({'x': {'data': [True, False, None], 'uid': 'a'}}),
+    table({}),
+    '{"user:1": {"cols": {"x": {"data": [1]}, "x": {"data": [2]}}}}',
+    '{"user:0": {"cols": {"x": {"data": [0]}}}, "user:1": {"cols": {"y": {"data": [1]}}}}',
+    '{"user:1": {"cols": {"x": {"data": [1]}}, "cols": {"y": {"data": [2]}}}}',
+    '{ "user:1" :\n\t{\n  "cols" : { "x" : { "data" : [ 1 , 2 ] } ,\r\n "y" : {"data":[3,4]} } } }',
+    json.dumps({'user:1': {'cols': {'x': {'data': [1, 2]}, 'y': {'data': ['a', 'b']}}}}, indent=4),
+])
+def test_same_as_json_loads(table_data):
+    assert_same_as_json_loads(table_data)
+
+
+@pytest.mark.parametrize('table_data', [
+    '',
+    '[]',
+    '{}',
+    '{"user:1": []}',
+    '{"user:1": {"layout": {}}}',
+    '{"user:1": {"cols": {"x": {"data": [1, 2}}}}',
+    '{"user:1": {"cols": {"x": {"data": [1, 2]}}',
+    '{"user:1": {"cols": {"x": {"data": [1, 2]}}}} extra',
+    '{"user:1": {"cols": {"x": {"data": [1, 2,]}}}}',
+    '{"user:1": {"cols": {"x": {"data": [NaN, 1]}}}}',
+    '{"user:1": {"cols": {"x": {"data": [1 2]}}}}',
+    '{"user:1": {"cols": {"x": {"data": "unterminated}}}}',
+    "{'user:1': {'cols': {}}}",
+])
+def test_malformed_input_raises_like_json_loads(table_data):
+    assert_same_as_json_loads(table_data)
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(7 if depth < 3 else 4)
+    if kind == 0:
+        return rng.choice([None, True, False])
+    if kind == 1:
+        return rng.choice([0, -7, 3.25, 1e-300, 2 ** 70])
+    if kind in (2, 3):
+        return ''.join(rng.choice(['a', '"', '\\', '[', ']', '{', '}', ',', ':', ' ', '\n', 'é']) for _ in range(rng.randrange(6)))
+    if kind in (4, 5):
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return dict([(random_value(rng, 3) if rng.random() < 0.5 else 'data', random_value(rng, depth + 1)) for _ in range(rng.randrange(4))])
+
+
+def test_random_documents_same_as_json_loads():
+    rng = random.Random(0)
+    for _ in range(500):
+        cols = dict([(f'col{j}', {'data': random_value(rng, 1), 'uid': random_value(rng, 3)}) for j in range(rng.randrange(5))])
+        document = {'user:1': {'cols': cols, 'layout': random_value(rng)}}
+        indent = rng.choice([None, 0, 2, '\t'])
+        separators = rng.choice([None, (',', ':'), (' , ', ' : ')])
+        assert_same_as_json_loads(json.dumps(document, indent=indent, separators=separators, ensure_ascii=rng.random() < 0.5))
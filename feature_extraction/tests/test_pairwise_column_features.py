@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2_contingency, f_oneway
+from pairwise_column_features import ColumnProfile, get_contingency_table, get_nestedness, get_one_way_anova, get_statistical_pairwise_features
+from data_types import DSTRING, DFLOAT
+
+# The string columns are codes of the bag of words of their table, fill_dtype can leave NaN in them
+a_data = np.array([0, 1, 0, 1, np.nan, 0, 1, 1, 0, 0])
+b_data = np.array([2, 2, 3, 3, 3, 2, np.nan, 3, 2, 3])
+
+
+def test_contingency_table_leaves_nan_out():
+    ct = get_contingency_table(ColumnProfile(a_data, DSTRING), ColumnProfile(b_data, DSTRING))
+    expected = pd.crosstab(a_data, b_data).to_numpy()
+    assert np.array_equal(ct, expected)
+
+
+def test_contingency_table_leaves_values_only_with_nan_out():
+    a = np.array([0, 1, 2, 0, 1])
+    b = np.array([5, 6, np.nan, 6, 5])
+    ct = get_contingency_table(ColumnProfile(a, DSTRING), ColumnProfile(b, DSTRING))
+    assert np.array_equal(ct, pd.crosstab(a, b).to_numpy())
+
+
+def test_cc_features_with_nan():
+    r = get_statistical_pairwise_features(ColumnProfile(a_data, DSTRING), ColumnProfile(b_data, DSTRING))
+    chi2_statistic, chi2_p, _, _ = chi2_contingency(pd.crosstab(a_data, b_data))
+    assert r['chi2_statistic'] == chi2_statistic == 0.0
+    assert r['chi2_p'] == chi2_p == 1.0
+    assert r['nestedness'] == 0.6
+
+
+def test_nestedness_without_nan():
+    a = np.array([0, 0, 1, 1, 2, 2])
+    b = np.array([5, 5, 6, 6, 6, 7])
+    # The 3 values of b over the 4 pairs, and the 3 values of a over the 4 pairs
+    assert get_nestedness(ColumnProfile(a, DSTRING), ColumnProfile(b, DSTRING)) == 0.75
+
+
+def test_one_way_anova_with_nan():
+    # The NaN group is always empty, with an empty group f_oneway returns NaN
+    q_data = np.arange(1, 11, dtype=float)
+    r = get_statistical_pairwise_features(ColumnProfile(a_data, DSTRING), ColumnProfile(q_data, DFLOAT))
+    assert np.isnan(r['one_way_anova_statistic'])
+    assert np.isnan(r['one_way_anova_p'])
+    assert not r['one_way_anova_significant_005']
+
+
+def test_one_way_anova_without_nan():
+    c_data = np.array([0, 1, 0, 1, 2, 0, 1, 2, 0, 2])
+    q_data = np.array([1.5, 2, 3.5, 4, 2.75, 6, 7, 8.5, 9, 1])
+    statistic, p = get_one_way_anova(ColumnProfile(c_data, DSTRING), q_data)
+    expected = f_oneway(*[q_data[c_data == v] for v in np.unique(c_data)])
+    assert np.isclose(statistic, expected.statistic)
+    assert np.isclose(p, expected.pvalue)
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+import single_column_features
+from single_column_features import get_single_column_features, get_single_column_features_sketch, single_column_features_names, sketch_chunk_size
+from sketches import get_sketch_parameters, MomentsSketch, QuantileSketch, SmallestValuesSketch, DistinctCountSketch
+from data_types import DFLOAT, DSTRING, DDATE
+
+error = 0.01
+n = 3 * sketch_chunk_size + 1000
+rng = np.random.default_rng(0)
+
+# The features the sketches approximate, the rest are exact up to rounding
+approximated = {'median', 'med_abs_dev', 'sortedness', 'num_unique_elements', 'unique_percent'}
+
+
+def get_features(v, dtype):
+    exact = dict(zip(single_column_features_names, get_single_column_features(v, dtype)))
+    sketch = dict(zip(single_column_features_names, get_single_column_features_sketch(v, dtype, error)))
+    return exact, sketch
+
+
+def assert_exact_features(exact, sketch, names):
+    for name in names:
+        if isinstance(exact[name], (bool, np.bool_)) or exact[name] is None:
+            assert sketch[name] == exact[name], name
+        else:
+            assert np.isclose(sketch[name], exact[name], rtol=1e-6, atol=1e-9, equal_nan=True), name
+
+
+def rank(v, value):
+    return np.count_nonzero(v <= value) / len(v)
+
+
+def test_quantitative_column():
+    v = rng.lognormal(3, 1, n)
+    exact, sketch = get_features(v, DFLOAT)
+    # The lin and log space features are only computed for sorted columns
+    spaces = {'lin_space_sequence_coeff', 'log_space_sequence_coeff', 'is_lin_space', 'is_log_space'}
+    assert_exact_features(exact, sketch, [name for name in single_column_features_names if name not in approximated | spaces])
+    assert abs(rank(v, sketch['median']) - 0.5) <= error
+    assert abs(rank(np.absolute(v - exact['median']), sketch['med_abs_dev']) - 0.5) <= 2 * error
+    assert abs(sketch['sortedness'] - exact['sortedness']) <= error
+    assert all(sketch[name] is None for name in spaces)
+
+
+def test_sorted_quantitative_column():
+    v = np.sort(rng.normal(100, 10, n))
+    exact, sketch = get_features(v, DFLOAT)
+    assert sketch['is_sorted'] and sketch['sortedness'] == exact['sortedness'] == 1.0
+    assert_exact_features(exact, sketch, ['lin_space_sequence_coeff', 'log_space_sequence_coeff', 'is_lin_space', 'is_log_space'])
+
+
+def test_nearly_sorted_column():
+    # The sortedness is the correlation with the sorted column, interpolated from the quantiles
+    v = np.linspace(0, 1, n) + rng.normal(0, 0.3, n)
+    exact, sketch = get_features(v, DFLOAT)
+    assert not sketch['is_sorted'] and 0.5 < exact['sortedness'] < 0.9
+    assert abs(sketch['sortedness'] - exact['sortedness']) <= error
+
+
+def test_categorical_column():
+    # Less distinct values than max_sketch_histogram_size, the histogram is exact
+    v = rng.integers(0, 500, n).astype(float)
+    exact, sketch = get_features(v, DSTRING)
+    assert_exact_features(exact, sketch, single_column_features_names)
+
+
+def test_temporal_column():
+    v = np.sort(1.6e9 + 86400 * rng.integers(0, 2000, n)).astype(float)
+    exact, sketch = get_features(v, DDATE)
+    assert_exact_features(exact, sketch, [name for name in single_column_features_names if name not in approximated])
+    assert sketch['num_unique_elements'] == exact['num_unique_elements']
+    assert abs(sketch['sortedness'] - exact['sortedness']) <= error
+
+
+def test_distinct_count_over_histogram_size(monkeypatch):
+    # Over max_sketch_histogram_size distinct values only the distinct count is estimated
+    monkeypatch.setattr(single_column_features, 'max_sketch_histogram_size', 1000)
+    v = rng.integers(0, 50000, n).astype(float)
+    exact, sketch = get_features(v, DSTRING)
+    assert abs(sketch['num_unique_elements'] / exact['num_unique_elements'] - 1) <= 3 * DistinctCountSketch(get_sketch_parameters(error)[1]).error
+    assert sketch['is_unique'] is None
+    assert sketch['mean'] is None and sketch['entropy'] is None
+
+
+def test_nearly_unique_column_is_not_unique():
+    v = np.arange(n, dtype=float)
+    v[:n // 200] = v[n // 200:n // 100]
+    exact, sketch = get_features(v, DSTRING)
+    assert not exact['is_unique']
+    assert sketch['is_unique'] is None
+
+
+def chunks(v, size=10000):
+    return [v[start:start + size] for start in range(0, len(v), size)]
+
+
+def test_moments_merge():
+    v = 1e6 + rng.normal(0, 1, 50000)
+    merged = MomentsSketch()
+    for chunk in chunks(v):
+        sketch = MomentsSketch()
+        sketch.update(chunk)
+        merged.merge(sketch)
+    single = MomentsSketch()
+    single.update(v)
+    assert merged.n == single.n and merged.min == single.min and merged.max == single.max
+    assert np.isclose(merged.mean, single.mean, rtol=1e-12)
+    for order in range(2, 11):
+        assert np.isclose(merged.moment(order), single.moment(order), rtol=1e-6), order
+        assert np.isclose(merged.moment(order), np.mean((v - v.mean()) ** order), rtol=1e-6), order
+
+
+def test_quantile_merge():
+    k, _ = get_sketch_parameters(error)
+    v = rng.normal(0, 1, 100000)
+    merged = QuantileSketch(k)
+    for chunk in chunks(v):
+        sketch = QuantileSketch(k)
+        sketch.update(chunk)
+        merged.merge(sketch)
+    assert merged.n == len(v)
+    for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+        assert abs(rank(v, merged.quantile(q)) - q) <= error, q
+
+
+def test_quantile_exact_while_not_full():
+    v = rng.normal(0, 1, 100)
+    sketch = QuantileSketch(200)
+    sketch.update(v)
+    assert np.allclose(sketch.quantile([0, 0.3, 0.5, 1]), np.quantile(v, [0, 0.3, 0.5, 1]))
+
+
+def test_smallest_values_merge():
+    v = rng.normal(0, 1, 100000)
+    m = int(0.0099 * (len(v) - 1)) + 2
+    merged = SmallestValuesSketch(m)
+    for chunk in chunks(v):
+        sketch = SmallestValuesSketch(m)
+        sketch.update(chunk)
+        merged.merge(sketch)
+    q = [0.0001, 0.0025, 0.0075, 0.0099]
+    assert np.allclose(merged.quantile(q, len(v)), np.quantile(v, q))
+
+
+@pytest.mark.parametrize('distinct', [100, 5000, 200000])
+def test_distinct_count_merge(distinct):
+    _, p = get_sketch_parameters(error)
+    v = rng.integers(0, distinct, 300000).astype(float)
+    merged = DistinctCountSketch(p)
+    for chunk in chunks(v, 50000):
+        sketch = DistinctCountSketch(p)
+        sketch.update(chunk)
+        merged.merge(sketch)
+    single = DistinctCountSketch(p)
+    single.update(v)
+    assert np.array_equal(merged.registers, single.registers)
+    assert abs(merged.count() / len(np.unique(v)) - 1) <= 3 * merged.error
@@ -1,8 +1,6 @@
 import pandas as pd
 import numpy as np
-from time import time, strftime
-from collections import OrderedDict, Counter
-from scipy.stats import entropy
+from collections import deque
 
 def load_raw_data(data_file_stream, chunk_size=500,sep='\t'):
 
@@ -17,6 +15,18 @@ def load_raw_data(data_file_stream, chunk_size=500,sep='\t'):
     return df
 
 
+def imap_bounded(pool, func, iterable, max_pending):
+    # Like pool.imap but without reading the whole iterable ahead, at most max_pending
+    # tasks are queued in the pool and the results are yielded in input order
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
 def get_unique(li, preserve_order=False):
     if preserve_order:
         seen = set()
@@ -33,9 +43,11 @@ def get_list_uniqueness(l):
         return None
 
 def calculate_overlap(a_data, b_data):
-    a_min, a_max = np.min(a_data), np.max(a_data)
+    return calculate_range_overlap(np.min(a_data), np.max(a_data), np.min(b_data), np.max(b_data))
+
+
+def calculate_range_overlap(a_min, a_max, b_min, b_max):
     a_range = a_max - a_min
-    b_min, b_max = np.min(b_data), np.max(b_data)
     b_range = b_max - b_min
     has_overlap = False
     overlap_percent = 0
@@ -0,0 +1,51 @@
+import runpy
+import sys
+
+# Single entry point of the scripts of the feature extraction, `python vizkg.py <command> ...`
+# runs the script of the command with the rest of the arguments. Only the module of the command
+# is imported, when it runs, so the commands don't pay the imports of the others and the help
+# of vizkg imports nothing.
+
+COMMANDS = {
+    'extract-columns' : ('extract_columns', 'Extract the columns of the raw corpus'),
+    'extract-tables-outputs' : ('extract_tables_outputs', 'Extract the outputs of the tables'),
+    'clean-columns' : ('clean_columns', 'Keep the columns of the correct tables'),
+    'extract-features' : ('extract_features', 'Extract the single and pairwise column features'),
+    'aggregate-features' : ('aggregate_features', 'Aggregate the features of the columns of every table'),
+    'pipeline' : ('pipeline', 'Run all the stages in a single pass over the raw corpus'),
+    'fid-index' : ('fid_index', 'Build the fid index of a columns file'),
+    'plan-shards' : ('sharding', 'Split a file sorted by fid in shards that never split a table'),
+    'merge-shards' : ('merge_shards', 'Concatenate the outputs of the shards of a stage'),
+    'serve' : ('feature_service', 'Serve the features of tables over HTTP'),
+    'generate-corpus' : ('generate_corpus', 'Generate a synthetic corpus'),
+    'benchmark' : ('benchmark', 'Time every stage of the pipeline'),
+    'benchmark-service' : ('benchmark_service', 'Measure the latency of the feature service under load'),
+    'benchmark-startup' : ('benchmark_startup', 'Measure the startup time of the commands')
+}
+
+
+def get_usage():
+    usage = ['usage: vizkg.py <command> [arguments]', '', 'commands:']
+    for command, (module, description) in COMMANDS.items():
+        usage.append(f'  {command:<24}{description}')
+    usage.append('')
+    usage.append('Run vizkg.py <command> -h for the arguments of a command.')
+    return '\n'.join(usage)
+
+
+def run_command(command, args):
+    # The module runs as __main__ with the arguments of the command, like the script itself
+    module = COMMANDS[command][0]
+    sys.argv = [module] + args
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] in ('-h', '--help'):
+        print(get_usage())
+        sys.exit(0)
+    if sys.argv[1] not in COMMANDS:
+        print(get_usage(), file=sys.stderr)
+        print(f'\nvizkg.py: unknown command {sys.argv[1]}', file=sys.stderr)
+        sys.exit(2)
+    run_command(sys.argv[1], sys.argv[2:])
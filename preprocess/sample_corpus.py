@@ -1,6 +1,6 @@
 import pandas as pd
 from constants import FID, TRACE_TYPE
-from utils import load_raw_data
+from column_store import open_columns, open_columns_writer, is_column_store
 import argparse
 import random
 
@@ -26,21 +26,13 @@ def sample_tables_by_trace_type(tables_file_name, types, sample_size, seed):
 
 
 def sample_columns_by_fid(tables_sample, columns_file_name, output_file_name):
-    with open(output_file_name, 'w') as f:
-        # Clean the output file in case it exists
-        pass
-
-    with open(columns_file_name, 'r') as f:
-        raw_data = load_raw_data(f)
+    # A column store is sampled into another column store
+    store = is_column_store(columns_file_name)
+    # Only the rows of the sampled tables are read when the columns file has a fid index
+    with open_columns(columns_file_name, fids=tables_sample) as raw_data, open_columns_writer(output_file_name, store) as writer:
         for i, chunk in enumerate(raw_data):
-            columns = []
-            for row in chunk.iterrows():
-                trace = row[1]
-                fid = trace[FID]
-                if fid in tables_sample:
-                    columns.append(trace)
-            df = pd.DataFrame(columns)
-            df.to_csv(output_file_name, mode='a', index=False, header=(i == 0), sep='\t')
+            df = chunk[chunk[FID].isin(tables_sample)]
+            writer.write(df)
 
 
 if __name__ == '__main__':